@@ -47,7 +47,7 @@ def run_pipeline(kwargs, job_id, user_id):
             profile=["iMaps"]
         )
         assign_job_parents(job, execution)
-        create_data_links(execution)
+        create_data_links(execution, job)
         create_samples(execution, user_id)
         
         for process_execution in execution.process_executions.all():
@@ -63,6 +63,37 @@ def run_pipeline(kwargs, job_id, user_id):
 
 
 
+@app.task(name="propagate_collection_privacy")
+def propagate_privacy(collection_id, private):
+    """Gives the contents of a collection its privacy, in celery. The
+    collection counts the tasks queued for it as propagating, and each task
+    uncounts itself once it has finished, so the collection is only shown as
+    up to date once the last of them has.
+
+    Each task applies the collection's privacy as it is when the task runs,
+    rather than the privacy it was queued with, so that tasks which run out
+    of order still leave the contents matching the collection."""
+
+    from django.db import transaction
+    from django.db.models import F
+    from analysis.models import Collection, propagate_collection_privacy
+    from core.responses import responses_changed
+
+    try:
+        with transaction.atomic():
+            private = Collection.objects.select_for_update().filter(
+                id=collection_id
+            ).values_list("private", flat=True).first()
+            if private is not None:
+                propagate_collection_privacy(collection_id, private)
+    finally:
+        Collection.objects.filter(id=collection_id, propagating__gt=0).update(
+            propagating=F("propagating") - 1
+        )
+        responses_changed()
+
+
+
 def assign_job_parents(job, execution):
     """Jobs belong to a sample if all their inputs are from a single sample (or
     no sample), and likewise for collections. This function looks at the inputs
@@ -99,14 +130,19 @@ def assign_job_parents(job, execution):
             job.save()
 
 
-def create_data_links(execution):
+def create_data_links(execution, job):
     """An execution will create various new Data objects, but they also need
-    iMaps DataLink objects accompanying them. This function creates those."""
+    iMaps DataLink objects accompanying them. This function creates those,
+    recording the job that produced them and its sample and collection."""
 
     from django_nextflow.models import Data
-    from analysis.models import DataLink
-    for data in Data.objects.filter(upstream_process_execution__execution=execution):
-        DataLink.objects.create(data=data)
+    from analysis.models import DataLink, invalidate_collection_stats
+    collection_id = job.sample.collection_id if job.sample else None
+    DataLink.objects.bulk_create([DataLink(
+        data=data, job=job, sample_id=job.sample_id,
+        effective_collection_id=collection_id or job.collection_id
+    ) for data in Data.objects.filter(upstream_process_execution__execution=execution)])
+    invalidate_collection_stats([collection_id or job.collection_id])
 
 
 def create_samples(execution, user_id):
@@ -145,7 +181,7 @@ def create_samples(execution, user_id):
             for index, row in df.iterrows():
                 if row["Sample Name"] == sample_name:
                     meta = {key.replace(" (optional)", ""): None if pd.isna(value) else value for key, value in dict(row).items()}
-                    sample.meta = json.dumps(meta)
+                    sample.meta = meta
                     sample.species = Species.objects.filter(id=meta.get("Species")).first()
                     sample.method = meta.get("Method")
                     sample.source = meta.get("Cell or Tissue")
@@ -1,26 +1,44 @@
+from django.conf import settings
 from django.db import transaction
+from django.db.models import F
 from django.forms import ModelForm, BooleanField
 from analysis.models import Collection, Paper, Sample, Data
+from analysis.models import propagate_collection_privacy, propagate_sample_privacy
 
 class CollectionForm(ModelForm):
     """Creates or edits a collection."""
 
     class Meta:
         model = Collection
-        exclude = ["id", "users", "groups", "created", "modified"]
+        exclude = ["id", "users", "groups", "created", "modified", "propagating", "stats_version"]
     
+    def __init__(self, *args, permission_cache=None, **kwargs):
+        ModelForm.__init__(self, *args, **kwargs)
+        self.permission_cache = permission_cache
+    
+
     def save(self, *args, **kwargs):
+        """Saves the collection, giving its contents the same privacy if that
+        has changed. Collections with more samples than the configured
+        threshold have this done by a celery task, and count as propagating
+        until it finishes."""
+
+        from analysis.celery import propagate_privacy
+        propagate = self.instance.id and self.initial["private"] != self.instance.private
+        threshold = settings.PRIVACY_PROPAGATION_TASK_THRESHOLD
         with transaction.atomic():
-            for sample in self.instance.samples.all():
-                sample.private = self.instance.private
-                for job in sample.jobs.all():
-                    job.private = self.instance.private
-                    job.save()
-                sample.save()
-            '''for execution in self.instance.executions.all():
-                execution.private = self.instance.private
-                execution.save()'''
-        return super().save(self, *args, **kwargs)
+            if propagate and threshold and self.instance.samples.count() > threshold:
+                Collection.objects.filter(id=self.instance.id).update(
+                    propagating=F("propagating") + 1
+                )
+                self.instance.propagating += 1
+                id, private = self.instance.id, self.instance.private
+                transaction.on_commit(lambda: propagate_privacy.delay(id, private))
+            elif propagate:
+                propagate_collection_privacy(self.instance.id, self.instance.private)
+            instance = super().save(self, *args, **kwargs)
+        if self.permission_cache: self.permission_cache.invalidate(instance)
+        return instance
 
 
 
@@ -40,6 +58,17 @@ class SampleForm(ModelForm):
         model = Sample
         exclude = ["id", "created", "modified", "qc_message", "qc_pass", "users", "collection", "initiator"]
     
+    def __init__(self, *args, permission_cache=None, **kwargs):
+        ModelForm.__init__(self, *args, **kwargs)
+        self.permission_cache = permission_cache
+    
+
+    def clean_meta(self):
+        """Leaves the sample's meta as it is if none was given."""
+
+        meta = self.cleaned_data["meta"]
+        return self.instance.meta if meta is None else meta
+    
 
     def clean_private(self):
         if self.instance.collection: return self.instance.collection.private
@@ -48,10 +77,11 @@ class SampleForm(ModelForm):
 
     def save(self, *args, **kwargs):
         with transaction.atomic():
-            for job in self.instance.jobs.all():
-                job.private = self.instance.private
-                job.save()
-        return super().save(self, *args, **kwargs)
+            if self.initial["private"] != self.instance.private:
+                propagate_sample_privacy(self.instance.id, self.instance.private)
+            instance = super().save(self, *args, **kwargs)
+        if self.permission_cache: self.permission_cache.invalidate(instance)
+        return instance
 
 
 
@@ -0,0 +1,70 @@
+"""Reading executions' logs a byte range at a time, so that clients polling a
+running execution can ask only for what has been written since they last
+looked, rather than fetching the whole log every time.
+
+Offsets are in bytes of UTF-8. A chunk never starts or ends part way through a
+character - an offset inside one is moved forward to the next character, and
+the next offset is moved back to the start of one cut short - and a negative
+offset counts back from the end, for fetching the tail of a log."""
+
+import os
+import codecs
+from django.conf import settings
+
+def get_log_path(execution):
+    """Gets the path to an execution's nextflow log file."""
+
+    return os.path.join(settings.NEXTFLOW_DATA_ROOT, str(execution.id), ".nextflow.log")
+
+
+def get_log_size(execution):
+    """Gets the size of an execution's nextflow log in bytes, without reading
+    it, or None if there is no log."""
+
+    try:
+        return os.path.getsize(get_log_path(execution))
+    except FileNotFoundError: return None
+
+
+def get_limit(limit):
+    """Gets the number of bytes to return, capped at LOG_CHUNK_SIZE."""
+
+    if limit is None or limit < 0: return settings.LOG_CHUNK_SIZE
+    return min(limit, settings.LOG_CHUNK_SIZE)
+
+
+def make_chunk(data, offset, size):
+    """Decodes the bytes read from the offset given, leaving off any partial
+    character at the start and any character cut short at the end."""
+
+    skip = 0
+    while skip < min(len(data), 3) and data[skip] & 0xC0 == 0x80:
+        skip += 1
+    data, offset = data[skip:], offset + skip
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    text = decoder.decode(data, final=offset + len(data) >= size)
+    next_offset = offset + len(data) - len(decoder.getstate()[0])
+    return {"text": text, "offset": offset, "next_offset": next_offset, "size": size}
+
+
+def read_log_chunk(execution, offset=0, limit=None):
+    """Reads a range of an execution's nextflow log by seeking to it, or
+    returns None if there is no log."""
+
+    try:
+        with open(get_log_path(execution), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            offset = max(size + offset, 0) if offset < 0 else min(offset, size)
+            f.seek(offset)
+            return make_chunk(f.read(get_limit(limit)), offset, size)
+    except FileNotFoundError: return None
+
+
+def slice_text_chunk(text, offset=0, limit=None):
+    """Gets a range of text already in memory, such as an execution's stdout,
+    with the same offsets as a log file would have."""
+
+    data = (text or "").encode()
+    size = len(data)
+    offset = max(size + offset, 0) if offset < 0 else min(offset, size)
+    return make_chunk(data[offset:offset + get_limit(limit)], offset, size)
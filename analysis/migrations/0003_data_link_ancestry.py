@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-18 05:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_data_link_ancestry(apps, schema_editor):
+    Data = apps.get_model("django_nextflow", "Data")
+    DataLink = apps.get_model("analysis", "DataLink")
+    data = Data.objects.filter(id=OuterRef("data"))
+    job = "upstream_process_execution__execution__job"
+    DataLink.objects.update(
+        job=Subquery(data.values(job)[:1]),
+        sample=Subquery(data.values(f"{job}__sample")[:1]),
+        effective_collection=Coalesce(
+            Subquery(data.values(f"{job}__sample__collection")[:1]),
+            Subquery(data.values(f"{job}__collection")[:1]),
+            "collection"
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datalink',
+            name='effective_collection',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='effective_data_links', to='analysis.collection'),
+        ),
+        migrations.AddField(
+            model_name='datalink',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='data_links', to='analysis.job'),
+        ),
+        migrations.AddField(
+            model_name='datalink',
+            name='sample',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='data_links', to='analysis.sample'),
+        ),
+        migrations.RunPython(fill_data_link_ancestry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0003_data_link_ancestry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='propagating',
+            field=models.BooleanField(default=False),
+        ),
+    ]
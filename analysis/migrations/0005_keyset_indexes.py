@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0004_collection_propagating'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['created', 'id'], name='collections_created_6efcbe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['created', 'id'], name='jobs_created_a5dd94_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sample',
+            index=models.Index(fields=['created', 'id'], name='samples_created_88f880_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2 on 2026-10-18 06:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionStats',
+            fields=[
+                ('collection', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='analysis.collection')),
+                ('sample_count', models.IntegerField()),
+                ('execution_count', models.IntegerField()),
+                ('data_count', models.IntegerField()),
+            ],
+            options={
+                'db_table': 'collection_stats',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2 on 2026-10-18 06:24
+
+from django.db import migrations, models
+
+INDEXED_META_KEYS = ["Purification Method (Antibody)", "Sequencer", "5' Barcode"]
+
+def get_index_name(key):
+    return "samples_meta_" + "".join(c if c.isalnum() else "_" for c in key.lower())
+
+
+def create_meta_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX samples_meta_gin ON samples USING gin (meta jsonb_path_ops)"
+        )
+    elif schema_editor.connection.vendor == "sqlite":
+        for key in INDEXED_META_KEYS:
+            path = "'$.\"{}\"'".format(key.replace("'", "''"))
+            schema_editor.execute(
+                f"CREATE INDEX {get_index_name(key)} ON samples (JSON_EXTRACT(meta, {path}))"
+            )
+
+
+def drop_meta_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX samples_meta_gin")
+    elif schema_editor.connection.vendor == "sqlite":
+        for key in INDEXED_META_KEYS:
+            schema_editor.execute(f"DROP INDEX {get_index_name(key)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0006_collection_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sample',
+            name='meta',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(create_meta_indexes, drop_meta_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0007_sample_meta_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='stats_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='collectionstats',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
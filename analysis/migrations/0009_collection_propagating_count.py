@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0008_collection_stats_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='collection',
+            name='propagating',
+            field=models.IntegerField(default=0),
+        ),
+    ]
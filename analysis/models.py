@@ -1,7 +1,11 @@
 import time
+from django.db import connection
 from django_random_id_model import RandomIDModel
 from django.db import models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from core.models import User, Group
+from core.responses import responses_changed
 from django_nextflow.models import Execution, Pipeline, Data
 
 from genomes.models import Species
@@ -11,17 +15,21 @@ class Collection(models.Model):
     part of a single paper or to answer a single research question.
     
     It is either private or not, which determies whether the public can view
-    it."""
+    it. While celery tasks are giving its contents that privacy, propagating
+    is the number of them still to finish."""
 
     class Meta:
         db_table = "collections"
         ordering = ["-created"]
+        indexes = [models.Index(fields=["created", "id"])]
 
     name = models.CharField(max_length=150, unique=True)
     created = models.IntegerField(default=time.time)
     modified = models.IntegerField(default=time.time)
     description = models.TextField(default="", blank=True)
     private = models.BooleanField(default=True)
+    propagating = models.IntegerField(default=0)
+    stats_version = models.IntegerField(default=0)
     users = models.ManyToManyField(User, through="analysis.CollectionUserLink", related_name="collections")
     groups = models.ManyToManyField(Group, through="analysis.CollectionGroupLink", related_name="collections")
 
@@ -29,10 +37,16 @@ class Collection(models.Model):
         return self.name
     
     def save(self, *args, update_last_modified=True, **kwargs):
-        """If the model is being updated, change the last_modified time."""
+        """If the model is being updated, change the last_modified time. The
+        propagating count and stats version are left out of updates, as they
+        are only ever changed with atomic increments and this copy of them may
+        be out of date."""
         
         if self._state.adding is False and update_last_modified:
             self.last_modified = int(time.time())
+        if self._state.adding is False and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ["propagating", "stats_version"]]
         super(Collection, self).save(*args, **kwargs)
     
 
@@ -43,13 +57,9 @@ class Collection(models.Model):
 
     @property
     def all_data(self):
-        return (Data.objects.filter(
-            upstream_process_execution__execution__job__sample__collection=self
-        ) | Data.objects.filter(
-            upstream_process_execution__execution__job__collection=self
-        ) | Data.objects.filter(
-            link__collection=self
-        )).distinct()
+        return Data.objects.filter(
+            models.Q(link__collection=self) | models.Q(link__effective_collection=self)
+        )
 
 
 
@@ -59,13 +69,14 @@ class Sample(models.Model):
     class Meta:
         db_table = "samples"
         ordering = ["-created"]
+        indexes = [models.Index(fields=["created", "id"])]
     
     name = models.CharField(max_length=250)
     created = models.IntegerField(default=time.time)
     modified = models.IntegerField(default=time.time)
     private = models.BooleanField(default=True)
 
-    meta = models.TextField(default="{}")
+    meta = models.JSONField(default=dict, blank=True)
     species = models.ForeignKey("genomes.Species", null=True, on_delete=models.SET_NULL, related_name="samples")
     method = models.CharField(max_length=20)
     source = models.CharField(max_length=20)
@@ -94,7 +105,7 @@ class Sample(models.Model):
 
     @property
     def all_data(self):
-        return Data.objects.filter(upstream_process_execution__execution__job__sample=self)
+        return Data.objects.filter(link__sample=self)
 
 
 
@@ -117,6 +128,7 @@ class Job(models.Model):
     class Meta:
         db_table = "jobs"
         ordering = ["created"]
+        indexes = [models.Index(fields=["created", "id"])]
 
     created = models.IntegerField(default=time.time)
     modified = models.IntegerField(default=time.time)
@@ -193,6 +205,24 @@ class JobUserLink(models.Model):
 
 
 
+class CollectionStats(models.Model):
+    """Cached counts of the things a collection contains, so that they don't
+    have to be counted every time a collection is listed. The counts are only
+    used while their version matches their collection's stats version, which
+    is bumped whenever something it contains changes - they are then recounted
+    the next time they are needed, by whichever request needs them."""
+
+    class Meta:
+        db_table = "collection_stats"
+    
+    collection = models.OneToOneField(Collection, primary_key=True, on_delete=models.CASCADE, related_name="stats")
+    sample_count = models.IntegerField()
+    execution_count = models.IntegerField()
+    data_count = models.IntegerField()
+    version = models.IntegerField(default=0)
+
+
+
 class DataLink(models.Model):
 
     class Meta:
@@ -204,6 +234,11 @@ class DataLink(models.Model):
     is_annotation = models.BooleanField(default=False)
     is_multiplexed = models.BooleanField(default=False)
 
+    # Copies of the data file's ancestry, kept in sync by core.signals
+    job = models.ForeignKey(Job, null=True, blank=True, on_delete=models.SET_NULL, related_name="data_links")
+    sample = models.ForeignKey(Sample, null=True, blank=True, on_delete=models.SET_NULL, related_name="data_links")
+    effective_collection = models.ForeignKey(Collection, null=True, blank=True, on_delete=models.SET_NULL, related_name="effective_data_links")
+
 
 
 class PipelineLink(models.Model):
@@ -227,4 +262,180 @@ class DataUserLink(models.Model):
 
     data = models.ForeignKey(Data, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    permission = models.IntegerField(choices=PERMISSIONS, default=1)
\ No newline at end of file
+    permission = models.IntegerField(choices=PERMISSIONS, default=1)
+
+
+
+def update_data_link_ancestry(links):
+    """Sets the job, sample and effective collection columns of the DataLink
+    queryset given from the job which produced each data file. The effective
+    collection is the job's sample's collection, or the job's own collection,
+    or failing those the collection the file is directly linked to. This is a
+    single UPDATE however many links there are."""
+
+    data = Data.objects.filter(id=OuterRef("data"))
+    job = "upstream_process_execution__execution__job"
+    links.update(
+        job=Subquery(data.values(job)[:1]),
+        sample=Subquery(data.values(f"{job}__sample")[:1]),
+        effective_collection=Coalesce(
+            Subquery(data.values(f"{job}__sample__collection")[:1]),
+            Subquery(data.values(f"{job}__collection")[:1]),
+            "collection"
+        )
+    )
+
+
+class MetaKeyIs(models.Func):
+    """Whether one key of a sample's meta has the (scalar) value given. The
+    key's path is written into the SQL itself rather than passed as a
+    parameter, as SQLite only uses an expression index when the expression
+    matches it exactly. SQLite paths can't quote a key containing a double
+    quote, so those keys are looked up with JSON_EACH instead.
+
+    The value's JSON type is checked as well as the value, so that - as with
+    PostgreSQL's containment check - true doesn't match 1, and null only
+    matches a key which is present and null."""
+
+    output_field = models.BooleanField()
+
+    def __init__(self, key, value):
+        super().__init__(models.F("meta"), models.Value(value))
+        self.key, self.value = key, value
+        self.path = "'$.\"{}\"'".format(key.replace("'", "''").replace("%", "%%"))
+    
+
+    def get_json_types(self):
+        if self.value is None: return "'null'"
+        if isinstance(self.value, bool): return f"'{str(self.value).lower()}'"
+        if isinstance(self.value, (int, float)): return "'integer', 'real'"
+        return "'text'"
+    
+
+    def as_sql(self, compiler, connection):
+        meta, meta_params = compiler.compile(self.source_expressions[0])
+        value, value_params = compiler.compile(self.source_expressions[1])
+        types = self.get_json_types()
+        if '"' in self.key:
+            return (
+                f"EXISTS (SELECT 1 FROM JSON_EACH({meta}) WHERE key = %s"
+                f" AND value IS {value} AND type IN ({types}))"
+            ), [*meta_params, self.key, *value_params]
+        if self.value is None:
+            return f"JSON_TYPE({meta}, {self.path}) = 'null'", meta_params
+        return (
+            f"(JSON_EXTRACT({meta}, {self.path}) IS {value}"
+            f" AND JSON_TYPE({meta}, {self.path}) IN ({types}))"
+        ), [*meta_params, *value_params, *meta_params]
+
+
+def filter_samples_by_meta(samples, meta):
+    """Filters a sample queryset to those whose meta has every key-value pair
+    given, where every value is a string, number, boolean or null. On
+    PostgreSQL this is a single containment check, which the GIN index on
+    meta answers - elsewhere each key is compared in turn."""
+
+    if connection.vendor == "postgresql":
+        return samples.filter(meta__contains=meta)
+    for key, value in meta.items():
+        samples = samples.filter(MetaKeyIs(key, value))
+    return samples
+
+
+def propagate_collection_privacy(collection_id, private):
+    """Gives a collection's samples, its jobs and its samples' jobs, and the
+    data links beneath them the privacy given, with one UPDATE per table
+    however large the collection is."""
+
+    Sample.objects.filter(collection_id=collection_id).update(private=private)
+    Job.objects.filter(
+        models.Q(collection_id=collection_id) |
+        models.Q(sample__collection_id=collection_id)
+    ).update(private=private)
+    DataLink.objects.filter(
+        models.Q(collection_id=collection_id) |
+        models.Q(effective_collection_id=collection_id)
+    ).update(private=private)
+    responses_changed()
+
+
+def propagate_sample_privacy(sample_id, private):
+    """Gives a sample's jobs and the data links beneath it the privacy given,
+    with one UPDATE per table."""
+
+    Job.objects.filter(sample_id=sample_id).update(private=private)
+    DataLink.objects.filter(sample_id=sample_id).update(private=private)
+    responses_changed()
+
+
+def count_collection_contents(collection_ids):
+    """Counts the samples, executions and data files of every collection given
+    using grouped aggregates, so that the number of queries doesn't depend on
+    the number of collections. Data files are counted once per collection,
+    whether they belong to it directly or through a job."""
+
+    counts = {id: {"sample_count": 0, "execution_count": 0, "data_count": 0}
+        for id in collection_ids}
+    for field, rows, parent in [
+        ("sample_count", Sample.objects.filter(collection__in=collection_ids), "collection"),
+        ("execution_count", Job.objects.filter(
+            collection__in=collection_ids, execution__isnull=False
+        ), "collection"),
+        ("data_count", DataLink.objects.filter(collection__in=collection_ids), "collection"),
+        ("data_count", DataLink.objects.filter(effective_collection__in=collection_ids).exclude(
+            collection=F("effective_collection")
+        ), "effective_collection"),
+    ]:
+        for row in rows.values(parent).annotate(count=Count("id")).order_by():
+            counts[row[parent]][field] += row["count"]
+    return counts
+
+
+def get_collection_stats(collection_ids):
+    """Gets the CollectionStats of every collection given, counting and storing
+    any which aren't cached or are out of date.
+
+    This means a read can write to the database, so that the counting is only
+    done for collections someone looks at and only once however many changes
+    were made - rather than on every change, in the transaction making it.
+    The stats version is read before counting, so counts which a change
+    committed part way through could have missed are stored against the old
+    version, and counted again next time."""
+
+    stats, stale, outdated = {}, {}, []
+    for id, version, stored, *counts in Collection.objects.filter(id__in=collection_ids).values_list(
+        "id", "stats_version", "stats__version", "stats__sample_count",
+        "stats__execution_count", "stats__data_count"
+    ).order_by():
+        if stored == version:
+            stats[id] = CollectionStats(
+                collection_id=id, version=version, sample_count=counts[0],
+                execution_count=counts[1], data_count=counts[2]
+            )
+        else:
+            stale[id] = version
+            if stored is not None: outdated.append(id)
+    if stale:
+        new = [CollectionStats(collection_id=id, version=stale[id], **counts) for id, counts in
+            count_collection_contents(list(stale)).items()]
+        if outdated:
+            CollectionStats.objects.filter(collection__in=outdated).exclude(
+                version=F("collection__stats_version")
+            ).delete()
+        CollectionStats.objects.bulk_create(new, ignore_conflicts=True)
+        stats.update({s.collection_id: s for s in new})
+    return stats
+
+
+def invalidate_collection_stats(collection_ids):
+    """Marks the cached counts of the collections given out of date, ignoring
+    any null IDs, so that they are recounted when next needed. The rows are
+    not deleted, as a request which counted before the change was committed
+    could store its counts again after it - instead each collection's stats
+    version is bumped, in the same transaction as the change."""
+
+    collection_ids = set(id for id in collection_ids if id)
+    if collection_ids:
+        Collection.objects.filter(id__in=collection_ids).update(
+            stats_version=F("stats_version") + 1
+        )
@@ -1,5 +1,6 @@
 from django_nextflow.models import Data, Execution, Pipeline
-from core.permissions import does_user_have_permission_on_collection, does_user_have_permission_on_data, does_user_have_permission_on_job, does_user_have_permission_on_sample, get_users_by_collection, readable_collections, readable_data, readable_jobs, readable_samples
+from core.loaders import get_permission_cache, has_cached_permission
+from core.permissions import get_users_by_collection, readable_collections, readable_data, readable_jobs, readable_samples
 import graphene
 import json
 import pandas as pd
@@ -52,9 +53,11 @@ class UpdateCollectionMutation(graphene.Mutation):
             Collection.objects.filter(id=kwargs["id"]), info.context.user
         ).first()
         if not collection: raise GraphQLError('{"collection": ["Does not exist"]}')
-        if not does_user_have_permission_on_collection(info.context.user, collection, 2):
+        if not has_cached_permission(info, collection, 2):
             raise GraphQLError('{"collection": ["You don\'t have permission to edit this collection"]}')
-        form = CollectionForm(kwargs, instance=collection)
+        form = CollectionForm(
+            kwargs, instance=collection, permission_cache=get_permission_cache(info)
+        )
         if form.is_valid():
             if "papers" in kwargs:
                 collection.papers.all().delete()
@@ -80,7 +83,7 @@ class DeleteCollectionMutation(graphene.Mutation):
         if not info.context.user: raise GraphQLError(json.dumps({"error": "Not authorized"}))
         collection = readable_collections(Collection.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not collection: raise GraphQLError('{"collection": ["Does not exist"]}')
-        if not does_user_have_permission_on_collection(info.context.user, collection, 4):
+        if not has_cached_permission(info, collection, 4):
             raise GraphQLError('{"collection": ["Not an owner"]}')
         '''executions = (
             Execution.objects.filter(collection=collection) |
@@ -111,7 +114,7 @@ class UpdateCollectionAccessMutation(graphene.Mutation):
 
         collection = readable_collections(Collection.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not collection: raise GraphQLError('{"collection": ["Does not exist"]}')
-        if not does_user_have_permission_on_collection(info.context.user, collection, 3):
+        if not has_cached_permission(info, collection, 3):
             raise GraphQLError('{"collection": ["You do not have share permissions"]}')
         user = User.objects.filter(id=kwargs.get("user")).first()
         if kwargs.get("user") and not user: raise GraphQLError('{"user": ["Does not exist"]}')
@@ -123,9 +126,9 @@ class UpdateCollectionAccessMutation(graphene.Mutation):
             link = CollectionUserLink.objects.get_or_create(
                 collection=collection, user=user
             )[0]
-            if kwargs["permission"] == 4 and not does_user_have_permission_on_collection(info.context.user, collection, 4):
+            if kwargs["permission"] == 4 and not has_cached_permission(info, collection, 4):
                 raise GraphQLError('{"collection": ["Only an owner can make owners"]}')
-            if link.permission == 4 and not does_user_have_permission_on_collection(info.context.user, collection, 4):
+            if link.permission == 4 and not has_cached_permission(info, collection, 4):
                 raise GraphQLError('{"collection": ["Only an owner can remove owners"]}')
             if get_users_by_collection(collection, 4).count() == 1 and link.permission == 4 and kwargs["permission"] != 4:
                 raise GraphQLError('{"collection": ["There must be at least one owner"]}')
@@ -142,6 +145,7 @@ class UpdateCollectionAccessMutation(graphene.Mutation):
         else:
             link.permission = kwargs["permission"]
             link.save()
+        get_permission_cache(info).invalidate(collection)
         return UpdateCollectionAccessMutation(user=user, collection=collection, group=group)
 
 
@@ -160,16 +164,19 @@ class UpdateSampleMutation(graphene.Mutation):
         if not sample: raise GraphQLError('{"sample": ["Does not exist"]}')
         collection = readable_collections(Collection.objects.filter(id=kwargs.get("collection")), info.context.user).first()
         if not collection and sample.collection: raise GraphQLError('{"collection": ["Does not exist"]}')
-        if collection and not does_user_have_permission_on_collection(info.context.user, collection, 4):
+        if collection and not has_cached_permission(info, collection, 4):
             raise GraphQLError('{"sample": ["The new collection is not owned by you"]}')
-        if not does_user_have_permission_on_sample(info.context.user, sample, 2):
+        if not has_cached_permission(info, sample, 2):
             raise GraphQLError('{"sample": ["You don\'t have permission to edit this sample"]}')
         if not collection: kwargs["collection"] = None
-        form = SampleForm(kwargs, instance=sample)
+        form = SampleForm(
+            kwargs, instance=sample, permission_cache=get_permission_cache(info)
+        )
         if form.is_valid():
             form.save()
             form.instance.collection = collection
             form.instance.save()
+            get_permission_cache(info).invalidate(form.instance)
             return UpdateSampleMutation(sample=form.instance)
         raise GraphQLError(json.dumps(form.errors))
 
@@ -190,7 +197,7 @@ class UpdateSampleAccessMutation(graphene.Mutation):
         sample = readable_samples(Sample.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not sample: raise GraphQLError('{"sample": ["Does not exist"]}')
 
-        if not does_user_have_permission_on_sample(info.context.user, sample, 3):
+        if not has_cached_permission(info, sample, 3):
             raise GraphQLError('{"sample": ["You do not have share permissions"]}')
         user = User.objects.filter(id=kwargs.get("user")).first()
         if kwargs.get("user") and not user: raise GraphQLError('{"user": ["Does not exist"]}')
@@ -202,6 +209,7 @@ class UpdateSampleAccessMutation(graphene.Mutation):
         else:
             link.permission = kwargs["permission"]
             link.save()
+        get_permission_cache(info).invalidate(sample)
         return UpdateSampleAccessMutation(user=user, sample=sample)
 
 
@@ -218,7 +226,7 @@ class DeleteSampleMutation(graphene.Mutation):
             raise GraphQLError(json.dumps({"error": "Not authorized"}))
         sample = readable_samples(Sample.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not sample: raise GraphQLError('{"sample": ["Does not exist"]}')
-        if not does_user_have_permission_on_sample(info.context.user, sample, 4):
+        if not has_cached_permission(info, sample, 4):
             raise GraphQLError('{"sample": ["Not an owner"]}')
         executions = Job.objects.filter(sample=sample)
         executions.delete()
@@ -239,7 +247,7 @@ class UpdateExecutionMutation(graphene.Mutation):
         if not info.context.user: raise GraphQLError(json.dumps({"error": "Not authorized"}))
         job = readable_jobs(Job.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not job: raise GraphQLError('{"execution": ["Does not exist"]}')
-        if not does_user_have_permission_on_job(info.context.user, job, 2):
+        if not has_cached_permission(info, job, 2):
             raise GraphQLError('{"data": ["You don\'t have permission to edit this execution"]}')
         job.private = kwargs["private"]
         job.save()
@@ -260,7 +268,7 @@ class UpdateExecutionAccessMutation(graphene.Mutation):
         if not info.context.user: raise GraphQLError(json.dumps({"error": "Not authorized"}))
         job = readable_jobs(Job.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not job: raise GraphQLError('{"execution": ["Does not exist"]}')
-        if not does_user_have_permission_on_job(info.context.user, job, 3):
+        if not has_cached_permission(info, job, 3):
             raise GraphQLError('{"execution": ["You do not have share permissions"]}')
         user = User.objects.filter(id=kwargs.get("user")).first()
         if kwargs.get("user") and not user: raise GraphQLError('{"user": ["Does not exist"]}')
@@ -272,6 +280,7 @@ class UpdateExecutionAccessMutation(graphene.Mutation):
         else:
             link.permission = kwargs["permission"]
             link.save()
+        get_permission_cache(info).invalidate(job)
         return UpdateExecutionAccessMutation(user=user, execution=job)
 
 
@@ -335,10 +344,11 @@ class UpdateDataMutation(graphene.Mutation):
         if not info.context.user: raise GraphQLError(json.dumps({"error": "Not authorized"}))
         data = readable_data(Data.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not data: raise GraphQLError('{"data": ["Does not exist"]}')
-        if not does_user_have_permission_on_data(info.context.user, data, 2):
+        if not has_cached_permission(info, data, 2):
             raise GraphQLError('{"data": ["You don\'t have permission to edit this data"]}')
         data.link.private = kwargs["private"]
         data.link.save()
+        get_permission_cache(info).invalidate(data)
         return UpdateDataMutation(data=data)
 
 
@@ -358,7 +368,7 @@ class UpdateDataAccessMutation(graphene.Mutation):
         data = readable_data(Data.objects.filter(id=kwargs["id"]), info.context.user).first()
         if not data: raise GraphQLError('{"sample": ["Does not exist"]}')
 
-        if not does_user_have_permission_on_data(info.context.user, data, 3):
+        if not has_cached_permission(info, data, 3):
             raise GraphQLError('{"data": ["You do not have share permissions"]}')
         user = User.objects.filter(id=kwargs.get("user")).first()
         if kwargs.get("user") and not user: raise GraphQLError('{"user": ["Does not exist"]}')
@@ -370,6 +380,7 @@ class UpdateDataAccessMutation(graphene.Mutation):
         else:
             link.permission = kwargs["permission"]
             link.save()
+        get_permission_cache(info).invalidate(data)
         return UpdateDataAccessMutation(user=user, data=data)
 
 
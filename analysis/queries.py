@@ -1,17 +1,26 @@
-import json
 import graphene
-from graphene.relay.connection import Connection
+from django.db import models
 from graphene_django import DjangoObjectType
+from graphene_django.converter import convert_django_field
 from graphql import execution
-from core.permissions import  does_user_have_permission_on_collection, does_user_have_permission_on_data, does_user_have_permission_on_job, does_user_have_permission_on_sample, get_users_by_collection, get_users_by_data, get_users_by_job
+from core.permissions import get_users_by_collection, get_users_by_data, get_users_by_job
+from core.loaders import get_collection_stats_loader, load_has_permission
+from core.pagination import CountableConnection, FacetValueType, count_facets
 
 from .models import Collection, Job, Sample, Paper
+from .logs import get_log_size, read_log_chunk, slice_text_chunk
 from django_nextflow.models import Data, Execution, Pipeline, ProcessExecution
 
+@convert_django_field.register(models.JSONField)
+def convert_json_field(field, registry=None):
+    return graphene.JSONString(description=field.help_text, required=not field.null)
+
+
 class CollectionType(DjangoObjectType):
     
     class Meta:
         model = Collection
+        exclude_fields = ["stats_version"]
     
     id = graphene.ID()
     sample_count = graphene.Int()
@@ -24,15 +33,25 @@ class CollectionType(DjangoObjectType):
     is_owner = graphene.Boolean()
     can_share = graphene.Boolean()
     can_edit = graphene.Boolean()
+    propagating = graphene.Boolean()
+
+    def resolve_propagating(self, info, **kwargs):
+        return self.propagating > 0
 
     def resolve_sample_count(self, info, **kwargs):
-        return self.samples.count()
+        return get_collection_stats_loader(info).load(self.id).then(
+            lambda stats: stats.sample_count
+        )
 
     def resolve_execution_count(self, info, **kwargs):
-        return self.all_executions.count()
+        return get_collection_stats_loader(info).load(self.id).then(
+            lambda stats: stats.execution_count
+        )
     
     def resolve_data_count(self, info, **kwargs):
-        return self.all_data.count()
+        return get_collection_stats_loader(info).load(self.id).then(
+            lambda stats: stats.data_count
+        )
 
     def resolve_owners(self, info, **kwargs):
         return get_users_by_collection(self, 4)
@@ -44,25 +63,20 @@ class CollectionType(DjangoObjectType):
         return self.all_data.all()
     
     def resolve_is_owner(self, info, **kwargs):
-        return does_user_have_permission_on_collection(info.context.user, self, 4)
+        return load_has_permission(info, "collection", self.id, 4)
     
     def resolve_can_share(self, info, **kwargs):
-        return does_user_have_permission_on_collection(info.context.user, self, 3)
+        return load_has_permission(info, "collection", self.id, 3)
     
     def resolve_can_edit(self, info, **kwargs):
-        return does_user_have_permission_on_collection(info.context.user, self, 2)
+        return load_has_permission(info, "collection", self.id, 2)
 
 
 
-class CollectionConnection(Connection):
+class CollectionConnection(CountableConnection):
 
     class Meta:
         node = CollectionType
-    
-    count = graphene.Int()
-
-    def resolve_count(self, info, **kwargs):
-        return len(self.iterable)
 
 
 
@@ -96,17 +110,14 @@ class SampleType(DjangoObjectType):
     data = graphene.List("analysis.queries.DataType")
     all_data = graphene.List("analysis.queries.DataType")
 
-    def resolve_meta(self, info, **kwargs):
-        return json.loads(self.meta)
-
     def resolve_is_owner(self, info, **kwargs):
-        return does_user_have_permission_on_sample(info.context.user, self, 4)
+        return load_has_permission(info, "sample", self.id, 4)
     
     def resolve_can_share(self, info, **kwargs):
-        return does_user_have_permission_on_sample(info.context.user, self, 3)
+        return load_has_permission(info, "sample", self.id, 3)
     
     def resolve_can_edit(self, info, **kwargs):
-        return does_user_have_permission_on_sample(info.context.user, self, 2)
+        return load_has_permission(info, "sample", self.id, 2)
     
     def resolve_executions(self, info, **kwargs):
         return Job.objects.filter(sample=self)
@@ -116,15 +127,37 @@ class SampleType(DjangoObjectType):
 
 
 
-class SampleConnection(Connection):
+class SampleFacetsType(graphene.ObjectType):
+
+    species = graphene.List(FacetValueType)
+    method = graphene.List(FacetValueType)
+    source = graphene.List(FacetValueType)
+    qc_pass = graphene.List(FacetValueType)
+
+
+
+class SampleConnection(CountableConnection):
 
     class Meta:
         node = SampleType
     
-    count = graphene.Int()
+    facets = graphene.Field(SampleFacetsType)
+
+    def resolve_facets(self, info, **kwargs):
+        if isinstance(self.iterable, models.QuerySet):
+            return count_facets(self.iterable, {
+                "species": "species__name", "method": "method",
+                "source": "source", "qc_pass": "qc_pass"
+            })
+
+
 
-    def resolve_count(self, info, **kwargs):
-        return len(self.iterable)
+class LogChunkType(graphene.ObjectType):
+
+    text = graphene.String()
+    offset = graphene.Int()
+    next_offset = graphene.Int()
+    size = graphene.Int()
 
 
 
@@ -141,6 +174,10 @@ class ExecutionType(DjangoObjectType):
     stdout = graphene.String()
     stderr = graphene.String()
     log = graphene.String()
+    log_size = graphene.Int()
+    log_chunk = graphene.Field(LogChunkType, offset=graphene.Int(), limit=graphene.Int())
+    stdout_chunk = graphene.Field(LogChunkType, offset=graphene.Int(), limit=graphene.Int())
+    stderr_chunk = graphene.Field(LogChunkType, offset=graphene.Int(), limit=graphene.Int())
     command = graphene.String()
     params = graphene.String()
     data_params = graphene.String()
@@ -150,11 +187,23 @@ class ExecutionType(DjangoObjectType):
     upstream_executions = graphene.List("analysis.queries.ExecutionType")
     owners = graphene.List("core.queries.UserType")
 
+    query_hints = {
+        "status": "execution", "stdout": "execution", "stderr": "execution",
+        "log": "execution", "command": "execution", "pipeline": "pipeline",
+        "log_size": "execution", "log_chunk": "execution",
+        "stdout_chunk": "execution", "stderr_chunk": "execution",
+        "process_executions": "execution__process_executions",
+        "upstream_data": "execution__upstream_data",
+    }
+
+    def resolve_is_owner(self, info, **kwargs):
+        return load_has_permission(info, "job", self.id, 4)
+
     def resolve_can_share(self, info, **kwargs):
-        return does_user_have_permission_on_job(info.context.user, self, 3)
+        return load_has_permission(info, "job", self.id, 3)
     
     def resolve_can_edit(self, info, **kwargs):
-        return does_user_have_permission_on_job(info.context.user, self, 2)
+        return load_has_permission(info, "job", self.id, 2)
 
     def resolve_status(self, info, **kwargs):
         if self.execution: return self.execution.status
@@ -171,6 +220,28 @@ class ExecutionType(DjangoObjectType):
     def resolve_log(self, info, **kwargs):
         if self.execution: return self.execution.get_log_text()
     
+
+    def resolve_log_size(self, info, **kwargs):
+        if self.execution: return get_log_size(self.execution)
+    
+
+    def resolve_log_chunk(self, info, **kwargs):
+        if self.execution: return read_log_chunk(
+            self.execution, kwargs.get("offset") or 0, kwargs.get("limit")
+        )
+    
+
+    def resolve_stdout_chunk(self, info, **kwargs):
+        if self.execution: return slice_text_chunk(
+            self.execution.stdout, kwargs.get("offset") or 0, kwargs.get("limit")
+        )
+    
+
+    def resolve_stderr_chunk(self, info, **kwargs):
+        if self.execution: return slice_text_chunk(
+            self.execution.stderr, kwargs.get("offset") or 0, kwargs.get("limit")
+        )
+    
     def resolve_command(self, info, **kwargs):
         if self.execution: return self.execution.command
 
@@ -206,15 +277,10 @@ class ExecutionType(DjangoObjectType):
 
 
 
-class ExecutionConnection(Connection):
+class ExecutionConnection(CountableConnection):
 
     class Meta:
         node = ExecutionType
-    
-    count = graphene.Int()
-
-    def resolve_count(self, info, **kwargs):
-        return len(self.iterable)
 
 
 class ProcessExecutionType(DjangoObjectType):
@@ -225,6 +291,8 @@ class ProcessExecutionType(DjangoObjectType):
     id = graphene.ID()
     execution = graphene.Field("analysis.queries.ExecutionType")
 
+    query_hints = {"execution": "execution__job"}
+
     def resolve_execution(self, info, **kwargs):
         return self.execution.job
 
@@ -247,14 +315,16 @@ class DataType(DjangoObjectType):
     users = graphene.List("core.queries.UserType")
     owners = graphene.List("core.queries.UserType")
 
+    query_hints = {"private": "link", "is_annotation": "link", "is_multiplexed": "link"}
+
     def resolve_is_owner(self, info, **kwargs):
-        return does_user_have_permission_on_data(info.context.user, self, 4)
+        return load_has_permission(info, "data", self.id, 4)
     
     def resolve_can_share(self, info, **kwargs):
-        return does_user_have_permission_on_data(info.context.user, self, 3)
+        return load_has_permission(info, "data", self.id, 3)
     
     def resolve_can_edit(self, info, **kwargs):
-        return does_user_have_permission_on_data(info.context.user, self, 2)
+        return load_has_permission(info, "data", self.id, 2)
     
     def resolve_private(self, info, **kwargs):
         return self.link.private
@@ -276,15 +346,22 @@ class DataType(DjangoObjectType):
 
 
 
-class DataConnection(Connection):
+class DataFacetsType(graphene.ObjectType):
+
+    filetype = graphene.List(FacetValueType)
+
+
+
+class DataConnection(CountableConnection):
 
     class Meta:
         node = DataType
     
-    count = graphene.Int()
+    facets = graphene.Field(DataFacetsType)
 
-    def resolve_count(self, info, **kwargs):
-        return len(self.iterable)
+    def resolve_facets(self, info, **kwargs):
+        if isinstance(self.iterable, models.QuerySet):
+            return count_facets(self.iterable, {"filetype": "filetype"})
 
 
 
@@ -299,6 +376,8 @@ class PipelineType(DjangoObjectType):
     can_produce_genome = graphene.Boolean()
     takes_genome = graphene.Boolean()
 
+    query_hints = {"can_produce_genome": "link", "takes_genome": "link"}
+
     def resolve_is_subworkflow(self, info, **kwargs):
         return "subworkflows" in self.path
     
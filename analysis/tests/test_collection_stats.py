@@ -0,0 +1,102 @@
+from unittest.mock import Mock, patch
+from mixer.backend.django import mixer
+from django.test import TestCase
+from django_nextflow.models import Data, Execution, ProcessExecution
+from core.schema import schema
+from analysis.models import *
+
+class CollectionStatsTests(TestCase):
+
+    def setUp(self):
+        self.collections = [Collection.objects.create(
+            name=f"collection{n}", private=False
+        ) for n in range(3)]
+        self.sample = Sample.objects.create(name="sample", collection=self.collections[0])
+        Sample.objects.create(name="sample2", collection=self.collections[0])
+        execution = mixer.blend(Execution)
+        self.job = Job.objects.create(sample=self.sample, execution=execution)
+        Job.objects.create(collection=self.collections[1], execution=mixer.blend(Execution))
+        data = mixer.blend(Data, upstream_process_execution=mixer.blend(
+            ProcessExecution, execution=execution
+        ))
+        mixer.blend(DataLink, data=data, collection=None)
+        mixer.blend(DataLink, data=mixer.blend(Data), collection=self.collections[1])
+    
+
+    def counts(self, collection):
+        stats = get_collection_stats([collection.id])[collection.id]
+        return [stats.sample_count, stats.execution_count, stats.data_count]
+    
+
+    def test_contents_are_counted_together(self):
+        with self.assertNumQueries(4):
+            counts = count_collection_contents([c.id for c in self.collections])
+        self.assertEqual(counts[self.collections[0].id], {
+            "sample_count": 2, "execution_count": 0, "data_count": 1
+        })
+        self.assertEqual(counts[self.collections[1].id], {
+            "sample_count": 0, "execution_count": 1, "data_count": 1
+        })
+        self.assertEqual(counts[self.collections[2].id], {
+            "sample_count": 0, "execution_count": 0, "data_count": 0
+        })
+    
+
+    def test_stats_are_cached(self):
+        self.assertEqual(self.counts(self.collections[0]), [2, 0, 1])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counts(self.collections[0]), [2, 0, 1])
+    
+
+    def test_stats_are_discarded_when_contents_change(self):
+        self.assertEqual(self.counts(self.collections[0]), [2, 0, 1])
+        self.assertEqual(self.counts(self.collections[2]), [0, 0, 0])
+        self.sample.collection = self.collections[2]
+        self.sample.save()
+        self.assertEqual(self.counts(self.collections[0]), [1, 0, 0])
+        self.assertEqual(self.counts(self.collections[2]), [1, 0, 1])
+        self.sample.name = "new name"
+        self.sample.save()
+        self.assertTrue(CollectionStats.objects.filter(collection=self.collections[2]).exists())
+        self.job.delete()
+        self.assertEqual(self.counts(self.collections[2]), [1, 0, 0])
+        Sample.objects.filter(collection=self.collections[2]).delete()
+        self.assertEqual(self.counts(self.collections[2]), [0, 0, 0])
+    
+
+    def test_counts_made_before_a_change_are_not_kept(self):
+        count = count_collection_contents
+        def count_then_change(ids):
+            counts = count(ids)
+            Sample.objects.create(name="sample3", collection=self.collections[0])
+            return counts
+        with patch("analysis.models.count_collection_contents", count_then_change):
+            self.assertEqual(self.counts(self.collections[0]), [2, 0, 1])
+        self.assertEqual(self.counts(self.collections[0]), [3, 0, 1])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counts(self.collections[0]), [3, 0, 1])
+    
+
+    def test_saving_collection_keeps_stats_version(self):
+        collection = Collection.objects.get(id=self.collections[0].id)
+        self.assertEqual(self.counts(self.collections[0]), [2, 0, 1])
+        Sample.objects.create(name="sample3", collection=self.collections[0])
+        collection.name = "new name"
+        collection.save()
+        self.assertEqual(self.counts(self.collections[0]), [3, 0, 1])
+    
+
+    def test_page_of_collections_uses_constant_queries(self):
+        with self.assertNumQueries(7):
+            result = schema.execute("""{ publicCollections {
+                edges { node { sampleCount executionCount dataCount } }
+            } }""", context_value=Mock(spec=["user"], user=None))
+        self.assertIsNone(result.errors)
+        with self.assertNumQueries(2):
+            result = schema.execute("""{ publicCollections {
+                edges { node { sampleCount executionCount dataCount } }
+            } }""", context_value=Mock(spec=["user"], user=None))
+        self.assertEqual(sorted(
+            [edge["node"]["sampleCount"], edge["node"]["executionCount"], edge["node"]["dataCount"]]
+            for edge in result.data["publicCollections"]["edges"]
+        ), [[0, 0, 0], [0, 1, 1], [2, 0, 1]])
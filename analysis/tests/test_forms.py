@@ -0,0 +1,102 @@
+from unittest.mock import patch
+from mixer.backend.django import mixer
+from django.test import TestCase, override_settings
+from django_nextflow.models import Data, Execution, ProcessExecution
+from analysis.forms import CollectionForm, SampleForm
+from analysis.models import Collection, DataLink, Job, Sample, propagate_sample_privacy
+from analysis.celery import propagate_privacy
+
+class PrivacyPropagationTests(TestCase):
+
+    def setUp(self):
+        self.collection = Collection.objects.create(name="collection", private=True)
+        self.samples = [Sample.objects.create(
+            name=f"sample{n}", collection=self.collection, private=True
+        ) for n in range(3)]
+        self.jobs = [Job.objects.create(sample=sample, private=True) for sample in self.samples]
+        self.jobs.append(Job.objects.create(collection=self.collection, private=True))
+        execution = mixer.blend(Execution)
+        self.jobs[0].execution = execution
+        self.jobs[0].save()
+        self.data = mixer.blend(Data, upstream_process_execution=mixer.blend(
+            ProcessExecution, execution=execution
+        ))
+        self.link = mixer.blend(DataLink, data=self.data, collection=None, private=True)
+        self.other = Sample.objects.create(name="other", private=True)
+    
+
+    def privacy(self):
+        return (
+            [s.private for s in Sample.objects.filter(collection=self.collection)],
+            [j.private for j in Job.objects.all()],
+            DataLink.objects.get(id=self.link.id).private,
+        )
+    
+
+    def test_collection_privacy_propagates_in_constant_queries(self):
+        form = CollectionForm(
+            {"name": "collection", "private": False}, instance=self.collection
+        )
+        self.assertTrue(form.is_valid())
+        with self.assertNumQueries(6):
+            form.save()
+        self.assertEqual(self.privacy(), ([False] * 3, [False] * 4, False))
+        self.assertTrue(Sample.objects.get(id=self.other.id).private)
+    
+
+    def test_unchanged_collection_privacy_is_not_propagated(self):
+        form = CollectionForm(
+            {"name": "new", "private": True}, instance=self.collection
+        )
+        self.assertTrue(form.is_valid())
+        with patch("analysis.forms.propagate_collection_privacy") as propagate:
+            form.save()
+        self.assertFalse(propagate.called)
+    
+
+    @override_settings(PRIVACY_PROPAGATION_TASK_THRESHOLD=2)
+    def test_large_collection_propagates_in_background(self):
+        form = CollectionForm(
+            {"name": "collection", "private": False}, instance=self.collection
+        )
+        self.assertTrue(form.is_valid())
+        with patch("analysis.celery.propagate_privacy.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                form.save()
+        delay.assert_called_with(self.collection.id, False)
+        self.collection.refresh_from_db()
+        self.assertTrue(self.collection.propagating)
+        self.assertFalse(self.collection.private)
+        self.assertEqual(self.privacy(), ([True] * 3, [True] * 4, True))
+        propagate_privacy(self.collection.id, False)
+        self.collection.refresh_from_db()
+        self.assertFalse(self.collection.propagating)
+        self.assertEqual(self.privacy(), ([False] * 3, [False] * 4, False))
+    
+
+    @override_settings(PRIVACY_PROPAGATION_TASK_THRESHOLD=2)
+    def test_overlapping_propagations(self):
+        for private in [False, True]:
+            form = CollectionForm(
+                {"name": "collection", "private": private}, instance=self.collection
+            )
+            self.assertTrue(form.is_valid())
+            form.save()
+        propagate_privacy(self.collection.id, False)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.propagating, 1)
+        self.assertEqual(self.privacy(), ([True] * 3, [True] * 4, True))
+        self.collection.name = "new name"
+        self.collection.save()
+        with patch("core.responses.responses_changed") as responses_changed:
+            propagate_privacy(self.collection.id, False)
+        self.assertTrue(responses_changed.called)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.propagating, 0)
+    
+
+    def test_sample_privacy_propagates(self):
+        propagate_sample_privacy(self.samples[0].id, False)
+        self.assertFalse(Job.objects.get(id=self.jobs[0].id).private)
+        self.assertTrue(Job.objects.get(id=self.jobs[1].id).private)
+        self.assertFalse(DataLink.objects.get(id=self.link.id).private)
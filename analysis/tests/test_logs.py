@@ -0,0 +1,78 @@
+import os
+import tempfile
+from types import SimpleNamespace
+from django.test import TestCase, override_settings
+from analysis.logs import *
+from analysis.queries import ExecutionType
+
+class LogChunkTests(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.execution = SimpleNamespace(id=123)
+        os.mkdir(os.path.join(self.dir.name, "123"))
+        self.settings = override_settings(NEXTFLOW_DATA_ROOT=self.dir.name, LOG_CHUNK_SIZE=8)
+        self.settings.enable()
+    
+
+    def tearDown(self):
+        self.settings.disable()
+        self.dir.cleanup()
+    
+
+    def write_log(self, text):
+        with open(get_log_path(self.execution), "w") as f:
+            f.write(text)
+    
+
+    def test_missing_logs(self):
+        self.assertIsNone(get_log_size(self.execution))
+        self.assertIsNone(read_log_chunk(self.execution))
+    
+
+    def test_log_can_be_read_in_chunks(self):
+        self.write_log("line one\nline two\n")
+        self.assertEqual(get_log_size(self.execution), 18)
+        self.assertEqual(read_log_chunk(self.execution, 0, 5), {
+            "text": "line ", "offset": 0, "next_offset": 5, "size": 18
+        })
+        chunk = read_log_chunk(self.execution, 5)
+        self.assertEqual(chunk["text"], "one\nline")
+        self.assertEqual(chunk["next_offset"], 13)
+        self.assertEqual(read_log_chunk(self.execution, 13)["text"], " two\n")
+        self.assertEqual(read_log_chunk(self.execution, 18)["text"], "")
+        self.assertEqual(read_log_chunk(self.execution, 100)["offset"], 18)
+    
+
+    def test_negative_offsets_read_the_tail(self):
+        self.write_log("line one\nline two\n")
+        self.assertEqual(read_log_chunk(self.execution, -4)["text"], "two\n")
+        self.assertEqual(read_log_chunk(self.execution, -100, 4)["text"], "line")
+    
+
+    def test_characters_are_not_split(self):
+        chunk = slice_text_chunk("abécd", 0, 3)
+        self.assertEqual(chunk["text"], "ab")
+        self.assertEqual(chunk["next_offset"], 2)
+        chunk = slice_text_chunk("abécd", 2, 3)
+        self.assertEqual(chunk["text"], "éc")
+        self.assertEqual(chunk["size"], 6)
+        self.assertEqual(slice_text_chunk(None)["text"], "")
+    
+
+    def test_chunks_do_not_start_inside_characters(self):
+        self.write_log("ab€€")
+        chunk = read_log_chunk(self.execution, -4)
+        self.assertEqual(chunk["text"], "€")
+        self.assertEqual(chunk["offset"], 5)
+        self.assertEqual(read_log_chunk(self.execution, 3)["text"], "€")
+        chunk = slice_text_chunk("ab€€", -5)
+        self.assertEqual((chunk["text"], chunk["offset"]), ("€", 5))
+        self.assertNotIn("\ufffd", slice_text_chunk("ab€€", -2, 1)["text"])
+    
+
+    def test_null_offsets_read_from_the_start(self):
+        job = SimpleNamespace(execution=SimpleNamespace(stdout="line one", stderr=""))
+        chunk = ExecutionType.resolve_stdout_chunk(job, None, offset=None)
+        self.assertEqual(chunk["text"], "line one")
+        self.assertEqual(ExecutionType.resolve_stderr_chunk(job, None, offset=None)["size"], 0)
@@ -0,0 +1,68 @@
+import json
+from django.db import connection
+from django.test import TestCase
+from analysis.models import Sample, filter_samples_by_meta
+
+class SampleMetaFilterTests(TestCase):
+
+    def setUp(self):
+        self.s1 = Sample.objects.create(private=False, meta={
+            "Sequencer": "NextSeq", "5' Barcode": "NNNCAGN", "Replicate": 1
+        })
+        self.s2 = Sample.objects.create(private=False, meta={
+            "Sequencer": "HiSeq", "5' Barcode": "NNNCAGN", "Replicate": 2
+        })
+        self.s3 = Sample.objects.create(private=False, meta={})
+        self.s4 = Sample.objects.create(private=False, meta={
+            'Antibody "clone"': "4F4", "Stranded": True, "Notes": None, "Replicate": 1.0
+        })
+    
+
+    def filter(self, meta):
+        return set(filter_samples_by_meta(Sample.objects.all(), meta))
+    
+
+    def test_meta_is_stored_as_json(self):
+        self.assertEqual(Sample.objects.get(id=self.s1.id).meta["Replicate"], 1)
+    
+
+    def test_filtering_by_meta(self):
+        self.assertEqual(self.filter({"Sequencer": "NextSeq"}), {self.s1})
+        self.assertEqual(self.filter({"5' Barcode": "NNNCAGN"}), {self.s1, self.s2})
+        self.assertEqual(self.filter({"5' Barcode": "NNNCAGN", "Replicate": 2}), {self.s2})
+        self.assertEqual(self.filter({"Sequencer": "MiSeq"}), set())
+        self.assertEqual(self.filter({}), {self.s1, self.s2, self.s3, self.s4})
+    
+
+    def test_filtering_matches_json_types(self):
+        self.assertEqual(self.filter({'Antibody "clone"': "4F4"}), {self.s4})
+        self.assertEqual(self.filter({'Antibody "clone"': "4F5"}), set())
+        self.assertEqual(self.filter({"Stranded": True}), {self.s4})
+        self.assertEqual(self.filter({"Stranded": 1}), set())
+        self.assertEqual(self.filter({"Replicate": 1}), {self.s1, self.s4})
+        self.assertEqual(self.filter({"Replicate": "1"}), set())
+        self.assertEqual(self.filter({"Notes": None}), {self.s4})
+    
+
+    def test_indexes_are_used(self):
+        samples = filter_samples_by_meta(Sample.objects.all(), {"5' Barcode": "NNNCAGN"})
+        if connection.vendor == "sqlite":
+            self.assertIn("samples_meta_5__barcode", samples.explain())
+    
+
+    def test_search_samples_meta_argument(self):
+        response = self.client.post("/graphql", json.dumps({
+            "query": "query($meta: GenericScalar) { searchSamples(meta: $meta) { edges { node { id meta } } } }",
+            "variables": {"meta": {"Sequencer": "HiSeq"}}
+        }), content_type="application/json")
+        edges = response.json()["data"]["searchSamples"]["edges"]
+        self.assertEqual([e["node"]["id"] for e in edges], [str(self.s2.id)])
+        self.assertEqual(json.loads(edges[0]["node"]["meta"])["Replicate"], 2)
+    
+
+    def test_search_samples_rejects_nested_values(self):
+        response = self.client.post("/graphql", json.dumps({
+            "query": "query($meta: GenericScalar) { searchSamples(meta: $meta) { edges { node { id } } } }",
+            "variables": {"meta": {"Sequencer": ["HiSeq"]}}
+        }), content_type="application/json")
+        self.assertIn("Values must be", response.json()["errors"][0]["message"])
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+class CoreConfig(AppConfig):
+    name = "core"
+
+    def ready(self):
+        import core.signals
@@ -0,0 +1,329 @@
+"""Tools for measuring what the permission system costs at scale. A database
+is filled with a synthetic but realistic spread of users, groups, collections,
+samples, jobs and data files, and then each permission function and the main
+search resolvers are timed and have their queries counted. The results are
+returned as plain dicts so that they can be written out as JSON and compared
+with an earlier run."""
+
+import time
+import random
+import statistics
+from types import SimpleNamespace
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django_nextflow.models import Pipeline, Execution, ProcessExecution
+from core.models import User, Group, UserGroupLink
+from core.loaders import PermissionCache
+from core import permissions
+from core.search import rebuild_search_index
+from analysis.models import Collection, CollectionUserLink, CollectionGroupLink, Sample, SampleUserLink, Job, JobUserLink, Data, DataLink, DataUserLink
+
+SCALES = {
+    "tiny": {"users": 20, "groups": 4, "collections": 10, "samples": 40, "data": 200},
+    "small": {"users": 500, "groups": 25, "collections": 250, "samples": 10000, "data": 50000},
+    "medium": {"users": 2000, "groups": 100, "collections": 1000, "samples": 40000, "data": 200000},
+    "large": {"users": 10000, "groups": 500, "collections": 5000, "samples": 200000, "data": 1000000},
+}
+
+DATA_PER_JOB = 5
+
+def bulk_create(model, objects, batch_size=5000):
+    """Creates objects in batches, without sending any signals."""
+
+    for start in range(0, len(objects), batch_size):
+        model.objects.bulk_create(objects[start:start + batch_size])
+
+
+def seed_benchmark_data(users, groups, collections, samples, data, seed=0):
+    """Fills an empty database with the number of objects given, and builds the
+    effective permission table for them.
+
+    Most users belong to a group or two, and most collections have an owner,
+    a couple of other users and sometimes a group. Roughly one in five
+    collections and one in ten samples are public, and a small fraction of
+    samples, jobs and data files have their own user links. Each job produces
+    a handful of data files, and one data file in ten is an upload with no
+    job. Returns the time taken in seconds for each stage."""
+
+    rng = random.Random(seed)
+    timings = {}
+    started = time.perf_counter()
+    bulk_create(User, [User(
+        id=n, username=f"user{n}", email=f"user{n}@example.com", name=f"User {n}"
+    ) for n in range(1, users + 1)])
+    bulk_create(Group, [Group(
+        id=n, slug=f"group{n}", name=f"Group {n}", description=""
+    ) for n in range(1, groups + 1)])
+    bulk_create(UserGroupLink, [UserGroupLink(
+        user_id=user_id, group_id=group_id, permission=rng.choice([1, 2, 2, 2, 3])
+    ) for user_id in range(1, users + 1) for group_id in set(
+        rng.randint(1, groups) for _ in range(rng.randint(0, 3))
+    )] if groups else [])
+    timings["users"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    bulk_create(Collection, [Collection(
+        name=f"Collection {n}", private=rng.random() > 0.2
+    ) for n in range(collections)])
+    collection_ids = list(Collection.objects.values_list("id", flat=True))
+    user_links, group_links = [], []
+    for collection_id in collection_ids:
+        for user_id, permission in zip(
+            rng.sample(range(1, users + 1), min(users, 3)), [4, 2, 1]
+        ):
+            user_links.append(CollectionUserLink(
+                collection_id=collection_id, user_id=user_id, permission=permission
+            ))
+        if groups and rng.random() < 0.3:
+            group_links.append(CollectionGroupLink(
+                collection_id=collection_id, group_id=rng.randint(1, groups),
+                permission=rng.randint(1, 3)
+            ))
+    bulk_create(CollectionUserLink, user_links)
+    bulk_create(CollectionGroupLink, group_links)
+    timings["collections"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    bulk_create(Sample, [Sample(
+        name=f"Sample {n}", private=rng.random() > 0.1, method="", source="",
+        qc_message="", collection_id=rng.choice(collection_ids)
+        if collection_ids and rng.random() > 0.1 else None
+    ) for n in range(samples)])
+    sample_ids = list(Sample.objects.values_list("id", flat=True))
+    bulk_create(SampleUserLink, [SampleUserLink(
+        sample_id=sample_id, user_id=rng.randint(1, users), permission=rng.randint(1, 3)
+    ) for sample_id in sample_ids if users and rng.random() < 0.05])
+    timings["samples"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pipeline = Pipeline.objects.create(
+        name="Benchmark", description="", path="", schema_path="", config_path=""
+    )
+    job_count = (data - data // 10) // DATA_PER_JOB
+    bulk_create(Execution, [Execution(
+        identifier=f"exec{n}", stdout="", stderr="", exit_code=0, status="OK",
+        command="", started=0, duration=0, pipeline=pipeline
+    ) for n in range(job_count)])
+    execution_ids = list(Execution.objects.values_list("id", flat=True))
+    bulk_create(ProcessExecution, [ProcessExecution(
+        name="process", process_name="process", identifier=f"proc{n}",
+        status="OK", stdout="", stderr="", started=0, duration=0,
+        execution_id=execution_id
+    ) for n, execution_id in enumerate(execution_ids)])
+    jobs = []
+    for execution_id in execution_ids:
+        sample_id = rng.choice(sample_ids) if sample_ids and rng.random() < 0.8 else None
+        jobs.append(Job(
+            execution_id=execution_id, sample_id=sample_id, private=rng.random() > 0.1,
+            collection_id=None if sample_id or not collection_ids else rng.choice(collection_ids)
+        ))
+    bulk_create(Job, jobs)
+    jobs = list(Job.objects.values_list("id", "execution", "sample", "collection"))
+    bulk_create(JobUserLink, [JobUserLink(
+        job_id=job[0], user_id=rng.randint(1, users), permission=rng.randint(1, 3)
+    ) for job in jobs if users and rng.random() < 0.02])
+    timings["jobs"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    process_executions = dict(ProcessExecution.objects.values_list("execution", "id"))
+    sample_collections = dict(Sample.objects.values_list("id", "collection"))
+    files, links = [], []
+    for n in range(data):
+        job = jobs[n // DATA_PER_JOB] if n // DATA_PER_JOB < len(jobs) else None
+        filetype = rng.choice(["fq.gz", "bam", "bed", "tsv"])
+        files.append(Data(
+            filename=f"file{n}.{filetype}", filetype=filetype, size=rng.randint(1, 10 ** 9),
+            upstream_process_execution_id=process_executions[job[1]] if job else None
+        ))
+    bulk_create(Data, files)
+    for n, data_id in enumerate(Data.objects.order_by("id").values_list("id", flat=True)):
+        job = jobs[n // DATA_PER_JOB] if n // DATA_PER_JOB < len(jobs) else None
+        collection_id = None if job or not collection_ids else rng.choice(collection_ids)
+        effective_collection_id = collection_id
+        if job:
+            effective_collection_id = sample_collections.get(job[2]) or job[3]
+        links.append(DataLink(
+            data_id=data_id, private=rng.random() > 0.05, collection_id=collection_id,
+            job_id=job[0] if job else None, sample_id=job[2] if job else None,
+            effective_collection_id=effective_collection_id
+        ))
+    bulk_create(DataLink, links)
+    bulk_create(DataUserLink, [DataUserLink(
+        data_id=link.data_id, user_id=rng.randint(1, users), permission=rng.randint(1, 3)
+    ) for link in links if users and rng.random() < 0.01])
+    timings["data"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    permissions.rebuild_effective_permissions()
+    timings["effective_permissions"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    rebuild_search_index()
+    timings["search_index"] = time.perf_counter() - started
+    return timings
+
+
+def measure(func, repeat=5):
+    """Calls a function several times, and reports how long it took and how
+    many queries it made. Querysets are evaluated so that their queries are
+    counted."""
+
+    times = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            result = func()
+            if hasattr(result, "query"): list(result)
+            times.append(time.perf_counter() - started)
+    return {
+        "queries": len(context.captured_queries), "repeat": repeat,
+        "mean_ms": round(statistics.mean(times) * 1000, 3),
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "min_ms": round(min(times) * 1000, 3),
+        "max_ms": round(max(times) * 1000, 3),
+    }
+
+
+def get_benchmark_subjects(seed=0):
+    """Picks the objects the benchmarks are run against - the user with the
+    most collection links, a group, and a private object of each type that
+    the user can see."""
+
+    rng = random.Random(seed)
+    user = User.objects.filter(id__in=CollectionUserLink.objects.values("user").annotate(
+        count=Count("id")
+    ).order_by("-count").values("user")[:1]).first() or User.objects.first()
+    subjects = {"user": user, "group": Group.objects.order_by("?").first()}
+    for name, model in [["collection", Collection], ["sample", Sample], ["job", Job], ["data", Data]]:
+        ids = permissions.get_effective_ids(user, name)
+        subjects[name] = model.objects.filter(id__in=ids).order_by("id").first() or\
+            model.objects.order_by("id").first()
+    subjects["objects"] = [[name, id] for name, model in [
+        ["collection", Collection], ["sample", Sample], ["job", Job], ["data", Data]
+    ] for id in model.objects.order_by("id").values_list("id", flat=True)[:rng.randint(50, 100)]]
+    return subjects
+
+
+def get_permission_benchmarks(subjects):
+    """Gets a callable for every public function in core.permissions, called
+    with the benchmark subjects."""
+
+    user, group = subjects["user"], subjects["group"]
+    collection, sample = subjects["collection"], subjects["sample"]
+    job, data = subjects["job"], subjects["data"]
+    p = permissions
+    return {
+        "get_groups_by_user": lambda: p.get_groups_by_user(user, 2, exact=False),
+        "get_users_by_group": lambda: p.get_users_by_group(group, 2, exact=False),
+        "get_collections_by_user": lambda: p.get_collections_by_user(user, 1, exact=False),
+        "get_users_by_collection": lambda: p.get_users_by_collection(collection, 1, exact=False),
+        "get_collections_by_group": lambda: p.get_collections_by_group(group, 1, exact=False),
+        "get_groups_by_collection": lambda: p.get_groups_by_collection(collection, 1, exact=False),
+        "get_samples_by_user": lambda: p.get_samples_by_user(user, 1, exact=False),
+        "get_users_by_sample": lambda: p.get_users_by_sample(sample, 1, exact=False),
+        "get_jobs_by_user": lambda: p.get_jobs_by_user(user, 1, exact=False),
+        "get_users_by_job": lambda: p.get_users_by_job(job, 1, exact=False),
+        "get_data_by_user": lambda: p.get_data_by_user(user, 1, exact=False),
+        "get_users_by_data": lambda: p.get_users_by_data(data, 1, exact=False),
+        "get_effective_ids": lambda: p.get_effective_ids(user, "sample"),
+        "get_accessible_collection_stamp": lambda: p.get_accessible_collection_stamp(user),
+        "get_accessible_collection_ids": lambda: p.get_accessible_collection_ids(user),
+        "get_accessible_collection_filter": lambda: p.get_accessible_collection_filter(user),
+        "get_effective_levels": lambda: p.get_effective_levels(user, "sample", [
+            id for object_type, id in subjects["objects"] if object_type == "sample"
+        ]),
+        "is_collection_public": lambda: p.is_collection_public(collection),
+        "is_sample_public": lambda: p.is_sample_public(sample),
+        "is_job_public": lambda: p.is_job_public(job),
+        "is_data_public": lambda: p.is_data_public(data),
+        "get_permission_level": lambda: p.get_permission_level(user, data),
+        "does_user_have_permission_on_collection": lambda: p.does_user_have_permission_on_collection(user, collection, 1),
+        "does_user_have_permission_on_sample": lambda: p.does_user_have_permission_on_sample(user, sample, 1),
+        "does_user_have_permission_on_job": lambda: p.does_user_have_permission_on_job(user, job, 1),
+        "does_user_have_permission_on_data": lambda: p.does_user_have_permission_on_data(user, data, 1),
+        "readable_collections": lambda: p.readable_collections(Collection.objects.all(), user)[:25],
+        "readable_samples": lambda: p.readable_samples(Sample.objects.all(), user)[:25],
+        "readable_jobs": lambda: p.readable_jobs(Job.objects.all(), user)[:25],
+        "readable_data": lambda: p.readable_data(Data.objects.all(), user)[:25],
+        "readable_collections_count": lambda: p.readable_collections(Collection.objects.all(), user).count(),
+        "readable_samples_count": lambda: p.readable_samples(Sample.objects.all(), user).count(),
+        "readable_jobs_count": lambda: p.readable_jobs(Job.objects.all(), user).count(),
+        "readable_data_count": lambda: p.readable_data(Data.objects.all(), user).count(),
+        "get_permission_levels": lambda: p.get_permission_levels(user, subjects["objects"]),
+        "calculate_collection_levels": lambda: p.calculate_collection_levels([collection.id]),
+        "calculate_sample_levels": lambda: p.calculate_sample_levels([sample.id]),
+        "calculate_job_levels": lambda: p.calculate_job_levels([job.id]),
+        "calculate_data_levels": lambda: p.calculate_data_levels([data.id]),
+        "refresh_effective_permissions": lambda: p.refresh_effective_permissions(collections=[collection.id]),
+        "find_effective_permission_errors": p.find_effective_permission_errors,
+        "rebuild_effective_permissions": p.rebuild_effective_permissions,
+    }
+
+
+RESOLVER_QUERIES = {
+    "searchCollections": """{ searchCollections(first: 25) { edges { node {
+        id name sampleCount isOwner canShare canEdit
+    } } } }""",
+    "searchSamples": """{ searchSamples(first: 25) { edges { node {
+        id name isOwner canShare canEdit
+    } } } }""",
+    "searchExecutions": """{ searchExecutions(first: 25) { edges { node {
+        id isOwner canShare canEdit
+    } } } }""",
+    "searchData": """{ searchData(first: 25) { edges { node {
+        id filename isOwner canShare canEdit
+    } } } }""",
+    "quickSearch": """{ quickSearch(query: "Sam") {
+        collections { id } samples { id } executions { id } data { id }
+    } }""",
+    "userCollections": """{ userCollections { id name } }""",
+}
+
+def get_resolver_benchmarks(subjects, anonymous=False):
+    """Gets a callable for each of the main search queries, run as the
+    benchmark user (or as nobody) with a fresh request context each time."""
+
+    from core.schema import schema
+    user = None if anonymous else subjects["user"]
+
+    def run(query):
+        context = SimpleNamespace(user=user, COOKIES={}, permission_cache=PermissionCache())
+        result = schema.execute(query, context_value=context)
+        if result.errors: raise result.errors[0]
+
+    return {name: (lambda query=query: run(query)) for name, query in RESOLVER_QUERIES.items()}
+
+
+def run_benchmarks(repeat=5, seed=0):
+    """Runs every benchmark against the data in the database and returns a
+    list of results."""
+
+    subjects = get_benchmark_subjects(seed)
+    results = []
+    for group, benchmarks in [
+        ["permissions", get_permission_benchmarks(subjects)],
+        ["resolvers", get_resolver_benchmarks(subjects)],
+        ["anonymous_resolvers", get_resolver_benchmarks(subjects, anonymous=True)],
+    ]:
+        for name, func in benchmarks.items():
+            results.append({"group": group, "name": name, **measure(func, repeat)})
+    return results
+
+
+def compare_reports(report, baseline, tolerance=0.25):
+    """Compares the results of a benchmark report with an earlier one, and
+    returns a description of every benchmark which now makes more queries, or
+    whose median time has grown by more than the tolerance given."""
+
+    previous = {(r["group"], r["name"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get((result["group"], result["name"]))
+        if not old: continue
+        name = f"{result['group']}.{result['name']}"
+        if result["queries"] > old["queries"]:
+            regressions.append(f"{name}: {old['queries']} -> {result['queries']} queries")
+        if result["median_ms"] > old["median_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: {old['median_ms']} -> {result['median_ms']} ms")
+    return regressions
@@ -0,0 +1,135 @@
+"""Static analysis of how expensive a GraphQL query will be to run, done on the
+parsed document before anything is executed.
+
+Every field which returns an object costs one, and scalars are free unless
+they are known to be expensive. Anything beneath a list is multiplied by the
+number of items the list can return - the first or last argument of the
+connection or list if one is given, and a default size otherwise. Depth is the
+deepest chain of nested object fields. Introspection fields are not counted."""
+
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull
+from graphql.type.definition import GraphQLObjectType, GraphQLInterfaceType
+
+DEFAULT_LIST_SIZE = 50
+
+FIELD_COSTS = {
+    "ExecutionType.log": 10,
+    "Query.checkAnnotation": 10,
+}
+
+def get_argument(field_ast, name, variables):
+    """Gets the integer value of an argument to a field, whether it was given
+    directly or as a variable."""
+
+    for argument in field_ast.arguments or []:
+        if argument.name.value == name:
+            value = argument.value
+            if isinstance(value, ast.Variable):
+                value = (variables or {}).get(value.name.value)
+            elif isinstance(value, ast.IntValue):
+                value = int(value.value)
+            else: return None
+            return value if isinstance(value, int) and value >= 0 else None
+
+
+def unwrap_type(field_type):
+    """Strips NonNull and List wrappers from a field's type, returning the named
+    type and whether there was a list among the wrappers."""
+
+    is_list = False
+    while isinstance(field_type, (GraphQLList, GraphQLNonNull)):
+        is_list = is_list or isinstance(field_type, GraphQLList)
+        field_type = field_type.of_type
+    return field_type, is_list
+
+
+class QueryCostAnalyzer:
+    """Walks a query document working out its cost and depth."""
+
+    def __init__(self, schema, document, variables=None):
+        self.schema = schema
+        self.variables = variables or {}
+        self.operations = [d for d in document.definitions if isinstance(d, ast.OperationDefinition)]
+        self.fragments = {d.name.value: d for d in document.definitions
+            if isinstance(d, ast.FragmentDefinition)}
+    
+
+    def get_operation(self, operation_name=None):
+        for operation in self.operations:
+            if operation_name is None or (operation.name and operation.name.value == operation_name):
+                return operation
+    
+
+    def analyse(self, operation_name=None):
+        """Returns the cost and depth of the operation to be run."""
+
+        operation = self.get_operation(operation_name)
+        if not operation: return 0, 0
+        root = {
+            "query": self.schema.get_query_type,
+            "mutation": self.schema.get_mutation_type,
+            "subscription": self.schema.get_subscription_type,
+        }[operation.operation]()
+        if not root: return 0, 0
+        return self.selection_cost(root, operation.selection_set, None, set())
+    
+
+    def get_fields(self, parent_type, selection_set, visited):
+        """Gets the field ASTs beneath a selection set with the types they are
+        selected on, expanding fragments."""
+
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                yield parent_type, selection
+                continue
+            if isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                if name in visited or name not in self.fragments: continue
+                fragment = self.fragments[name]
+                visited = visited | {name}
+            else: fragment = selection
+            fragment_type = parent_type
+            if fragment.type_condition:
+                fragment_type = self.schema.get_type(fragment.type_condition.name.value) or parent_type
+            yield from self.get_fields(fragment_type, fragment.selection_set, visited)
+    
+
+    def selection_cost(self, parent_type, selection_set, page_size, visited):
+        """Works out the cost and depth of a selection set. If the selection is
+        beneath a connection, its page size is applied to the list of edges."""
+
+        cost, depth = 0, 0
+        for selection_type, field_ast in self.get_fields(parent_type, selection_set, visited):
+            name = field_ast.name.value
+            if name.startswith("__"): continue
+            if not isinstance(selection_type, (GraphQLObjectType, GraphQLInterfaceType)): continue
+            field = selection_type.fields.get(name)
+            if not field: continue
+            field_type, is_list = unwrap_type(field.type)
+            own = FIELD_COSTS.get(f"{selection_type.name}.{name}", 0)
+            first = get_argument(field_ast, "first", self.variables)
+            last = get_argument(field_ast, "last", self.variables)
+            size = first if first is not None else last
+            multiplier = 1
+            if is_list:
+                multiplier = size if size is not None else (
+                    page_size if page_size is not None else DEFAULT_LIST_SIZE
+                )
+            field_cost, field_depth = own, 0
+            if field_ast.selection_set:
+                children_cost, children_depth = self.selection_cost(
+                    field_type, field_ast.selection_set,
+                    None if is_list else size, visited
+                )
+                field_cost, field_depth = own + 1 + children_cost, children_depth + 1
+            cost += multiplier * field_cost
+            depth = max(depth, field_depth)
+        return cost, depth
+
+
+
+def get_query_cost(schema, document, variables=None, operation_name=None):
+    """Gets the cost and depth of a parsed query document."""
+
+    return QueryCostAnalyzer(schema, document, variables).analyse(operation_name)
@@ -0,0 +1,97 @@
+"""Parsed and validated GraphQL documents, cached per process and keyed by the
+sha256 hash of their text, so that the same query sent again and again is only
+parsed and validated once.
+
+This is also what makes persisted queries work: clients can send just the hash
+of a query the server has already seen (or has had registered in advance), and
+in allow-list mode only registered queries can be run at all."""
+
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache, partial
+from django.conf import settings
+from graphql import parse, validate
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.backend.base import GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+
+DOCUMENTS = OrderedDict()
+DOCUMENTS_LOCK = threading.Lock()
+
+def get_query_hash(query):
+    """Gets the sha256 hash of a query's text, as a hex string."""
+
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def get_registered_queries():
+    """Gets the queries registered in the persisted queries file, keyed by their
+    hashes. The file is JSON mapping hashes to query text - the same format
+    frontend build tools produce for persisted query manifests. Entries whose
+    hashes don't match their text are ignored."""
+
+    if not settings.PERSISTED_QUERIES_FILE: return {}
+    with open(settings.PERSISTED_QUERIES_FILE) as f:
+        queries = json.load(f)
+    return {h: q for h, q in queries.items() if get_query_hash(q) == h}
+
+
+def get_cached_document(query_hash):
+    """Gets the cached document with the given hash if there is one, marking it
+    as recently used."""
+
+    with DOCUMENTS_LOCK:
+        if query_hash in DOCUMENTS:
+            DOCUMENTS.move_to_end(query_hash)
+            return DOCUMENTS[query_hash]
+
+
+def execute_document(schema, document_ast, errors, *args, **kwargs):
+    """Executes an already validated document, or returns its validation errors
+    if it isn't valid."""
+
+    if errors: return ExecutionResult(errors=errors, invalid=True)
+    kwargs.pop("validate", None)
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+def get_document(schema, query, query_hash=None):
+    """Gets the parsed and validated document for a query, parsing and
+    validating it only if it isn't already cached. Documents which fail
+    validation are cached along with their errors, but documents which can't be
+    parsed aren't cached at all."""
+
+    query_hash = query_hash or get_query_hash(query)
+    document = get_cached_document(query_hash)
+    if document: return document
+    document_ast = parse(query)
+    errors = validate(schema, document_ast)
+    document = GraphQLDocument(
+        schema=schema, document_string=query, document_ast=document_ast,
+        execute=partial(execute_document, schema, document_ast, errors)
+    )
+    with DOCUMENTS_LOCK:
+        DOCUMENTS[query_hash] = document
+        while len(DOCUMENTS) > settings.QUERY_CACHE_SIZE:
+            DOCUMENTS.popitem(last=False)
+    return document
+
+
+def get_persisted_query(query_hash):
+    """Gets the text of a query from its hash, if it has been registered or has
+    been seen recently."""
+
+    document = get_cached_document(query_hash)
+    if document: return document.document_string
+    return get_registered_queries().get(query_hash)
+
+
+
+class CachedGraphQLBackend(GraphQLCoreBackend):
+    """A GraphQL backend which gets documents from the per-process cache."""
+
+    def document_from_string(self, schema, document_string):
+        return get_document(schema, document_string)
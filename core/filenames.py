@@ -0,0 +1,188 @@
+"""Substring search over data files' names, which users look files up by
+fragments of - barcodes, sample IDs and so on. A plain LIKE '%...%' can't use
+an ordinary index, so has to scan every file.
+
+On PostgreSQL the filename column has pg_trgm GIN indexes (one on the name and
+one on its upper case form, for case-insensitive matching), which the
+contains and icontains lookups use directly. Elsewhere a trigram index of
+every filename is kept in memory, per process, and candidates from it are
+checked against the names it holds.
+
+The index is updated in place rather than rebuilt: files this process saves
+or deletes are updated straight away, and files added or removed by other
+processes (celery workers, for instance) are noticed from the number of files
+and the highest file ID, read at most every FILENAME_INDEX_CHECK_INTERVAL
+seconds. Files renamed by other processes aren't noticed that way, so the
+whole index is also rebuilt once it is FILENAME_INDEX_MAX_AGE seconds old."""
+
+import json
+import time
+import threading
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Value
+from django.db.models.functions import StrIndex
+from django.db.models.expressions import RawSQL
+from django_nextflow.models import Data
+
+MAX_CANDIDATES = 10000
+
+def get_ngrams(text, n=3):
+    """Gets the set of lower case n-grams of some text."""
+
+    text = text.lower()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+
+class NgramIndex:
+    """An in-memory index from each trigram to the IDs of the names which
+    contain it."""
+
+    def __init__(self, names):
+        self.names = dict(names)
+        self.postings = {}
+        for id, name in self.names.items():
+            for ngram in get_ngrams(name or ""):
+                self.postings.setdefault(ngram, set()).add(id)
+    
+
+    def add(self, id, name):
+        """Adds a name to the index, replacing any it already has with that
+        ID."""
+
+        self.remove(id)
+        self.names[id] = name
+        for ngram in get_ngrams(name or ""):
+            self.postings.setdefault(ngram, set()).add(id)
+    
+
+    def remove(self, id):
+        """Removes a name from the index, if it is there."""
+
+        if id not in self.names: return
+        for ngram in get_ngrams(self.names.pop(id) or ""):
+            self.postings[ngram].discard(id)
+            if not self.postings[ngram]: del self.postings[ngram]
+
+
+    def search(self, fragment, case_sensitive=False):
+        """Gets the IDs of the names containing the fragment. The postings of
+        its trigrams are intersected smallest first, and what's left is
+        checked against the names themselves."""
+
+        postings = sorted(
+            (self.postings.get(ngram, set()) for ngram in get_ngrams(fragment)), key=len
+        )
+        if not postings: return None
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates: break
+            candidates &= posting
+        if case_sensitive:
+            return [id for id in candidates if fragment in (self.names[id] or "")]
+        fragment = fragment.lower()
+        return [id for id in candidates if fragment in (self.names[id] or "").lower()]
+
+
+
+FILENAME_INDEX = {"index": None, "last": None, "built": None, "checked": None}
+FILENAME_INDEX_LOCK = threading.Lock()
+
+def get_filenames_stamp():
+    """Gets the number of data files and the highest data file ID."""
+
+    stamp = Data.objects.aggregate(count=Count("id"), last=Max("id"))
+    return (stamp["count"], stamp["last"])
+
+
+def get_filename_index():
+    """Gets the in-memory trigram index of data filenames. It is built if it
+    doesn't exist or is too old, and otherwise brought up to date with files
+    added or removed elsewhere if they haven't been checked for recently."""
+
+    with FILENAME_INDEX_LOCK:
+        now = time.monotonic()
+        index = FILENAME_INDEX["index"]
+        if index is None or now - FILENAME_INDEX["built"] >= settings.FILENAME_INDEX_MAX_AGE:
+            last = Data.objects.aggregate(last=Max("id"))["last"]
+            index = NgramIndex(Data.objects.filter(id__lte=last or 0).values_list("id", "filename"))
+            FILENAME_INDEX.update(index=index, last=last, built=now, checked=now)
+        elif now - FILENAME_INDEX["checked"] >= settings.FILENAME_INDEX_CHECK_INTERVAL:
+            count, last = get_filenames_stamp()
+            if last != FILENAME_INDEX["last"]:
+                for id, name in Data.objects.filter(
+                    id__gt=FILENAME_INDEX["last"] or 0, id__lte=last or 0
+                ).values_list("id", "filename"):
+                    index.add(id, name)
+                FILENAME_INDEX["last"] = last
+            if count != len(index.names):
+                ids = set(Data.objects.filter(id__lte=last or 0).values_list("id", flat=True))
+                for id in set(index.names) - ids: index.remove(id)
+                missing = sorted(ids - set(index.names))
+                for start in range(0, len(missing), 500):
+                    for id, name in Data.objects.filter(
+                        id__in=missing[start:start + 500]
+                    ).values_list("id", "filename"):
+                        index.add(id, name)
+            FILENAME_INDEX["checked"] = now
+        return index
+
+
+def update_filename_index(ids):
+    """Updates the names of some data files in this process's index, as they
+    now are in the database - removing any which no longer exist."""
+
+    names = dict(Data.objects.filter(id__in=ids).values_list("id", "filename"))
+    with FILENAME_INDEX_LOCK:
+        index = FILENAME_INDEX["index"]
+        if index is None: return
+        for id in ids:
+            if id in names:
+                index.add(id, names[id])
+            else:
+                index.remove(id)
+
+
+def filenames_changed(ids=None):
+    """Updates this process's filename index after data files have been saved
+    or deleted. The index is updated now, so the current transaction sees its
+    own changes, and again once the transaction is committed. If the files
+    aren't known (after a bulk create, say) the index is instead checked for
+    added and removed files the next time it is used."""
+
+    if ids is None:
+        with FILENAME_INDEX_LOCK:
+            if FILENAME_INDEX["index"] is not None: FILENAME_INDEX["checked"] = float("-inf")
+        return
+    update_filename_index(ids)
+    transaction.on_commit(lambda: update_filename_index(ids))
+
+
+def match_filename(queryset, fragment, case_sensitive=False):
+    """Filters a data queryset with an ordinary substring match on the filename.
+    SQLite's LIKE ignores case, so case-sensitive matches there use INSTR."""
+
+    if case_sensitive and connection.vendor == "sqlite":
+        return queryset.alias(
+            filename_position=StrIndex("filename", Value(fragment))
+        ).filter(filename_position__gt=0)
+    lookup = "filename__contains" if case_sensitive else "filename__icontains"
+    return queryset.filter(**{lookup: fragment})
+
+
+def filter_by_filename(queryset, fragment, case_sensitive=False):
+    """Filters a data queryset to files whose names contain a fragment. Fragments
+    too short to have a trigram, or too common for the in-memory index to be
+    worth using, are matched with an ordinary substring match. On SQLite the matching IDs
+    are passed as one JSON array parameter and unpacked with json_each, as an
+    IN list of thousands of IDs could exceed its limit on query variables."""
+
+    if connection.vendor == "postgresql" or len(fragment) < 3:
+        return match_filename(queryset, fragment, case_sensitive)
+    ids = get_filename_index().search(fragment, case_sensitive)
+    if ids is None or len(ids) > MAX_CANDIDATES:
+        return match_filename(queryset, fragment, case_sensitive)
+    if connection.vendor == "sqlite":
+        return queryset.filter(id__in=RawSQL("SELECT value FROM json_each(%s)", [json.dumps(ids)]))
+    return queryset.filter(id__in=ids)
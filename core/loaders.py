@@ -0,0 +1,135 @@
+"""DataLoaders and memo caches which let every row on a page share the queries
+they need, rather than each row making its own. They live on the request, so
+nothing they cache outlives the request that created them."""
+
+from promise import Promise
+from promise.dataloader import DataLoader
+from core.permissions import get_effective_levels, get_permission_level, OBJECT_TYPES
+
+class PermissionLevelLoader(DataLoader):
+    """Loads the effective permission level a user has on objects of one type.
+    All the IDs requested while a page is being resolved are looked up in one
+    query."""
+
+    def __init__(self, user, object_type):
+        DataLoader.__init__(self)
+        self.user, self.object_type = user, object_type
+    
+
+    def batch_load_fn(self, ids):
+        levels = get_effective_levels(self.user, self.object_type, ids)
+        return Promise.resolve([levels.get(int(id), 0) for id in ids])
+
+
+
+class CollectionStatsLoader(DataLoader):
+    """Loads the cached counts of collections' contents. All the collections on
+    a page are looked up together, and any without cached counts are counted
+    together."""
+
+    def batch_load_fn(self, ids):
+        from analysis.models import get_collection_stats
+        stats = get_collection_stats([int(id) for id in ids])
+        return Promise.resolve([stats[int(id)] for id in ids])
+
+
+
+class PermissionCache:
+    """Memoizes the permission levels users have on objects for the length of
+    one request, along with the request's permission level loaders.
+
+    Anything which changes permissions part way through a request must call
+    invalidate with the object it changed, so that later lookups in the same
+    request see the change."""
+
+    DESCENDANTS = {
+        "collection": ["collection", "sample", "job", "data"],
+        "sample": ["sample", "job", "data"],
+        "job": ["job", "data"],
+        "data": ["data"],
+    }
+
+    def __init__(self):
+        self.levels = {}
+        self.loaders = {}
+    
+
+    def get_level(self, user, obj):
+        key = (user.id if user else None, OBJECT_TYPES[type(obj)], obj.id)
+        if key not in self.levels:
+            self.levels[key] = get_permission_level(user, obj)
+        return self.levels[key]
+    
+
+    def has_permission(self, user, obj, permission):
+        return self.get_level(user, obj) >= permission
+    
+
+    def get_loader(self, user, object_type):
+        key = (object_type, user.id if user else None)
+        if key not in self.loaders:
+            self.loaders[key] = PermissionLevelLoader(user, object_type)
+        return self.loaders[key]
+    
+
+    def invalidate(self, obj):
+        """Forgets everything cached about an object. Every cached level on an
+        object type which can inherit from it is forgotten too, as working out
+        which of those objects are its descendants would cost more than
+        looking them up again."""
+
+        object_type = OBJECT_TYPES[type(obj)]
+        affected = self.DESCENDANTS[object_type]
+        self.levels = {key: level for key, level in self.levels.items() if
+            key[1:] != (object_type, obj.id) and key[1] not in affected[1:]}
+        self.loaders = {key: loader for key, loader in self.loaders.items()
+            if key[0] not in affected}
+
+
+
+def get_permission_cache(info):
+    """Gets the request's permission cache, which the authentication middleware
+    normally attaches, creating it if the request doesn't have one."""
+
+    if not hasattr(info.context, "permission_cache"):
+        info.context.permission_cache = PermissionCache()
+    return info.context.permission_cache
+
+
+def get_collection_stats_loader(info):
+    """Gets the request's collection stats loader, creating it the first time it
+    is needed."""
+
+    if not hasattr(info.context, "collection_stats_loader"):
+        info.context.collection_stats_loader = CollectionStatsLoader()
+    return info.context.collection_stats_loader
+
+
+def get_permission_loader(info, object_type):
+    """Gets the request's permission level loader for an object type and the
+    current user, creating it the first time it is needed."""
+
+    return get_permission_cache(info).get_loader(info.context.user, object_type)
+
+
+def load_has_permission(info, object_type, object_id, permission):
+    """Returns a promise of whether the current user has a given permission
+    (or higher) on an object."""
+
+    return get_permission_loader(info, object_type).load(object_id).then(
+        lambda level: level >= permission
+    )
+
+
+def get_cached_permission_level(info, obj):
+    """Gets the current user's permission level on an object, looking it up at
+    most once per request."""
+
+    return get_permission_cache(info).get_level(info.context.user, obj)
+
+
+def has_cached_permission(info, obj, permission):
+    """Checks whether the current user has a given permission (or higher) on an
+    object, looking it up at most once per request."""
+
+    return get_permission_cache(info).has_permission(info.context.user, obj, permission)
@@ -0,0 +1,70 @@
+import json
+import time
+import platform
+import django
+from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import SCALES, seed_benchmark_data, run_benchmarks, compare_reports
+
+class Command(BaseCommand):
+    help = "Times the permission functions and search resolvers on synthetic data"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", choices=SCALES, default="small",
+            help="How much data to generate"
+        )
+        for name in SCALES["tiny"]:
+            parser.add_argument(
+                f"--{name}", type=int, help=f"Override the number of {name} generated"
+            )
+        parser.add_argument("--repeat", type=int, default=5, help="Times to run each benchmark")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the generated data")
+        parser.add_argument("--output", help="File to write the JSON report to, rather than stdout")
+        parser.add_argument("--compare", help="An earlier JSON report to check for regressions against")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.25,
+            help="How much slower (as a fraction) a benchmark can get before it is a regression"
+        )
+        parser.add_argument(
+            "--keepdb", action="store_true",
+            help="Keep the benchmark database, and reuse it if it is already populated"
+        )
+
+    def handle(self, *args, **options):
+        scale = {name: options[name] if options[name] is not None else count
+            for name, count in SCALES[options["scale"]].items()}
+
+        # The data is generated in a separate test database, never the real one
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            from core.models import User
+            seeding = {}
+            if not User.objects.exists():
+                self.stderr.write(f"Generating {scale}...")
+                seeding = seed_benchmark_data(**scale, seed=options["seed"])
+            self.stderr.write("Running benchmarks...")
+            report = {
+                "created": int(time.time()),
+                "environment": {
+                    "database": connection.vendor, "django": django.get_version(),
+                    "python": platform.python_version(),
+                },
+                "scale": scale, "seeding": seeding,
+                "results": run_benchmarks(options["repeat"], options["seed"]),
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f: f.write(output)
+        else:
+            self.stdout.write(output)
+        if options["compare"]:
+            with open(options["compare"]) as f: baseline = json.load(f)
+            regressions = compare_reports(report, baseline, options["tolerance"])
+            for regression in regressions: self.stderr.write(regression)
+            if regressions:
+                raise CommandError(f"{len(regressions)} benchmarks have regressed")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import EffectivePermission
+from core.permissions import rebuild_effective_permissions, find_effective_permission_errors
+
+class Command(BaseCommand):
+    help = "Rebuilds the effective permission table from the link tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only verify the existing table, without rebuilding it"
+        )
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            self.stdout.write("Rebuilding effective permissions...")
+            rebuild_effective_permissions()
+            self.stdout.write(f"There are {EffectivePermission.objects.count()} rows")
+        self.stdout.write("Verifying effective permissions...")
+        errors = find_effective_permission_errors()
+        for user_id, object_type, object_id, stored, expected in errors[:50]:
+            self.stdout.write(
+                f"User {user_id} on {object_type} {object_id}: "
+                f"stored {stored}, should be {expected}"
+            )
+        if errors:
+            raise CommandError(f"{len(errors)} effective permissions are wrong")
+        self.stdout.write("All effective permissions are correct")
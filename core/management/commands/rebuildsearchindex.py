@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.models import SearchEntry
+from core.search import rebuild_search_index
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index from the tables being searched"
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding search index...")
+        rebuild_search_index()
+        self.stdout.write(f"There are {SearchEntry.objects.count()} entries")
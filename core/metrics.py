@@ -0,0 +1,79 @@
+"""Histograms of how long each GraphQL resolver takes and how many SQL queries
+it makes, keyed by the resolver's path in the query (list indexes removed, so
+that every row of a page is counted under the same path).
+
+They are kept per process and exposed in the Prometheus text format at
+/metrics, which only answers requests from the addresses in
+METRICS_ALLOWED_IPS - each worker process should be scraped directly."""
+
+import threading
+from django.conf import settings
+from django.http import HttpResponse, Http404
+
+TIME_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 25, 50, 100]
+
+class Histogram:
+    """A cumulative histogram of observed values, with a running sum and
+    count, as Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum, self.count = 0, 0
+    
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound: self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+    
+
+    def render(self, name, labels):
+        lines = [f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+
+METRICS = {
+    "graphql_resolver_seconds": ("Time spent in each GraphQL resolver", TIME_BUCKETS, {}),
+    "graphql_resolver_queries": ("SQL queries made by each GraphQL resolver", QUERY_BUCKETS, {}),
+}
+METRICS_LOCK = threading.Lock()
+
+def record_resolver(path, seconds, queries):
+    """Records one call of the resolver at the path given."""
+
+    with METRICS_LOCK:
+        for name, value in [
+            ("graphql_resolver_seconds", seconds), ("graphql_resolver_queries", queries)
+        ]:
+            _, buckets, histograms = METRICS[name]
+            if path not in histograms: histograms[path] = Histogram(buckets)
+            histograms[path].observe(value)
+
+
+def render_metrics():
+    """Renders every histogram in the Prometheus text exposition format."""
+
+    lines = []
+    with METRICS_LOCK:
+        for name, (description, _, histograms) in METRICS.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+            for path, histogram in sorted(histograms.items()):
+                labels = 'path="{}"'.format(path.replace("\\", "\\\\").replace('"', '\\"'))
+                lines += histogram.render(name, labels)
+    return "\n".join(lines) + "\n"
+
+
+def metrics(request):
+    """Returns this process's metrics, to local scrapers only."""
+
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4")
@@ -1,13 +1,21 @@
 import jwt
 import time
 from datetime import datetime
+from functools import partial
 from django.conf import settings
+from django.db import connection
+from django.db.models import QuerySet
 from django.http import JsonResponse
+from graphene.types.resolver import dict_or_attr_resolver
+from graphql.type.definition import get_named_type, GraphQLScalarType, GraphQLEnumType
+from promise import Promise
 from .models import User
+from .loaders import PermissionCache
+from .metrics import record_resolver
 
 class AuthenticationMiddleware:
     """Incoming requests will be annotated with a User, or None, based on the
-    access token provided. Outgoing responses set a HTTP-only refresh token
+    access token provided, and with an empty permission cache. Outgoing responses set a HTTP-only refresh token
     cookie if the request has had one added to it at some point, or removed if
     it has been set to False."""
     
@@ -19,6 +27,7 @@ class AuthenticationMiddleware:
         request.user = User.from_token(
             request.META.get("HTTP_AUTHORIZATION", "").replace("Bearer ", "")
         )
+        request.permission_cache = PermissionCache()
 
         response = self.get_response(request)
 
@@ -32,4 +41,75 @@ class AuthenticationMiddleware:
                 "imaps_refresh_token", value=imaps_refresh_token, httponly=True,
                 max_age=settings.SESSION_LENGTH_DAYS * 86400
             )
-        return response
\ No newline at end of file
+        return response
+
+
+
+class ResolverMetricsMiddleware:
+    """A graphene middleware which times resolvers and counts the SQL queries
+    they make, recording them in the process's metrics under the resolver's
+    path, and totalling them on the request for the Server-Timing header.
+    Only the resolver's own synchronous work is measured - batched loads are
+    run later, outside of any one resolver. Querysets are evaluated here so
+    that their query is counted against the resolver returning them.
+
+    Fields returning scalars, and fields with no resolver of their own (which
+    just read an attribute), are passed straight through, as there is one of
+    them for every column of every row and measuring them would cost more
+    than they do."""
+
+    def is_measured(self, info):
+        if isinstance(get_named_type(info.return_type), (GraphQLScalarType, GraphQLEnumType)):
+            return False
+        resolver = info.parent_type.fields[info.field_name].resolver
+        return not (isinstance(resolver, partial) and resolver.func is dict_or_attr_resolver)
+    
+
+    def resolve(self, next, root, info, **kwargs):
+        if not self.is_measured(info): return next(root, info, **kwargs)
+        queries = [0]
+        def count_query(execute, *args):
+            queries[0] += 1
+            return execute(*args)
+        
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            result = next(root, info, **kwargs)
+            value = result.get() if isinstance(result, Promise) and result.is_fulfilled else result
+            if isinstance(value, QuerySet): value._fetch_all()
+        seconds = time.perf_counter() - start
+        path = ".".join(str(p) for p in info.path if not isinstance(p, int))
+        record_resolver(path, seconds, queries[0])
+        timings = getattr(info.context, "resolver_timings", None)
+        if timings is not None:
+            total = timings.setdefault(path, [0, 0])
+            total[0] += seconds
+            total[1] += queries[0]
+        return result
+
+
+
+class ServerTimingMiddleware:
+    """Adds a Server-Timing header to responses to admin users, giving the
+    total time and query count of the slowest resolver paths in the
+    request."""
+
+    MAX_ENTRIES = 20
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+
+    def __call__(self, request):
+        request.resolver_timings = {}
+        response = self.get_response(request)
+        user = getattr(request, "user", None)
+        if user and user.is_admin and request.resolver_timings:
+            slowest = sorted(
+                request.resolver_timings.items(), key=lambda t: t[1][0], reverse=True
+            )[:self.MAX_ENTRIES]
+            response["Server-Timing"] = ", ".join(
+                f'{path};dur={seconds * 1000:.2f};desc="{queries} queries"'
+                for path, (seconds, queries) in slowest
+            )
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 3.2 on 2026-10-18 05:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectivePermission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(choices=[['collection', 'collection'], ['sample', 'sample'], ['job', 'job'], ['data', 'data']], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('level', models.IntegerField(choices=[[1, 'access'], [2, 'edit'], [3, 'share'], [4, 'own']])),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='effective_permissions', to='core.user')),
+            ],
+            options={
+                'db_table': 'effective_permissions',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='effectivepermission',
+            index=models.Index(fields=['object_type', 'object_id'], name='effective_p_object__ae2e0c_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='effectivepermission',
+            unique_together={('user', 'object_type', 'object_id')},
+        ),
+    ]
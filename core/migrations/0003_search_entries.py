@@ -0,0 +1,89 @@
+# Generated by Django 3.2 on 2026-10-18 06:32
+
+import re
+from django.db import migrations, models
+
+SEARCH_FIELDS = {
+    "collection": ("analysis.Collection", ["name", "description"]),
+    "sample": ("analysis.Sample", ["name", "species__name", "species__latin_name"]),
+    "execution": ("analysis.Job", ["execution__pipeline__name"]),
+    "data": ("django_nextflow.Data", ["filename"]),
+    "group": ("core.Group", ["name", "description"]),
+    "user": ("core.User", ["name"]),
+}
+
+def get_document(values):
+    return " ".join(
+        word for value in values for word in re.split(r"[\W_]+", (value or "").lower()) if word
+    )
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "ALTER TABLE search_entries ADD COLUMN vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED"
+        )
+        schema_editor.execute(
+            "CREATE INDEX search_entries_vector ON search_entries USING gin (vector)"
+        )
+    elif schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE search_entries_fts USING fts5("
+            "document, content='search_entries', content_rowid='id')"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER search_entries_insert AFTER INSERT ON search_entries BEGIN "
+            "INSERT INTO search_entries_fts(rowid, document) VALUES (new.id, new.document); END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER search_entries_delete AFTER DELETE ON search_entries BEGIN "
+            "INSERT INTO search_entries_fts(search_entries_fts, rowid, document) "
+            "VALUES ('delete', old.id, old.document); END"
+        )
+        schema_editor.execute(
+            "CREATE TRIGGER search_entries_update AFTER UPDATE ON search_entries BEGIN "
+            "INSERT INTO search_entries_fts(search_entries_fts, rowid, document) "
+            "VALUES ('delete', old.id, old.document); "
+            "INSERT INTO search_entries_fts(rowid, document) VALUES (new.id, new.document); END"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE search_entries_fts")
+
+
+def populate_search_entries(apps, schema_editor):
+    SearchEntry = apps.get_model("core", "SearchEntry")
+    for kind, (model, fields) in SEARCH_FIELDS.items():
+        SearchEntry.objects.bulk_create([SearchEntry(
+            kind=kind, object_id=row[0], document=get_document(row[1:])
+        ) for row in apps.get_model(model).objects.values_list("id", *fields)], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_effective_permissions'),
+        ('analysis', '0002_initial'),
+        ('django_nextflow', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('document', models.TextField()),
+            ],
+            options={
+                'db_table': 'search_entries',
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(populate_search_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2 on 2026-10-18 07:10
+
+from django.db import migrations
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        table = schema_editor.quote_name(apps.get_model("django_nextflow", "Data")._meta.db_table)
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            f"CREATE INDEX data_filename_trgm ON {table} "
+            "USING gin ((filename::text) gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX data_filename_upper_trgm ON {table} "
+            "USING gin ((UPPER(filename::text)) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS data_filename_trgm")
+        schema_editor.execute("DROP INDEX IF EXISTS data_filename_upper_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_search_entries'),
+        ('django_nextflow', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
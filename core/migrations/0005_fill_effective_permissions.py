@@ -0,0 +1,85 @@
+# Generated by Django 3.2 on 2026-10-18 09:12
+
+from collections import defaultdict
+from django.db import migrations
+
+
+def raise_level(levels, user_id, object_id, level):
+    key = (user_id, object_id)
+    if level > levels.get(key, 0): levels[key] = level
+
+
+def inherit_levels(levels, parents, parent_levels):
+    children = defaultdict(list)
+    for child_id, parent_id in parents:
+        if parent_id is not None: children[parent_id].append(child_id)
+    for (user_id, parent_id), level in parent_levels.items():
+        for child_id in children.get(parent_id, []):
+            raise_level(levels, user_id, child_id, level)
+    return levels
+
+
+def direct_levels(links, field):
+    levels = {}
+    for user_id, object_id, level in links.objects.values_list("user", field, "permission"):
+        raise_level(levels, user_id, object_id, level)
+    return levels
+
+
+def fill_effective_permissions(apps, schema_editor):
+    """Works out every user's level on every collection, sample, job and data
+    file from the link tables, as core.permissions does for objects as they
+    change - without the table filled, nobody could see any private object."""
+
+    get = apps.get_model
+    EffectivePermission = get("core", "EffectivePermission")
+    members = defaultdict(list)
+    for user_id, group_id in get("core", "UserGroupLink").objects.filter(
+        permission__gte=2
+    ).values_list("user", "group"):
+        members[group_id].append(user_id)
+
+    collections = direct_levels(get("analysis", "CollectionUserLink"), "collection")
+    for group_id, collection_id, level in get("analysis", "CollectionGroupLink").objects.values_list(
+        "group", "collection", "permission"
+    ):
+        for user_id in members[group_id]:
+            raise_level(collections, user_id, collection_id, level)
+
+    samples = inherit_levels(
+        direct_levels(get("analysis", "SampleUserLink"), "sample"),
+        get("analysis", "Sample").objects.values_list("id", "collection"), collections
+    )
+    Job = get("analysis", "Job")
+    jobs = direct_levels(get("analysis", "JobUserLink"), "job")
+    inherit_levels(jobs, Job.objects.values_list("id", "collection"), collections)
+    inherit_levels(jobs, Job.objects.values_list("id", "sample"), samples)
+
+    data = direct_levels(get("analysis", "DataUserLink"), "data")
+    inherit_levels(data, get("analysis", "DataLink").objects.values_list(
+        "data", "collection"
+    ), collections)
+    inherit_levels(data, get("django_nextflow", "Data").objects.filter(
+        upstream_process_execution__execution__job__isnull=False
+    ).values_list("id", "upstream_process_execution__execution__job"), jobs)
+
+    EffectivePermission.objects.all().delete()
+    for object_type, levels in [
+        ["collection", collections], ["sample", samples], ["job", jobs], ["data", data]
+    ]:
+        EffectivePermission.objects.bulk_create([EffectivePermission(
+            user_id=user_id, object_type=object_type, object_id=object_id, level=level
+        ) for (user_id, object_id), level in levels.items()], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_filename_trigrams'),
+        ('analysis', '0003_data_link_ancestry'),
+        ('django_nextflow', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_effective_permissions, migrations.RunPython.noop),
+    ]
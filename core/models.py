@@ -114,4 +114,43 @@ class UserGroupLink(models.Model):
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
-    permission = models.IntegerField(choices=PERMISSIONS, default=1)
\ No newline at end of file
+    permission = models.IntegerField(choices=PERMISSIONS, default=1)
+
+
+class EffectivePermission(models.Model):
+    """The permission a user ends up with on a collection, sample, job or data
+    file once direct links, group links and parent objects have all been taken
+    into account. Rows are derived from the link tables and kept up to date by
+    the handlers in core.signals - they should never be edited directly."""
+
+    class Meta:
+        db_table = "effective_permissions"
+        unique_together = [["user", "object_type", "object_id"]]
+        indexes = [models.Index(fields=["object_type", "object_id"])]
+    
+    OBJECT_TYPES = [
+        ["collection", "collection"], ["sample", "sample"],
+        ["job", "job"], ["data", "data"]
+    ]
+    PERMISSIONS = [[1, "access"], [2, "edit"], [3, "share"], [4, "own"]]
+
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name="effective_permissions")
+    object_type = models.CharField(max_length=10, choices=OBJECT_TYPES)
+    object_id = models.BigIntegerField()
+    level = models.IntegerField(choices=PERMISSIONS)
+
+
+
+class SearchEntry(models.Model):
+    """The searchable text of one object, broken into lower case words. Rows
+    are derived from the objects' own tables and kept up to date by the
+    handlers in core.signals - the full-text index over them is created
+    separately for each database backend, so it isn't declared here."""
+
+    class Meta:
+        db_table = "search_entries"
+        unique_together = [["kind", "object_id"]]
+    
+    kind = models.CharField(max_length=10)
+    object_id = models.BigIntegerField()
+    document = models.TextField()
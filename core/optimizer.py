@@ -0,0 +1,110 @@
+"""Plans the select_related and prefetch_related calls a root queryset needs,
+from the fields the GraphQL query actually asks for, so that related objects
+are fetched with the page rather than with one query per row.
+
+Fields which are plain model relations are followed automatically. Fields with
+custom resolvers are only followed if their type declares which relation the
+resolver uses, in a query_hints dictionary mapping field names to lookups -
+otherwise there is no way to know what the resolver will touch.
+
+Querysets are not restricted with only(), as many resolvers read columns which
+aren't themselves requested, and each deferred column read would cost a query
+per row."""
+
+from django.core.exceptions import FieldDoesNotExist
+from graphene.relay import Connection
+from graphene.utils.str_converters import to_snake_case
+from graphene_django import DjangoObjectType
+from graphql.language.ast import Field
+
+def get_selections(asts, fragments):
+    """Gets the fields selected beneath some field ASTs, as a dictionary of
+    snake cased field names to the ASTs selecting them. Fragments are expanded
+    in place."""
+
+    selections = {}
+    for ast in asts:
+        if not ast.selection_set: continue
+        for selection in ast.selection_set.selections:
+            if isinstance(selection, Field):
+                name = to_snake_case(selection.name.value)
+                selections.setdefault(name, []).append(selection)
+                continue
+            if hasattr(selection, "selection_set"):
+                nested = get_selections([selection], fragments)
+            else:
+                nested = get_selections([fragments[selection.name.value]], fragments)
+            for name, field_asts in nested.items():
+                selections.setdefault(name, []).extend(field_asts)
+    return selections
+
+
+def get_named_type(graphene_type):
+    """Strips any List and NonNull wrappers from a graphene type."""
+
+    while hasattr(graphene_type, "of_type"):
+        graphene_type = graphene_type.of_type
+    return graphene_type
+
+
+def follow_lookup(model, lookup):
+    """Follows a relation lookup from a model, returning the model at the end of
+    it and whether any step can have many objects, or None if the lookup isn't
+    made up entirely of relations."""
+
+    many = False
+    for name in lookup.split("__"):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist: return None
+        if not field.is_relation: return None
+        many = many or field.one_to_many or field.many_to_many
+        model = field.related_model
+    return model, many
+
+
+def plan_lookups(graphene_type, asts, fragments, select, prefetch, prefix="", prefetching=False):
+    """Adds the lookups needed to resolve the fields selected on a graphene
+    type to the select and prefetch sets. Once a lookup crosses a relation
+    which can have many objects, everything beneath it is prefetched."""
+
+    hints = getattr(graphene_type, "query_hints", {})
+    fields = graphene_type._meta.fields
+    for name, field_asts in get_selections(asts, fragments).items():
+        if name not in fields: continue
+        if name in hints:
+            lookup = hints[name]
+        elif hasattr(graphene_type, f"resolve_{name}"): continue
+        else: lookup = name
+        followed = follow_lookup(graphene_type._meta.model, lookup)
+        if not followed: continue
+        model, many = followed
+        lookup = prefix + lookup
+        (prefetch if prefetching or many else select).add(lookup)
+        nested = get_named_type(fields[name].type)
+        if isinstance(nested, type) and issubclass(nested, DjangoObjectType)\
+         and nested._meta.model is model:
+            plan_lookups(
+                nested, field_asts, fragments, select, prefetch,
+                prefix=f"{lookup}__", prefetching=prefetching or many
+            )
+
+
+def optimize_queryset(queryset, info):
+    """Applies select_related and prefetch_related to a queryset being returned
+    by a root resolver, based on the fields the query selects beneath it. The
+    field can return a list of objects or a relay connection of them."""
+
+    graphene_type = getattr(get_named_type(info.return_type), "graphene_type", None)
+    asts = info.field_asts
+    if isinstance(graphene_type, type) and issubclass(graphene_type, Connection):
+        edges = get_selections(asts, info.fragments).get("edges", [])
+        asts = get_selections(edges, info.fragments).get("node", [])
+        graphene_type = graphene_type._meta.node
+    if not (isinstance(graphene_type, type) and issubclass(graphene_type, DjangoObjectType)):
+        return queryset
+    select, prefetch = set(), set()
+    plan_lookups(graphene_type, asts, info.fragments, select, prefetch)
+    if select: queryset = queryset.select_related(*sorted(select))
+    if prefetch: queryset = queryset.prefetch_related(*sorted(prefetch))
+    return queryset
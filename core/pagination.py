@@ -0,0 +1,162 @@
+"""Relay connections which page through querysets in the database, rather than
+loading every matching row to slice it in Python.
+
+Cursors are opaque keys on (created, id), so fetching a page deep into a large
+result set costs the same as fetching the first one. Counts are done with
+COUNT(*), or on PostgreSQL can optionally be the query planner's estimate.
+Connections can also count the matching rows by the values of some of their
+columns, for faceted search."""
+
+import graphene
+from graphene.relay import Connection, ConnectionField, PageInfo
+from graphql import GraphQLError
+from graphql_relay.utils import base64, unbase64
+from django.db import connections
+from django.db.models import Q, QuerySet, Count
+from graphene.types.generic import GenericScalar
+
+CURSOR_PREFIX = "keyset:"
+APPROXIMATE_COUNT_THRESHOLD = 10000
+
+def to_cursor(obj):
+    """Creates an opaque cursor for an object from its created time and ID."""
+
+    return base64(f"{CURSOR_PREFIX}{obj.created}:{obj.id}")
+
+
+def from_cursor(cursor):
+    """Gets the created time and ID a cursor points to."""
+
+    try:
+        value = unbase64(cursor)
+        assert value.startswith(CURSOR_PREFIX)
+        created, id = value[len(CURSOR_PREFIX):].split(":")
+        return int(created), int(id)
+    except Exception:
+        raise GraphQLError('{"cursor": ["Not a valid cursor"]}')
+
+
+def is_descending(queryset):
+    """Queries are paged through newest first if their ordering (or their
+    model's default ordering) starts with a descending field, and oldest first
+    otherwise."""
+
+    ordering = queryset.query.order_by or queryset.model._meta.ordering
+    return bool(ordering) and ordering[0].startswith("-")
+
+
+def count_rows(queryset, approximate=False):
+    """Counts the rows a queryset would return with COUNT(*). If an approximate
+    count is acceptable and the database is PostgreSQL, the query planner's
+    estimate is used instead, unless it is small enough for an exact count to
+    be cheap."""
+
+    connection = connections[queryset.db]
+    if approximate and connection.vendor == "postgresql":
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        estimate = int(plan[0]["Plan"]["Plan Rows"])
+        if estimate >= APPROXIMATE_COUNT_THRESHOLD: return estimate
+    return queryset.count()
+
+
+def count_facets(queryset, facets):
+    """Counts the rows of a queryset by each value of each of a dictionary of
+    facet names to field lookups, returning a dictionary of facet names to
+    lists of value/count dictionaries, commonest first.
+
+    This is done with a single GROUP BY over every facet's lookup at once,
+    with the counts for each facet then summed from its combinations, so it
+    costs one query however many facets there are."""
+
+    lookups = list(facets.values())
+    counts = {name: {} for name in facets}
+    rows = queryset.order_by().prefetch_related(None).values(*lookups).annotate(facet_count=Count("*"))
+    for row in rows:
+        for name, lookup in facets.items():
+            counts[name][row[lookup]] = counts[name].get(row[lookup], 0) + row["facet_count"]
+    return {name: [{"value": value, "count": count} for value, count in sorted(
+        values.items(), key=lambda item: (-item[1], str(item[0]))
+    )] for name, values in counts.items()}
+
+
+def page_queryset(queryset, first=None, last=None, after=None, before=None):
+    """Gets one page of a queryset using keyset pagination, along with whether
+    there are more rows before and after it."""
+
+    sign = "-" if is_descending(queryset) else ""
+    later = "lt" if sign else "gt"
+    earlier = "gt" if sign else "lt"
+    rows = queryset.order_by(f"{sign}created", f"{sign}id")
+    if after:
+        created, id = from_cursor(after)
+        rows = rows.filter(Q(**{f"created__{later}": created}) |
+            Q(created=created, **{f"id__{later}": id}))
+    if before:
+        created, id = from_cursor(before)
+        rows = rows.filter(Q(**{f"created__{earlier}": created}) |
+            Q(created=created, **{f"id__{earlier}": id}))
+    has_previous, has_next = bool(after), bool(before)
+    if first is not None:
+        if first < 0: raise GraphQLError('{"first": ["Must be positive"]}')
+        page = list(rows[:first + 1])
+        has_next = len(page) > first
+        page = page[:first]
+        if last is not None and last < len(page):
+            page, has_previous = page[len(page) - last:], True
+    elif last is not None:
+        if last < 0: raise GraphQLError('{"last": ["Must be positive"]}')
+        page = list(rows.reverse()[:last + 1])
+        has_previous = len(page) > last
+        page = page[:last][::-1]
+    else:
+        page = list(rows)
+    return page, has_previous, has_next
+
+
+
+class FacetValueType(graphene.ObjectType):
+
+    value = GenericScalar()
+    count = graphene.Int()
+
+
+
+class CountableConnection(Connection):
+    """A connection whose count is worked out in the database."""
+
+    class Meta:
+        abstract = True
+
+    count = graphene.Int(approximate=graphene.Boolean())
+
+    def resolve_count(self, info, **kwargs):
+        if isinstance(self.iterable, QuerySet):
+            return count_rows(self.iterable, kwargs.get("approximate", False))
+        return len(self.iterable)
+
+
+
+class KeysetConnectionField(ConnectionField):
+    """A connection field which pages through querysets using keyset cursors.
+    Resolvers which return something other than a queryset are paged through
+    in the usual way."""
+
+    @classmethod
+    def resolve_connection(cls, connection_type, args, resolved):
+        if not isinstance(resolved, QuerySet):
+            return super().resolve_connection(connection_type, args, resolved)
+        page, has_previous, has_next = page_queryset(
+            resolved, first=args.get("first"), last=args.get("last"),
+            after=args.get("after"), before=args.get("before")
+        )
+        edges = [connection_type.Edge(node=obj, cursor=to_cursor(obj)) for obj in page]
+        connection = connection_type(edges=edges, page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous, has_next_page=has_next
+        ))
+        connection.iterable = resolved
+        return connection
@@ -8,12 +8,25 @@ permissions via groups).
 2. Functions for checking if a particular should have a given level of access on
 an object, after looking at all possible links they might have to it.
 
-3. Functions for filtering a queryset by those a user can know about."""
-
-from core.models import User, Group
+3. Functions for filtering a queryset by those a user can know about.
+
+4. Functions for maintaining the effective permission table, which stores the
+level each user has on each object once groups and parent objects have been
+taken into account. Types 2 and 3 are answered from this table, and the
+collections each user can read are also kept in memory between requests."""
+
+import time
+import threading
+from array import array
+from collections import defaultdict, OrderedDict
+from itertools import chain
+from core.models import User, Group, EffectivePermission
 from analysis.models import Collection, CollectionGroupLink, CollectionUserLink, Sample, SampleUserLink, Job, JobUserLink, Data, DataUserLink, DataLink
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Count, Max
 from django_nextflow.models import Data
+from core.versions import get_version, bump_version
 
 def get_groups_by_user(user, permission, exact=True):
     """Gets all groups which have a link with a particular user, matching a
@@ -147,6 +160,156 @@ def get_users_by_data(data, permission, exact=True):
     })
 
 
+def get_effective_ids(user, object_type, permission=1):
+    """Gets the IDs of every object of a given type which a user has a
+    particular permission (or higher) on, as a subquery that can be used in an
+    id__in filter."""
+
+    return EffectivePermission.objects.filter(
+        user=user, object_type=object_type, level__gte=permission
+    ).values("object_id")
+
+
+def get_effective_levels(user, object_type, ids):
+    """Gets the effective permission level a user has on many objects of one
+    type at once, as a dict of object ID to level. Objects the user has no
+    level on are absent."""
+
+    levels = {}
+    if not user: return levels
+    for chunk in chunks(set(int(id) for id in ids)):
+        levels.update(EffectivePermission.objects.filter(
+            user=user, object_type=object_type, object_id__in=chunk
+        ).values_list("object_id", "level"))
+    return levels
+
+
+ACCESSIBLE_COLLECTIONS = OrderedDict()
+ACCESSIBLE_COLLECTIONS_LOCK = threading.Lock()
+MAX_CACHED_USERS = 10000
+
+def get_accessible_collection_stamp(user):
+    """Gets a stamp of a user's collection rows in the effective permission
+    table. Rows are only ever deleted and recreated, never updated, so their
+    number and highest ID change whenever the user's access changes - in any
+    process."""
+
+    stamp = EffectivePermission.objects.filter(
+        user=user, object_type="collection"
+    ).aggregate(count=Count("id"), last=Max("id"))
+    return (stamp["count"], stamp["last"])
+
+
+def get_accessible_collection_ids(user):
+    """Gets the IDs of the collections a user can read through a link of their
+    own or one of their groups, as a sorted array.
+
+    These rarely change, so each process keeps them in memory for the most
+    recently seen users. They are thrown away at once when this process
+    changes collection access (the collections version stamp changes), and
+    otherwise are checked against the user's rows in the effective permission
+    table at most every ACCESSIBLE_COLLECTIONS_CHECK_INTERVAL seconds, so that
+    changes made by other processes - celery tasks, for instance - are seen
+    too."""
+
+    version = get_version("collections")
+    now = time.monotonic()
+    with ACCESSIBLE_COLLECTIONS_LOCK:
+        cached = ACCESSIBLE_COLLECTIONS.get(user.id)
+        if cached and cached[0] == version:
+            ACCESSIBLE_COLLECTIONS.move_to_end(user.id)
+            if now - cached[2] < settings.ACCESSIBLE_COLLECTIONS_CHECK_INTERVAL:
+                return cached[3]
+    if cached and cached[0] == version:
+        if get_accessible_collection_stamp(user) == cached[1]:
+            with ACCESSIBLE_COLLECTIONS_LOCK:
+                ACCESSIBLE_COLLECTIONS[user.id] = (version, cached[1], now, cached[3])
+            return cached[3]
+    rows = list(EffectivePermission.objects.filter(
+        user=user, object_type="collection"
+    ).values_list("id", "object_id"))
+    stamp = (len(rows), max((row[0] for row in rows), default=None))
+    ids = array("q", sorted(row[1] for row in rows))
+    with ACCESSIBLE_COLLECTIONS_LOCK:
+        ACCESSIBLE_COLLECTIONS[user.id] = (version, stamp, now, ids)
+        while len(ACCESSIBLE_COLLECTIONS) > MAX_CACHED_USERS:
+            ACCESSIBLE_COLLECTIONS.popitem(last=False)
+    return ids
+
+
+def get_accessible_collection_filter(user):
+    """Gets something to filter collection IDs by to find those a user can read
+    through links - the cached IDs themselves, unless there are too many to
+    put in one IN clause, in which case a subquery on the effective permission
+    table is used instead."""
+
+    ids = get_accessible_collection_ids(user)
+    return list(ids) if len(ids) <= 500 else get_effective_ids(user, "collection")
+
+
+def collections_changed():
+    """Invalidates this process's accessible collection IDs (other processes
+    notice the change from the effective permission table). The version is
+    bumped now, and again once the current transaction is committed so that
+    nothing read before then can be cached against the new version."""
+
+    bump_version("collections")
+    transaction.on_commit(lambda: bump_version("collections"))
+
+
+def is_collection_public(collection):
+    """Checks whether anyone at all can read a collection."""
+
+    return not collection.private
+
+
+def is_sample_public(sample):
+    """Checks whether anyone at all can read a sample, either because it is
+    public itself or because its collection is."""
+
+    if not sample.private: return True
+    return bool(sample.collection and is_collection_public(sample.collection))
+
+
+def is_job_public(job):
+    """Checks whether anyone at all can read a job, either because it is public
+    itself or because its collection or sample is."""
+
+    if not job.private: return True
+    if job.collection and is_collection_public(job.collection): return True
+    return bool(job.sample and is_sample_public(job.sample))
+
+
+def is_data_public(data):
+    """Checks whether anyone at all can read a data file, either because it is
+    public itself or because its collection or the job that produced it is."""
+
+    link = DataLink.objects.get(data=data)
+    if not link.private: return True
+    if link.collection and is_collection_public(link.collection): return True
+    return bool(link.job and is_job_public(link.job))
+
+
+OBJECT_TYPES = {Collection: "collection", Sample: "sample", Job: "job", Data: "data"}
+
+PUBLIC_CHECKS = {
+    "collection": is_collection_public, "sample": is_sample_public,
+    "job": is_job_public, "data": is_data_public
+}
+
+
+def get_permission_level(user, obj):
+    """Gets the highest permission level a user has on a collection, sample,
+    job or data file, taking links via groups and parent objects into account.
+    An object the user has no link to is level 1 if it is public, and 0 if they
+    can't see it at all."""
+
+    object_type = OBJECT_TYPES[type(obj)]
+    level = EffectivePermission.objects.filter(
+        user=user, object_type=object_type, object_id=obj.id
+    ).aggregate(level=Max("level"))["level"] if user else None
+    if level: return level
+    return 1 if PUBLIC_CHECKS[object_type](obj) else 0
 
 
 def does_user_have_permission_on_collection(user, collection, permission):
@@ -154,15 +317,7 @@ def does_user_have_permission_on_collection(user, collection, permission):
     collection. The direct links will be checked, as well as links via
     groups."""
 
-    if permission == 1 and not collection.private: return True
-    if CollectionUserLink.objects.filter(
-        collection=collection, user=user, permission__gte=permission
-    ).count() > 0: return True
-    for group in get_groups_by_user(user, permission=2, exact=False):
-        if CollectionGroupLink.objects.filter(
-            collection=collection, group=group, permission__gte=permission
-        ).count() > 0: return True
-    return False
+    return get_permission_level(user, collection) >= permission
 
 
 def does_user_have_permission_on_sample(user, sample, permission):
@@ -170,15 +325,7 @@ def does_user_have_permission_on_sample(user, sample, permission):
     sample. The direct links will be checked, as well as links via the parent
     collection (if one exists)."""
 
-    if permission == 1 and not sample.private: return True
-    if SampleUserLink.objects.filter(
-        sample=sample, user=user, permission__gte=permission
-    ).count() > 0: return True
-    if sample.collection:
-        return does_user_have_permission_on_collection(
-            user, sample.collection, permission
-        )
-    return False
+    return get_permission_level(user, sample) >= permission
 
 
 def does_user_have_permission_on_job(user, job, permission):
@@ -186,15 +333,7 @@ def does_user_have_permission_on_job(user, job, permission):
     job. The direct links will be checked, as well as links via the parent
     collection or sample (if they exists)."""
 
-    if permission == 1 and not job.private: return True
-    if JobUserLink.objects.filter(
-        job=job, user=user, permission__gte=permission
-    ).count() > 0: return True
-    if job.collection:
-        return does_user_have_permission_on_collection(user, job.collection, permission)
-    if job.sample:
-        return does_user_have_permission_on_sample(user, job.sample, permission)
-    return False
+    return get_permission_level(user, job) >= permission
 
 
 def does_user_have_permission_on_data(user, data, permission):
@@ -202,100 +341,299 @@ def does_user_have_permission_on_data(user, data, permission):
     data file. The direct links will be checked, as well as links via the parent
     collection, sample or job (if they exists)."""
 
-    link = DataLink.objects.get(data=data)
-    if permission == 1 and not link.private: return True
-    if DataUserLink.objects.filter(
-        data=data, user=user, permission__gte=permission
-    ).count() > 0: return True
-    if link.collection:
-        return does_user_have_permission_on_collection(user, link.collection, permission)
-    if data.upstream_process_execution:
-        return does_user_have_permission_on_job(
-            user, data.upstream_process_execution.execution.job, permission
-        )
-    return False
+    return get_permission_level(user, data) >= permission
 
 
 
 
 def readable_collections(queryset, user=None):
     """Takes a Collection queryset and filters it by those a particular user is
-    allowed to know exist and read."""
+    allowed to know exist and read.
+
+    Like the other readable_* functions, every route to an object is expressed
+    as an IN subquery on an indexed column rather than a join, so no row can
+    appear twice and no DISTINCT is needed."""
 
+    readable = Q(private=False)
     if user:
-        return queryset.filter(
-            Q(private=False) |\
-            Q(users=user) |\
-            Q(groups__users=user)
-        ).distinct()
-    else:
-        return queryset.filter(private=False)
+        readable |= Q(id__in=get_accessible_collection_filter(user))
+    return queryset.filter(readable)
 
 
 def readable_samples(queryset, user=None):
     """Takes a Sample queryset and filters it by those a particular user is
     allowed to know exist and read."""
 
+    readable = Q(private=False) | Q(collection__in=readable_collections(
+        Collection.objects.all()
+    ).values("id"))
     if user:
-        return queryset.filter(
-            Q(private=False) |\
-            Q(users=user) |\
-            Q(collection__users=user) |\
-            Q(collection__groups__users=user)
-        ).distinct()
-    else:
-        return queryset.filter(
-            Q(private=False) |\
-            Q(collection__private=False)
-        ).distinct()
+        readable |= Q(collection__in=get_accessible_collection_filter(user))
+        readable |= Q(id__in=SampleUserLink.objects.filter(user=user).values("sample"))
+    return queryset.filter(readable)
 
 
 def readable_jobs(queryset, user=None):
     """Takes a Job queryset and filters it by those a particular user is
     allowed to know exist and read."""
 
+    readable = Q(private=False) |\
+        Q(collection__in=readable_collections(Collection.objects.all()).values("id")) |\
+        Q(sample__in=readable_samples(Sample.objects.all()).values("id"))
     if user:
-        return queryset.filter(
-            Q(private=False) |\
-            Q(users=user) |\
-            Q(sample__users=user) |\
-            Q(collection__users=user) |\
-            Q(sample__collection__users=user) |\
-            Q(collection__groups__users=user) |\
-            Q(sample__collection__groups__users=user)
-        ).distinct()
-    else:
-        return queryset.filter(
-            Q(private=False) |\
-            Q(sample__private=False) |\
-            Q(collection__private=False) |\
-            Q(sample__collection__private=False)
-        ).distinct()
+        readable |= Q(id__in=get_effective_ids(user, "job"))
+    return queryset.filter(readable)
 
 
 def readable_data(queryset, user=None):
     """Takes a Data queryset and filters it by those a particular user is
     allowed to know exist and read."""
 
+    public_collections = readable_collections(Collection.objects.all()).values("id")
+    public_links = DataLink.objects.filter(
+        Q(private=False) | Q(collection__in=public_collections) |
+        Q(effective_collection__in=public_collections) |
+        Q(sample__in=Sample.objects.filter(private=False).values("id")) |
+        Q(job__in=Job.objects.filter(private=False).values("id"))
+    )
+    readable = Q(id__in=public_links.values("data"))
     if user:
-        return queryset.filter(
-            Q(link__private=False) |\
-            Q(datauserlink__user=user) |\
-            Q(upstream_process_execution__execution__job__users=user) |\
-            Q(upstream_process_execution__execution__job__sample__users=user) |\
-            Q(upstream_process_execution__execution__job__sample__collection__users=user) |\
-            Q(upstream_process_execution__execution__job__collection__users=user) |\
-            Q(link__collection__users=user) |\
-            Q(link__collection__groups__users=user) |\
-            Q(upstream_process_execution__execution__job__collection__groups__users=user) |\
-            Q(upstream_process_execution__execution__job__sample__collection__groups__users=user)
-        ).distinct()
-    else:
-        return queryset.filter(
-            Q(link__private=False) |\
-            Q(link__collection__private=False) |\
-            Q(upstream_process_execution__execution__job__private=False) |\
-            Q(upstream_process_execution__execution__job__sample__private=False) |\
-            Q(upstream_process_execution__execution__job__collection__private=False) |\
-            Q(upstream_process_execution__execution__job__sample__collection__private=False)
-        ).distinct()
\ No newline at end of file
+        readable |= Q(id__in=get_effective_ids(user, "data"))
+    return queryset.filter(readable)
+
+
+READABLE_FILTERS = {
+    "collection": [Collection, readable_collections],
+    "sample": [Sample, readable_samples],
+    "job": [Job, readable_jobs],
+    "data": [Data, readable_data],
+}
+
+MAX_PERMISSION_OBJECTS = 500
+
+def get_permission_levels(user, objects):
+    """Gets the level a user has on many objects of mixed types at once, as a
+    dict of (type, ID) pairs to level. Objects the user cannot see at all are
+    level 0, and public objects the user has no higher level on are level 1.
+
+    Each object type takes at most one query for the effective permission rows
+    and one for which of the remaining objects are public - so as long as no
+    more than MAX_PERMISSION_OBJECTS are asked about, there are never more than
+    eight queries."""
+
+    ids = defaultdict(set)
+    for object_type, object_id in objects:
+        ids[object_type].add(int(object_id))
+    levels = {}
+    for object_type, type_ids in ids.items():
+        type_levels = get_effective_levels(user, object_type, type_ids)
+        hidden = type_ids - set(type_levels)
+        if hidden:
+            model, readable = READABLE_FILTERS[object_type]
+            type_levels.update({id: 1 for id in readable(
+                model.objects.filter(id__in=hidden)
+            ).order_by().values_list("id", flat=True)})
+        levels.update({(object_type, id): type_levels.get(id, 0) for id in type_ids})
+    return levels
+
+
+
+
+def chunks(ids, size=500):
+    """Splits a collection of IDs into lists small enough to be used in an IN
+    clause on any database backend."""
+
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def raise_level(levels, user_id, object_id, level):
+    """Records a level in a levels dict, unless a higher one is there
+    already."""
+
+    key = (user_id, object_id)
+    if level > levels.get(key, 0): levels[key] = level
+
+
+def inherit_levels(levels, parents, parent_type, users=None):
+    """Takes a levels dict and a list of (child ID, parent ID) pairs, and makes
+    sure every child's level is at least as high as whatever is stored in the
+    effective permission table for its parent."""
+
+    children = defaultdict(list)
+    for child_id, parent_id in parents:
+        if parent_id is not None: children[parent_id].append(child_id)
+    if not children: return levels
+    rows = EffectivePermission.objects.filter(
+        object_type=parent_type, object_id__in=children
+    )
+    if users is not None: rows = rows.filter(user__in=users)
+    for user_id, parent_id, level in rows.values_list("user", "object_id", "level"):
+        for child_id in children[parent_id]:
+            raise_level(levels, user_id, child_id, level)
+    return levels
+
+
+def calculate_collection_levels(ids, users=None):
+    """Works out the level every user has on the collections given, as a dict
+    of (user ID, collection ID) to level. This is the higher of any direct link
+    and any link via a group the user is a member (not just an invitee) of."""
+
+    levels = {}
+    direct = {"collection__in": ids}
+    via_group = {"collection__in": ids, "group__usergrouplink__permission__gte": 2}
+    if users is not None:
+        direct["user__in"] = users
+        via_group["group__usergrouplink__user__in"] = users
+    for user_id, collection_id, permission in chain(
+        CollectionUserLink.objects.filter(**direct).values_list(
+            "user", "collection", "permission"
+        ),
+        CollectionGroupLink.objects.filter(**via_group).values_list(
+            "group__usergrouplink__user", "collection", "permission"
+        )
+    ):
+        raise_level(levels, user_id, collection_id, permission)
+    return levels
+
+
+def calculate_sample_levels(ids, users=None):
+    """Works out the level every user has on the samples given, from direct
+    links and from the effective permissions on their collections."""
+
+    levels = {}
+    links = SampleUserLink.objects.filter(sample__in=ids)
+    if users is not None: links = links.filter(user__in=users)
+    for user_id, sample_id, permission in links.values_list("user", "sample", "permission"):
+        raise_level(levels, user_id, sample_id, permission)
+    samples = Sample.objects.filter(id__in=ids)
+    return inherit_levels(levels, samples.values_list("id", "collection"), "collection", users)
+
+
+def calculate_job_levels(ids, users=None):
+    """Works out the level every user has on the jobs given, from direct links
+    and from the effective permissions on their collections and samples."""
+
+    levels = {}
+    links = JobUserLink.objects.filter(job__in=ids)
+    if users is not None: links = links.filter(user__in=users)
+    for user_id, job_id, permission in links.values_list("user", "job", "permission"):
+        raise_level(levels, user_id, job_id, permission)
+    jobs = Job.objects.filter(id__in=ids)
+    inherit_levels(levels, jobs.values_list("id", "collection"), "collection", users)
+    return inherit_levels(levels, jobs.values_list("id", "sample"), "sample", users)
+
+
+def calculate_data_levels(ids, users=None):
+    """Works out the level every user has on the data files given, from direct
+    links and from the effective permissions on their collections and the jobs
+    which produced them."""
+
+    levels = {}
+    links = DataUserLink.objects.filter(data__in=ids)
+    if users is not None: links = links.filter(user__in=users)
+    for user_id, data_id, permission in links.values_list("user", "data", "permission"):
+        raise_level(levels, user_id, data_id, permission)
+    inherit_levels(levels, DataLink.objects.filter(data__in=ids).values_list(
+        "data", "collection"
+    ), "collection", users)
+    return inherit_levels(levels, Data.objects.filter(
+        id__in=ids, upstream_process_execution__execution__job__isnull=False
+    ).values_list("id", "upstream_process_execution__execution__job"), "job", users)
+
+
+LEVEL_CALCULATORS = [
+    ["collection", calculate_collection_levels],
+    ["sample", calculate_sample_levels],
+    ["job", calculate_job_levels],
+    ["data", calculate_data_levels],
+]
+
+
+def refresh_effective_permissions(collections=(), samples=(), jobs=(), data=(), users=None):
+    """Recalculates the effective permission rows for the collections, samples,
+    jobs and data files given (as IDs), and for every object which inherits
+    permissions from them - the samples and jobs in a collection, the jobs of a
+    sample and the data produced by a job. If a list of user IDs is given, only
+    the rows for those users are recalculated."""
+
+    ids = {
+        "collection": set(collections), "sample": set(samples),
+        "job": set(jobs), "data": set(data)
+    }
+    for chunk in chunks(ids["collection"]):
+        ids["sample"].update(Sample.objects.filter(collection__in=chunk).values_list("id", flat=True))
+        ids["job"].update(Job.objects.filter(collection__in=chunk).values_list("id", flat=True))
+        ids["data"].update(DataLink.objects.filter(collection__in=chunk).values_list("data", flat=True))
+    for chunk in chunks(ids["sample"]):
+        ids["job"].update(Job.objects.filter(sample__in=chunk).values_list("id", flat=True))
+    for chunk in chunks(ids["job"]):
+        ids["data"].update(Data.objects.filter(
+            upstream_process_execution__execution__job__in=chunk
+        ).values_list("id", flat=True))
+    with transaction.atomic():
+        for object_type, calculate in LEVEL_CALCULATORS:
+            for chunk in chunks(ids[object_type]):
+                rows = EffectivePermission.objects.filter(
+                    object_type=object_type, object_id__in=chunk
+                )
+                if users is not None: rows = rows.filter(user__in=users)
+                rows.delete()
+                EffectivePermission.objects.bulk_create([EffectivePermission(
+                    user_id=user_id, object_type=object_type,
+                    object_id=object_id, level=level
+                ) for (user_id, object_id), level in calculate(chunk, users).items()])
+    if ids["collection"]: collections_changed()
+
+
+def remove_effective_permissions(object_type, object_id):
+    """Deletes every effective permission row for an object which no longer
+    exists."""
+
+    EffectivePermission.objects.filter(
+        object_type=object_type, object_id=object_id
+    ).delete()
+    if object_type == "collection": collections_changed()
+
+
+def rebuild_effective_permissions():
+    """Throws away the entire effective permission table and recalculates it
+    from the link tables."""
+
+    with transaction.atomic():
+        EffectivePermission.objects.all().delete()
+        refresh_effective_permissions(
+            collections=Collection.objects.values_list("id", flat=True),
+            samples=Sample.objects.values_list("id", flat=True),
+            jobs=Job.objects.values_list("id", flat=True),
+            data=Data.objects.values_list("id", flat=True),
+        )
+        collections_changed()
+
+
+def find_effective_permission_errors():
+    """Compares the effective permission table with levels calculated afresh
+    from the link tables, and returns a list of (user ID, object type, object
+    ID, stored level, correct level) for every row which is wrong or missing.
+    Levels inherited from parents are checked against the stored parent rows,
+    so an error in a collection row is reported once rather than for every
+    object beneath it."""
+
+    errors = []
+    models = {object_type: model for model, object_type in OBJECT_TYPES.items()}
+    for object_type, calculate in LEVEL_CALCULATORS:
+        ids = models[object_type].objects.values_list("id", flat=True)
+        for chunk in chunks(ids):
+            expected = calculate(chunk)
+            stored = {(user_id, object_id): level for user_id, object_id, level in
+                EffectivePermission.objects.filter(
+                    object_type=object_type, object_id__in=chunk
+                ).values_list("user", "object_id", "level")}
+            for key in sorted(set(expected) | set(stored)):
+                if expected.get(key, 0) != stored.get(key, 0):
+                    errors.append((
+                        key[0], object_type, key[1],
+                        stored.get(key, 0), expected.get(key, 0)
+                    ))
+    return errors
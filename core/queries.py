@@ -2,11 +2,14 @@ from django_nextflow.models import Data
 import graphene
 from graphene_django.types import DjangoObjectType
 from .models import User, Group
-from .permissions import does_user_have_permission_on_collection, does_user_have_permission_on_data, does_user_have_permission_on_job, does_user_have_permission_on_sample, get_collections_by_group, get_groups_by_user, get_users_by_group, readable_data, readable_jobs
+from .loaders import get_cached_permission_level, get_permission_cache
+from .optimizer import optimize_queryset
+from .search import fetch_ranked
+from .permissions import get_collections_by_group, get_groups_by_user, get_users_by_group, readable_data, readable_jobs
 from .permissions import get_collections_by_user
 from .permissions import  get_data_by_user
 from .permissions import readable_collections, readable_samples
-from analysis.models import Collection, DataUserLink, Job, Sample, CollectionUserLink, CollectionGroupLink, SampleUserLink, JobUserLink
+from analysis.models import Collection, Job, Sample, CollectionGroupLink
 from analysis.queries import CollectionType, SampleType, ExecutionType, DataType
 
 class UserType(DjangoObjectType):
@@ -46,32 +49,28 @@ class UserType(DjangoObjectType):
     
     def resolve_collection_permission(self, info, **kwargs):
         collection = Collection.objects.filter(id=kwargs["id"]).first()
-        if not does_user_have_permission_on_collection(info.context.user, collection, 1):
+        if not collection or not get_cached_permission_level(info, collection):
             return 0
-        link = CollectionUserLink.objects.filter(user=self, collection=collection).first()
-        return link.permission if link else 0
+        return get_permission_cache(info).get_level(self, collection)
     
     def resolve_sample_permission(self, info, **kwargs):
         sample = Sample.objects.filter(id=kwargs["id"]).first()
-        if not does_user_have_permission_on_sample(info.context.user, sample, 1):
+        if not sample or not get_cached_permission_level(info, sample):
             return 0
-        link = SampleUserLink.objects.filter(user=self, sample=sample).first()
-        return link.permission if link else 0
+        return get_permission_cache(info).get_level(self, sample)
     
     def resolve_execution_permission(self, info, **kwargs):
         job = Job.objects.filter(id=kwargs["id"]).first()
-        if not does_user_have_permission_on_job(info.context.user, job, 1):
+        if not job or not get_cached_permission_level(info, job):
             return 0
-        link = JobUserLink.objects.filter(user=self, job=job).first()
-        return link.permission if link else 0
+        return get_permission_cache(info).get_level(self, job)
     
 
     def resolve_data_permission(self, info, **kwargs):
         data = Data.objects.filter(id=kwargs["id"]).first()
-        if not does_user_have_permission_on_data(info.context.user, data, 1):
+        if not data or not get_cached_permission_level(info, data):
             return 0
-        link = DataUserLink.objects.filter(user=self, data=data).first()
-        return link.permission if link else 0
+        return get_permission_cache(info).get_level(self, data)
 
     
 
@@ -107,7 +106,7 @@ class GroupType(DjangoObjectType):
     
     def resolve_collection_permission(self, info, **kwargs):
         collection = Collection.objects.filter(id=kwargs["id"]).first()
-        if not does_user_have_permission_on_collection(info.context.user, collection, 1):
+        if not collection or not get_cached_permission_level(info, collection):
             return 0
         link = CollectionGroupLink.objects.filter(group=self, collection=collection).first()
         return link.permission if link else 0
@@ -124,45 +123,27 @@ class SearchType(graphene.ObjectType):
     users = graphene.List(UserType)
 
     def resolve_collections(self, info, **kwargs):
-        return readable_collections(
-            Collection.objects.filter(name__icontains=self["query"])
-          | Collection.objects.filter(description__icontains=self["query"]),
-          info.context.user
-        ).distinct()[:25]
+        return fetch_ranked(optimize_queryset(Collection.objects.all(), info), self["collections"])
     
 
     def resolve_samples(self, info, **kwargs):
-        return readable_samples(
-            Sample.objects.filter(name__icontains=self["query"])
-          | Sample.objects.filter(species__name__icontains=self["query"])
-          | Sample.objects.filter(species__latin_name__icontains=self["query"]),
-          info.context.user
-        ).distinct()[:25]
+        return fetch_ranked(optimize_queryset(Sample.objects.all(), info), self["samples"])
     
 
     def resolve_executions(self, info, **kwargs):
-        return readable_jobs(
-            Job.objects.filter(execution__pipeline__name__icontains=self["query"]),
-            info.context.user
-        )[:25]
+        return fetch_ranked(optimize_queryset(Job.objects.all(), info), self["executions"])
     
 
     def resolve_data(self, info, **kwargs):
-        return readable_data(
-            Data.objects.filter(filename__icontains=self["query"]),
-            info.context.user
-        )[:25]
+        return fetch_ranked(optimize_queryset(Data.objects.all(), info), self["data"])
     
 
     def resolve_groups(self, info, **kwargs):
-        return (
-            Group.objects.filter(name__icontains=self["query"])
-          | Group.objects.filter(description__icontains=self["query"])
-        ).distinct()[:25]
+        return fetch_ranked(optimize_queryset(Group.objects.all(), info), self["groups"])
     
 
     def resolve_users(self, info, **kwargs):
-        return User.objects.filter(name__icontains=self["query"])[:25]
+        return fetch_ranked(optimize_queryset(User.objects.all(), info), self["users"])
 
 
 '''class UserType(DjangoObjectType):
@@ -302,4 +283,18 @@ class SearchType(graphene.ObjectType):
     
 
     def resolve_users(self, info, **kwargs):
-        return User.objects.filter(name__icontains=self["query"])'''
\ No newline at end of file
+        return User.objects.filter(name__icontains=self["query"])'''
+
+
+
+class PermissionObjectInput(graphene.InputObjectType):
+    type = graphene.String(required=True)
+    id = graphene.ID(required=True)
+
+
+
+class PermissionType(graphene.ObjectType):
+    
+    type = graphene.String()
+    id = graphene.ID()
+    level = graphene.Int()
@@ -0,0 +1,89 @@
+"""Responses to anonymous queries of public data, cached in the cache named
+"responses" - in local memory or in files, or any other Django cache backend.
+Without a user, these responses are the same for every visitor.
+
+Responses are keyed by the normalized document, the variables and operation
+name, and a data version stamp which is bumped whenever a model the public
+queries read from is written to, so no entry is ever served after the data
+beneath it has changed. The stamp is kept in the responses cache itself, so
+any process sharing the cached responses (such as a celery worker writing
+pipeline outputs) also shares their stamp. Only queries whose every root field is listed in
+RESPONSE_CACHE_FIELDS are cached, and only if they ran without errors."""
+
+import json
+import hashlib
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from graphql.language.ast import OperationDefinition
+from graphql.language.printer import print_ast
+from core.versions import get_version, bump_version
+
+def get_operation(document_ast, operation_name):
+    """Gets the operation of a document which will be executed, or None if it
+    is ambiguous."""
+
+    operations = [d for d in document_ast.definitions if isinstance(d, OperationDefinition)]
+    for operation in operations:
+        if operation.name and operation.name.value == operation_name:
+            return operation
+    return operations[0] if len(operations) == 1 else None
+
+
+def is_cacheable(document_ast, operation_name):
+    """Checks whether the response to an operation can be shared between
+    anonymous users - it must be a query, and must only select root fields
+    known to return the same thing to every anonymous user."""
+
+    operation = get_operation(document_ast, operation_name)
+    if not operation or operation.operation != "query": return False
+    for selection in operation.selection_set.selections:
+        if not hasattr(selection, "alias"): return False
+        if selection.name.value not in settings.RESPONSE_CACHE_FIELDS + ["__typename"]:
+            return False
+    return True
+
+
+def get_response_key(document_ast, variables, operation_name):
+    """Gets the cache key of an operation's response, under the current data
+    version. Documents which differ only in formatting share a key."""
+
+    text = json.dumps([
+        print_ast(document_ast), variables or {}, operation_name
+    ], sort_keys=True)
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return f"response:{get_version('responses', 'responses')}:{digest}"
+
+
+def get_cached_response(key):
+    """Gets the data of a cached response, or None."""
+
+    return caches["responses"].get(key)
+
+
+def cache_response(key, data):
+    """Caches the data of a response."""
+
+    caches["responses"].set(key, data)
+
+
+def responses_changed():
+    """Invalidates every cached response. The version is bumped now, and again
+    once the current transaction is committed so that nothing read before then
+    can be cached against the new version.
+
+    Until that commit, responses can only have been cached against the new
+    version from data read outside the transaction, which the second bump
+    will invalidate anyway - so a transaction writing many rows only bumps the
+    version once, rather than once per row."""
+
+    connection = transaction.get_connection()
+    pending = getattr(connection, "responses_bump", None)
+    if pending and any(func is pending for _, func in connection.run_on_commit):
+        return
+    def committed():
+        connection.responses_bump = None
+        bump_version("responses", "responses")
+    connection.responses_bump = committed
+    bump_version("responses", "responses")
+    transaction.on_commit(committed)
@@ -1,15 +1,53 @@
 from django_nextflow.models import Data
 import graphene
+from graphene.types.generic import GenericScalar
+from django.conf import settings
 from django.db.models import Q
 from graphql import GraphQLError
-from graphene.relay import ConnectionField
-from core.permissions import does_user_have_permission_on_collection, does_user_have_permission_on_data, does_user_have_permission_on_job, does_user_have_permission_on_sample, get_collections_by_group, get_collections_by_user, readable_data, readable_jobs
+from core.pagination import KeysetConnectionField
+from core.permissions import get_permission_levels, MAX_PERMISSION_OBJECTS
+from core.loaders import has_cached_permission
+from core.optimizer import optimize_queryset, get_selections
+from core.search import search_filter, rank_ids, run_lookups
+from core.filenames import filter_by_filename
+from core.permissions import get_accessible_collection_filter, readable_data, readable_jobs
+from core.permissions import readable_collections, readable_samples
 from core.mutations import *
 from analysis.mutations import *
-from analysis.models import Collection, Sample, Job
+from analysis.models import Collection, Sample, Job, filter_samples_by_meta
+from analysis.models import CollectionUserLink, JobUserLink, DataUserLink
 from genomes.models import Species
+from genomes.genes import search_genes
 from django_nextflow.models import Pipeline
 
+PERMISSION_OBJECT_TYPES = {
+    "collection": "collection", "sample": "sample",
+    "execution": "job", "job": "job", "data": "data"
+}
+
+def get_owned_collections(owner):
+    """Gets the IDs of collections owned by a user whose name contains some
+    text, as a subquery - filtering on it rather than joining the links means
+    no collection appears once per matching owner."""
+
+    return CollectionUserLink.objects.filter(
+        permission=4, user__name__icontains=owner
+    ).values("collection")
+
+
+def get_owned_jobs(owner):
+    """Gets the jobs owned by a user whose name contains some text, directly or
+    through their collection or their sample's collection."""
+
+    collections = get_owned_collections(owner)
+    return Job.objects.filter(
+        Q(id__in=JobUserLink.objects.filter(
+            permission=4, user__name__icontains=owner
+        ).values("job")) |\
+        Q(collection__in=collections) | Q(sample__collection__in=collections)
+    )
+
+
 class Query(graphene.ObjectType):
 
     access_token = graphene.String()
@@ -19,7 +57,7 @@ class Query(graphene.ObjectType):
     group = graphene.Field("core.queries.GroupType", slug=graphene.String(required=True))
     groups = graphene.List("core.queries.GroupType")
 
-    public_collections = ConnectionField("analysis.queries.CollectionConnection")
+    public_collections = KeysetConnectionField("analysis.queries.CollectionConnection")
     user_collections = graphene.List("core.queries.CollectionType")
 
     collection = graphene.Field("analysis.queries.CollectionType", id=graphene.ID())
@@ -36,34 +74,45 @@ class Query(graphene.ObjectType):
         is_multiplexed=graphene.Boolean(),
     )
     check_annotation = graphene.List("genomes.queries.SpeciesType", id=graphene.ID())
+    permissions = graphene.List(
+        "core.queries.PermissionType",
+        objects=graphene.List("core.queries.PermissionObjectInput", required=True)
+    )
 
     pipeline = graphene.Field("analysis.queries.PipelineType", id=graphene.ID())
     pipelines = graphene.List("analysis.queries.PipelineType")
 
     all_species = graphene.List("genomes.queries.SpeciesType")
     species = graphene.Field("genomes.queries.SpeciesType", id=graphene.String())
+    genes = graphene.List(
+        "genomes.queries.GeneType",
+        species=graphene.String(required=True),
+        prefix=graphene.String(required=True),
+        first=graphene.Int(default_value=10),
+    )
 
     quick_search = graphene.Field("core.queries.SearchType", query=graphene.String(required=True))
-    search_collections = ConnectionField(
+    search_collections = KeysetConnectionField(
         "analysis.queries.CollectionConnection",
         name=graphene.String(),
         created=graphene.String(),
         owner=graphene.String(),
     )
-    search_samples = ConnectionField(
+    search_samples = KeysetConnectionField(
         "analysis.queries.SampleConnection",
         name=graphene.String(),
         created=graphene.String(),
         owner=graphene.String(),
         species=graphene.String(),
+        meta=GenericScalar(),
     )
-    search_executions = ConnectionField(
+    search_executions = KeysetConnectionField(
         "analysis.queries.ExecutionConnection",
         name=graphene.String(),
         created=graphene.String(),
         owner=graphene.String(),
     )
-    search_data = ConnectionField(
+    search_data = KeysetConnectionField(
         "analysis.queries.DataConnection",
         name=graphene.String(),
         created=graphene.String(),
@@ -94,7 +143,7 @@ class Query(graphene.ObjectType):
     
 
     def resolve_users(self, info, **kwargs):
-        return User.objects.all()
+        return optimize_queryset(User.objects.all(), info)
     
 
     def resolve_group(self, info, **kwargs):
@@ -104,53 +153,52 @@ class Query(graphene.ObjectType):
     
 
     def resolve_groups(self, info, **kwargs):
-        return Group.objects.all()
+        return optimize_queryset(Group.objects.all(), info)
     
 
     def resolve_public_collections(self, info, **kwargs):
-        return Collection.objects.filter(private=False)
+        return optimize_queryset(Collection.objects.filter(private=False), info)
     
 
     def resolve_user_collections(self, info, **kwargs):
         if not info.context.user: return []
-        collections = get_collections_by_user(info.context.user, 1, exact=False)
-        for group in info.context.user.groups.all():
-            collections |= get_collections_by_group(group, 1)
-        return collections.distinct()
+        return optimize_queryset(Collection.objects.filter(
+            id__in=get_accessible_collection_filter(info.context.user)
+        ), info)
     
 
     def resolve_collection(self, info, **kwargs):
         collection = Collection.objects.filter(id=kwargs["id"]).first()
-        if collection and does_user_have_permission_on_collection(info.context.user, collection, 1):
+        if collection and has_cached_permission(info, collection, 1):
             return collection
         raise GraphQLError('{"collection": "Does not exist"}')
     
 
     def resolve_sample(self, info, **kwargs):
         sample = Sample.objects.filter(id=kwargs["id"]).first()
-        if sample and does_user_have_permission_on_sample(info.context.user, sample,1 ):
+        if sample and has_cached_permission(info, sample, 1):
             return sample
         raise GraphQLError('{"sample": "Does not exist"}')
     
 
     def resolve_execution(self, info, **kwargs):
         job = Job.objects.filter(id=kwargs["id"]).first()
-        if job and does_user_have_permission_on_job(info.context.user, job, 1):
+        if job and has_cached_permission(info, job, 1):
             return job
         raise GraphQLError('{"execution": "Does not exist"}')
     
 
     def resolve_data_file(self, info, **kwargs):
         data = Data.objects.filter(id=kwargs["id"]).first()
-        if data and does_user_have_permission_on_data(info.context.user, data, 1):
+        if data and has_cached_permission(info, data, 1):
             return data
         raise GraphQLError('{"data": "Does not exist"}')
     
 
     def resolve_data(self, info, **kwargs):
-        data = Data.objects.filter(
-            filename__contains=kwargs["name"],
-            filetype__regex=kwargs["filetype"]
+        data = filter_by_filename(
+            Data.objects.filter(filetype__regex=kwargs["filetype"]),
+            kwargs["name"], case_sensitive=True
         )
         if kwargs.get("is_demultiplexed"):
             data = data.exclude(sample=None)
@@ -158,13 +206,14 @@ class Query(graphene.ObjectType):
             data = data.filter(link__is_multiplexed=True)
         if kwargs.get("is_annotation"):
             data = data.filter(link__is_annotation=True)
-        return readable_data(data, info.context.user).distinct()[:kwargs["first"]]
+        data = optimize_queryset(readable_data(data, info.context.user), info)
+        return data[:kwargs["first"]]
 
 
     def resolve_check_annotation(self, info, **kwargs):
         time.sleep(1)
         data = Data.objects.filter(id=kwargs["id"], link__is_annotation=True).first()
-        if data and does_user_have_permission_on_data(info.context.user, data, 1):
+        if data and has_cached_permission(info, data, 1):
             df = pd.read_csv(data.full_path)
             species = sorted(set([row["Species"] for _, row in df.iterrows()]))
             return [Species.objects.get(id=s) for s in species]
@@ -172,6 +221,25 @@ class Query(graphene.ObjectType):
 
     
 
+    def resolve_permissions(self, info, **kwargs):
+        if len(kwargs["objects"]) > MAX_PERMISSION_OBJECTS:
+            raise GraphQLError(json.dumps({"objects": f"No more than {MAX_PERMISSION_OBJECTS} objects allowed"}))
+        objects = []
+        for obj in kwargs["objects"]:
+            object_type = PERMISSION_OBJECT_TYPES.get(obj["type"])
+            if not object_type:
+                raise GraphQLError(json.dumps({"objects": "Unknown object type"}))
+            try:
+                objects.append([object_type, int(obj["id"])])
+            except ValueError:
+                raise GraphQLError(json.dumps({"objects": f"{obj['type']} ID {obj['id']} is not valid"}))
+        levels = get_permission_levels(info.context.user, objects)
+        return [{
+            "type": obj["type"], "id": obj["id"],
+            "level": levels[(object_type, id)]
+        } for obj, (object_type, id) in zip(kwargs["objects"], objects)]
+    
+
     def resolve_pipeline(self, info, **kwargs):
         pipeline = Pipeline.objects.filter(id=kwargs["id"]).first()
         if pipeline: return pipeline
@@ -179,26 +247,47 @@ class Query(graphene.ObjectType):
     
 
     def resolve_pipelines(self, info, **kwargs):
-        return Pipeline.objects.exclude(path="")
+        return optimize_queryset(Pipeline.objects.exclude(path=""), info)
     
 
     def resolve_all_species(self, info, **kwargs):
-        return Species.objects.all()
+        return optimize_queryset(Species.objects.all(), info)
     
 
     def resolve_species(self, info, **kwargs):
         return Species.objects.get(id=kwargs["id"])
     
 
+    def resolve_genes(self, info, **kwargs):
+        if kwargs["first"] < 1: raise GraphQLError('{"first": ["Must be positive"]}')
+        return search_genes(kwargs["species"], kwargs["prefix"], kwargs["first"])
+    
+
     def resolve_quick_search(self, info, **kwargs):
+        """The IDs of the best matches of each kind selected are looked up all
+        at once - the objects themselves are fetched by SearchType."""
+
         if len(kwargs["query"]) < 3: return None
-        return kwargs
+        user, query = info.context.user, kwargs["query"]
+        querysets = {
+            "collections": ("collection", lambda: readable_collections(Collection.objects.all(), user)),
+            "samples": ("sample", lambda: readable_samples(Sample.objects.all(), user)),
+            "executions": ("execution", lambda: readable_jobs(Job.objects.all(), user)),
+            "data": ("data", lambda: readable_data(Data.objects.all(), user)),
+            "groups": ("group", lambda: Group.objects.all()),
+            "users": ("user", lambda: User.objects.all()),
+        }
+        selected = get_selections(info.field_asts, info.fragments)
+        return {"query": query, **run_lookups({
+            name: lambda kind=kind, queryset=queryset: rank_ids(queryset(), kind, query, 25)
+            for name, (kind, queryset) in querysets.items() if name in selected
+        }, settings.QUICK_SEARCH_TIMEOUT)}
     
 
     def resolve_search_collections(self, info, **kwargs):
         collections = readable_collections(Collection.objects.all(), info.context.user)
         if "name" in kwargs:
-            collections = collections.filter(name__icontains=kwargs["name"])
+            collections = collections.filter(id__in=search_filter("collection", kwargs["name"]))
         if "created" in kwargs:
             timestamp = time.time() - {
                 "day": 86400, "week": 604800, "month": 2592000,
@@ -206,17 +295,14 @@ class Query(graphene.ObjectType):
             }.get(kwargs["created"], 0)
             collections = collections.filter(created__gte=timestamp)
         if "owner" in kwargs:
-            collections = collections.filter(
-                users__name__icontains=kwargs["owner"],
-                collectionuserlink__permission=4
-            )
-        return collections
+            collections = collections.filter(id__in=get_owned_collections(kwargs["owner"]))
+        return optimize_queryset(collections, info)
     
 
     def resolve_search_samples(self, info, **kwargs):
         samples = readable_samples(Sample.objects.all(), info.context.user)
         if "name" in kwargs:
-            samples = samples.filter(name__icontains=kwargs["name"])
+            samples = samples.filter(id__in=search_filter("sample", kwargs["name"]))
         if "created" in kwargs:
             timestamp = time.time() - {
                 "day": 86400, "week": 604800, "month": 2592000,
@@ -226,17 +312,20 @@ class Query(graphene.ObjectType):
         if "species" in kwargs:
             samples = samples.filter(species__name__icontains=kwargs["species"]) | samples.filter(species__latin_name__icontains=kwargs["species"])
         if "owner" in kwargs:
-            samples = samples.filter(
-                collection__users__name__icontains=kwargs["owner"],
-                collection__collectionuserlink__permission=4
-            )
-        return samples
+            samples = samples.filter(collection__in=get_owned_collections(kwargs["owner"]))
+        if "meta" in kwargs:
+            if not isinstance(kwargs["meta"], dict):
+                raise GraphQLError('{"meta": ["Must be an object of keys and values"]}')
+            if any(isinstance(value, (dict, list)) for value in kwargs["meta"].values()):
+                raise GraphQLError('{"meta": ["Values must be strings, numbers, booleans or null"]}')
+            samples = filter_samples_by_meta(samples, kwargs["meta"])
+        return optimize_queryset(samples, info)
     
 
     def resolve_search_executions(self, info, **kwargs):
         jobs = readable_jobs(Job.objects.all(), info.context.user)
         if "name" in kwargs:
-            jobs = jobs.filter(execution__pipeline__name__icontains=kwargs["name"])
+            jobs = jobs.filter(id__in=search_filter("execution", kwargs["name"]))
         if "created" in kwargs:
             timestamp = time.time() - {
                 "day": 86400, "week": 604800, "month": 2592000,
@@ -244,20 +333,14 @@ class Query(graphene.ObjectType):
             }.get(kwargs["created"], 0)
             jobs = jobs.filter(created__gte=timestamp)
         if "owner" in kwargs:
-            jobs = jobs.filter(
-                Q(users__name__icontains=kwargs["owner"], jobuserlink__permission=4) |\
-                Q(collection__users__name__icontains=kwargs["owner"], collection__collectionuserlink__permission=4) |\
-                Q(sample__collection__users__name__icontains=kwargs["owner"], sample__collection__collectionuserlink__permission=4)
-            )
-
-            
-        return jobs
+            jobs = jobs.filter(id__in=get_owned_jobs(kwargs["owner"]).values("id"))
+        return optimize_queryset(jobs, info)
     
 
     def resolve_search_data(self, info, **kwargs):
         data = readable_data(Data.objects.all(), info.context.user)
         if "name" in kwargs:
-            data = data.filter(filename__icontains=kwargs["name"])
+            data = filter_by_filename(data, kwargs["name"])
         if "created" in kwargs:
             timestamp = time.time() - {
                 "day": 86400, "week": 604800, "month": 2592000,
@@ -266,14 +349,16 @@ class Query(graphene.ObjectType):
             data = data.filter(created__gte=timestamp)
         if "owner" in kwargs:
             data = data.filter(
-                Q(datauserlink__user__name__icontains=kwargs["owner"], datauserlink__permission=4) |\
-                Q(upstream_process_execution__execution__job__users__name__icontains=kwargs["owner"], upstream_process_execution__execution__job__jobuserlink__permission=4) |\
-                Q(upstream_process_execution__execution__job__collection__users__name__icontains=kwargs["owner"], upstream_process_execution__execution__job__collection__collectionuserlink__permission=4) |\
-                Q(upstream_process_execution__execution__job__sample__collection__users__name__icontains=kwargs["owner"], upstream_process_execution__execution__job__sample__collection__collectionuserlink__permission=4)
+                Q(id__in=DataUserLink.objects.filter(
+                    permission=4, user__name__icontains=kwargs["owner"]
+                ).values("data")) |\
+                Q(upstream_process_execution__execution__in=get_owned_jobs(
+                    kwargs["owner"]
+                ).values("execution"))
             )
         if "filetype" in kwargs:
             data = data.filter(filetype__icontains=kwargs["filetype"])
-        return data
+        return optimize_queryset(data, info)
 
 
 
@@ -0,0 +1,266 @@
+"""A full-text index of the names and descriptions of the objects users search
+for, so that searches don't have to scan every table with icontains.
+
+Each object has one row in the search_entries table, holding its searchable
+text broken into lower case words. On PostgreSQL the row also has a tsvector
+column generated from that text, with a GIN index on it. On SQLite an FTS5
+table mirrors the text, kept in step by triggers. The rows themselves are
+kept up to date by the handlers in core.signals, and can be rebuilt from
+scratch with the rebuildsearchindex command.
+
+Searches match every word given as a prefix of some word in the object's
+text, and results are ranked by relevance (ts_rank or bm25) within whatever
+the user is allowed to see. Quick search looks up each kind of object at
+once, on a pool of threads with their own database connections, and gives up
+on any kind which takes too long."""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from django.conf import settings
+from django.db import connection, OperationalError
+from django.db.models.expressions import RawSQL
+
+SEARCH_FIELDS = {
+    "collection": ("analysis.Collection", ["name", "description"]),
+    "sample": ("analysis.Sample", ["name", "species__name", "species__latin_name"]),
+    "execution": ("analysis.Job", ["execution__pipeline__name"]),
+    "data": ("django_nextflow.Data", ["filename"]),
+    "group": ("core.Group", ["name", "description"]),
+    "user": ("core.User", ["name"]),
+}
+
+def get_words(text):
+    """Breaks text into lower case words, splitting on anything which isn't a
+    letter or a digit - so that file names are searchable by their parts."""
+
+    return [word for word in re.split(r"[\W_]+", (text or "").lower()) if word]
+
+
+def get_document(values):
+    """Gets the searchable text made from some field values."""
+
+    return " ".join(word for value in values for word in get_words(value))
+
+
+def get_entries(kind, queryset):
+    """Gets the search entry values for the objects of a queryset, as (kind,
+    object ID, document) tuples."""
+
+    fields = SEARCH_FIELDS[kind][1]
+    return [(kind, row[0], get_document(row[1:]))
+        for row in queryset.values_list("id", *fields)]
+
+
+def get_search_source(kind, instance):
+    """Gets the values of the fields on an object which its search entry is
+    made from - following a relation counts as the relation's own column.
+    Deferred fields are read as None rather than triggering a query."""
+
+    model = type(instance)
+    return [instance.__dict__.get(model._meta.get_field(field.split("__")[0]).attname)
+        for field in SEARCH_FIELDS[kind][1]]
+
+
+def save_entries(entries):
+    """Replaces the search entries for the objects given entries for."""
+
+    from core.models import SearchEntry
+    for kind in set(entry[0] for entry in entries):
+        remove_objects(kind, [entry[1] for entry in entries if entry[0] == kind])
+    SearchEntry.objects.bulk_create([SearchEntry(
+        kind=kind, object_id=object_id, document=document
+    ) for kind, object_id, document in entries])
+
+
+def index_objects(kind, queryset):
+    """Replaces the search entries of the objects in a queryset."""
+
+    save_entries(get_entries(kind, queryset))
+
+
+def index_instance(kind, instance):
+    """Replaces the search entry of an object which has just been saved. If
+    the text only comes from the object's own columns, no query is needed to
+    read it."""
+
+    fields = SEARCH_FIELDS[kind][1]
+    if any("__" in field for field in fields):
+        index_objects(kind, type(instance).objects.filter(id=instance.id))
+    else:
+        save_entries([(kind, instance.id, get_document(
+            getattr(instance, field) for field in fields
+        ))])
+
+
+def remove_objects(kind, ids):
+    """Removes the search entries of the objects with the IDs given."""
+
+    from core.models import SearchEntry
+    SearchEntry.objects.filter(kind=kind, object_id__in=ids).delete()
+
+
+def rebuild_search_index():
+    """Rebuilds every search entry from the tables being searched."""
+
+    from django.apps import apps
+    from core.models import SearchEntry
+    SearchEntry.objects.all().delete()
+    for kind, (model, _) in SEARCH_FIELDS.items():
+        entries = get_entries(kind, apps.get_model(model).objects.all())
+        SearchEntry.objects.bulk_create([SearchEntry(
+            kind=kind, object_id=object_id, document=document
+        ) for kind, object_id, document in entries], batch_size=5000)
+
+
+def get_match_sql(query):
+    """Gets the SQL which matches search entries against a query, with its
+    parameters, or None if the query has no words in it. Words are only ever
+    letters and digits, so they can't break out of the query syntax."""
+
+    words = get_words(query)
+    if not words: return None
+    if connection.vendor == "postgresql":
+        return "vector @@ to_tsquery('simple', %s)", [" & ".join(f"{w}:*" for w in words)]
+    return (
+        "id IN (SELECT rowid FROM search_entries_fts WHERE search_entries_fts MATCH %s)",
+        [" ".join(f'"{w}"*' for w in words)]
+    )
+
+
+def search_filter(kind, query):
+    """Gets a subquery of the IDs of every object of a kind matching a query,
+    for filtering a queryset with id__in."""
+
+    match = get_match_sql(query)
+    if not match: return RawSQL("SELECT NULL WHERE 1 = 0", [])
+    return RawSQL(
+        f"SELECT object_id FROM search_entries WHERE kind = %s AND {match[0]}",
+        [kind, *match[1]]
+    )
+
+
+def get_rank_sql(kind, query, table):
+    """Gets the SQL for how well the object in each row of a table matches a
+    query (higher is better), with its parameters, or None if the query has
+    no words in it. It is a subquery correlated with the row's ID, so it can
+    rank a queryset after everything else has filtered it."""
+
+    words = get_words(query)
+    if not words: return None
+    column = f"{connection.ops.quote_name(table)}.{connection.ops.quote_name('id')}"
+    if connection.vendor == "postgresql":
+        return (
+            "(SELECT ts_rank(e.vector, to_tsquery('simple', %s)) FROM search_entries e "
+            f"WHERE e.kind = %s AND e.object_id = {column})",
+            [" & ".join(f"{w}:*" for w in words), kind]
+        )
+    return (
+        "(SELECT -search_entries_fts.rank FROM search_entries e, search_entries_fts "
+        f"WHERE e.kind = %s AND e.object_id = {column} AND search_entries_fts.rowid = e.id "
+        "AND search_entries_fts MATCH %s)",
+        [kind, " ".join(f'"{w}"*' for w in words)]
+    )
+
+
+def rank_ids(queryset, kind, query, limit):
+    """Gets the IDs of the objects of a queryset which best match a query, best
+    first. The queryset should already be restricted to what the user can
+    see - matches are ranked and limited in the same query which applies
+    that restriction, so nothing the user can see is crowded out by things
+    they can't."""
+
+    rank = get_rank_sql(kind, query, queryset.model._meta.db_table)
+    if not rank: return []
+    return list(queryset.prefetch_related(None).filter(
+        id__in=search_filter(kind, query)
+    ).annotate(
+        search_rank=RawSQL(*rank)
+    ).order_by("-search_rank", "-id").values_list("id", flat=True)[:limit])
+
+
+def fetch_ranked(queryset, ids):
+    """Gets the objects with the IDs given from a queryset, in the same order
+    as the IDs."""
+
+    if not ids: return []
+    objects = {obj.id: obj for obj in queryset.filter(id__in=ids).distinct()}
+    return [objects[id] for id in ids if id in objects]
+
+
+def rank_queryset(queryset, kind, query, limit):
+    """Gets the objects of a queryset which best match a query, best first.
+    The queryset should already be restricted to what the user can see, and
+    should have had any select_related or prefetch_related applied."""
+
+    return fetch_ranked(queryset, rank_ids(queryset, kind, query, limit))
+
+
+SEARCH_EXECUTOR = {"executor": None}
+
+def get_search_executor():
+    """Gets the thread pool quick search lookups are run on, starting it the
+    first time it is needed."""
+
+    if SEARCH_EXECUTOR["executor"] is None:
+        SEARCH_EXECUTOR["executor"] = ThreadPoolExecutor(
+            max_workers=settings.QUICK_SEARCH_WORKERS, thread_name_prefix="search"
+        )
+    return SEARCH_EXECUTOR["executor"]
+
+
+def prepare_connection(timeout):
+    """Gets a worker thread's database connection ready for a lookup. Each
+    worker keeps its connection between lookups rather than connecting for
+    every keystroke, so it is only replaced if an error has left it unusable.
+    PostgreSQL is told once per connection to cancel queries which overrun,
+    so abandoned lookups don't keep running."""
+
+    if connection.errors_occurred and connection.connection is not None:
+        if connection.is_usable():
+            connection.errors_occurred = False
+        else: connection.close()
+    if connection.vendor == "postgresql":
+        connection.ensure_connection()
+        if getattr(connection, "search_timeout", None) != (connection.connection, timeout):
+            with connection.cursor() as cursor:
+                cursor.execute("SET statement_timeout = %s", [int(timeout * 1000)])
+            connection.search_timeout = (connection.connection, timeout)
+
+
+def run_lookup(lookup, timeout):
+    """Runs a lookup on a worker thread, which has a database connection of its
+    own. A lookup cancelled by PostgreSQL for overrunning has None as its
+    result."""
+
+    prepare_connection(timeout)
+    try:
+        return lookup()
+    except OperationalError:
+        if connection.vendor != "postgresql": raise
+        return None
+
+
+def run_lookups(lookups, timeout):
+    """Runs a dictionary of lookups all at once, returning a dictionary of
+    their results. Any lookup which hasn't finished within the timeout has
+    None as its result.
+
+    Worker threads can't see writes the current connection hasn't committed,
+    so inside a transaction (as in tests) the lookups are run one after
+    another here instead."""
+
+    if connection.in_atomic_block or not settings.QUICK_SEARCH_WORKERS:
+        return {name: lookup() for name, lookup in lookups.items()}
+    executor = get_search_executor()
+    futures = {name: executor.submit(run_lookup, lookup, timeout)
+        for name, lookup in lookups.items()}
+    deadline = time.monotonic() + timeout
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            future.cancel()
+            results[name] = None
+    return results
@@ -0,0 +1,322 @@
+"""Signal handlers which keep the effective permission table in step with the
+link tables and parent relationships it is derived from, and the ancestry
+columns copied onto DataLink in step with the jobs, samples and collections
+they are copied from. Collections' cached counts are discarded whenever
+something they contain changes, cached responses whenever anything public
+queries can read from changes, and search entries whenever the text they are
+made from changes. The in-memory filename index is invalidated whenever a
+filename changes."""
+
+from django.apps import apps
+from django.db.models import signals, Q
+from django.dispatch import receiver
+from django_nextflow.models import Data, Pipeline
+from core.models import User, Group, UserGroupLink, EffectivePermission, SearchEntry
+from core.permissions import refresh_effective_permissions, remove_effective_permissions, collections_changed, OBJECT_TYPES
+from analysis.models import Collection, CollectionUserLink, CollectionGroupLink, Sample, SampleUserLink, Job, JobUserLink, DataLink, DataUserLink, update_data_link_ancestry
+from analysis.models import CollectionStats, invalidate_collection_stats
+from core.responses import responses_changed
+from core.search import get_search_source, index_instance, index_objects, remove_objects
+from core.filenames import filenames_changed
+from genomes.models import Species
+
+RESPONSE_APPS = ["core", "analysis", "genomes", "django_nextflow"]
+
+DERIVED_MODELS = [EffectivePermission, CollectionStats, SearchEntry]
+
+RESPONSE_MODELS = [model for label in RESPONSE_APPS
+    for model in apps.get_app_config(label).get_models() if model not in DERIVED_MODELS]
+
+SEARCH_KINDS = {
+    Collection: "collection", Sample: "sample", Job: "execution",
+    Data: "data", Group: "group", User: "user",
+}
+
+PARENT_FIELDS = {
+    Sample: ["collection_id"],
+    Job: ["collection_id", "sample_id", "execution_id"],
+    DataLink: ["collection_id"],
+    Data: ["upstream_process_execution_id"],
+}
+
+def get_parents(instance):
+    """Gets the values of the fields an object inherits permissions through,
+    without triggering a query for any which were deferred."""
+
+    return [instance.__dict__.get(field) for field in PARENT_FIELDS[type(instance)]]
+
+
+def parents_changed(instance, created):
+    """Checks whether an object has just been created or has had its parents
+    changed since it was loaded, and takes a new snapshot of its parents."""
+
+    changed = created or get_parents(instance) != instance._permission_parents
+    instance._permission_parents = get_parents(instance)
+    return changed
+
+
+signals.post_init.connect(
+    lambda sender, instance, **kwargs: setattr(
+        instance, "_was_private", instance.__dict__.get("private")
+    ), sender=Collection, weak=False
+)
+
+for model in PARENT_FIELDS:
+    signals.post_init.connect(
+        lambda sender, instance, **kwargs: setattr(
+            instance, "_permission_parents", get_parents(instance)
+        ), sender=model, weak=False
+    )
+
+
+@receiver([signals.post_save, signals.post_delete], sender=CollectionUserLink)
+def collection_user_link_changed(sender, instance, **kwargs):
+    refresh_effective_permissions(
+        collections=[instance.collection_id], users=[instance.user_id]
+    )
+
+
+@receiver([signals.post_save, signals.post_delete], sender=CollectionGroupLink)
+def collection_group_link_changed(sender, instance, **kwargs):
+    refresh_effective_permissions(collections=[instance.collection_id])
+
+
+@receiver([signals.post_save, signals.post_delete], sender=UserGroupLink)
+def user_group_link_changed(sender, instance, **kwargs):
+    refresh_effective_permissions(
+        collections=CollectionGroupLink.objects.filter(
+            group=instance.group_id
+        ).values_list("collection", flat=True),
+        users=[instance.user_id]
+    )
+
+
+@receiver([signals.post_save, signals.post_delete], sender=SampleUserLink)
+def sample_user_link_changed(sender, instance, **kwargs):
+    refresh_effective_permissions(
+        samples=[instance.sample_id], users=[instance.user_id]
+    )
+
+
+@receiver([signals.post_save, signals.post_delete], sender=JobUserLink)
+def job_user_link_changed(sender, instance, **kwargs):
+    refresh_effective_permissions(jobs=[instance.job_id], users=[instance.user_id])
+
+
+@receiver([signals.post_save, signals.post_delete], sender=DataUserLink)
+def data_user_link_changed(sender, instance, **kwargs):
+    refresh_effective_permissions(data=[instance.data_id], users=[instance.user_id])
+
+
+def get_sample_collections(*sample_ids):
+    sample_ids = [id for id in sample_ids if id]
+    if not sample_ids: return []
+    return list(Sample.objects.filter(id__in=sample_ids).values_list("collection", flat=True))
+
+
+def get_link_collections(links):
+    return [id for ids in links.values_list("collection", "effective_collection") for id in ids]
+
+
+@receiver([signals.post_save, signals.post_delete], sender=Sample)
+def sample_contents_changed(sender, instance, created=None, **kwargs):
+    old = instance._permission_parents
+    if created is False and get_parents(instance) == old: return
+    invalidate_collection_stats([old[0], instance.collection_id])
+
+
+@receiver([signals.post_save, signals.post_delete], sender=Job)
+def job_contents_changed(sender, instance, created=None, **kwargs):
+    """Jobs count towards their collection's executions, and their data
+    towards their sample's collection too."""
+
+    old = instance._permission_parents
+    if created is False and get_parents(instance) == old: return
+    invalidate_collection_stats([old[0], instance.collection_id] + get_sample_collections(
+        old[1], instance.sample_id
+    ))
+
+
+@receiver(signals.post_delete, sender=DataLink)
+def data_link_deleted(sender, instance, **kwargs):
+    invalidate_collection_stats([instance.collection_id, instance.effective_collection_id])
+
+
+@receiver(signals.post_save, sender=Collection)
+def collection_saved(sender, instance, created, **kwargs):
+    if not created and instance.private != instance._was_private:
+        collections_changed()
+    instance._was_private = instance.private
+
+
+@receiver(signals.post_save, sender=Sample)
+def sample_saved(sender, instance, created, **kwargs):
+    if parents_changed(instance, created):
+        update_data_link_ancestry(DataLink.objects.filter(sample=instance.id))
+        refresh_effective_permissions(samples=[instance.id])
+
+
+@receiver(signals.post_save, sender=Job)
+def job_saved(sender, instance, created, **kwargs):
+    if parents_changed(instance, created):
+        links = Q(job=instance.id)
+        if instance.execution_id:
+            links |= Q(data__upstream_process_execution__execution=instance.execution_id)
+        update_data_link_ancestry(DataLink.objects.filter(links))
+        refresh_effective_permissions(jobs=[instance.id])
+
+
+@receiver(signals.post_save, sender=DataLink)
+def data_link_saved(sender, instance, created, **kwargs):
+    old = instance._permission_parents
+    if parents_changed(instance, created):
+        links = DataLink.objects.filter(id=instance.id)
+        update_data_link_ancestry(links)
+        invalidate_collection_stats(old + get_link_collections(links))
+        refresh_effective_permissions(data=[instance.data_id])
+
+
+@receiver(signals.post_save, sender=Data)
+def data_saved(sender, instance, created, **kwargs):
+    if parents_changed(instance, created):
+        links = DataLink.objects.filter(data=instance.id)
+        stale = [] if created else get_link_collections(links)
+        update_data_link_ancestry(links)
+        if not created: invalidate_collection_stats(stale + get_link_collections(links))
+        refresh_effective_permissions(data=[instance.id])
+
+
+@receiver(signals.pre_delete, sender=Collection)
+def collection_deleting(sender, instance, **kwargs):
+    instance._permission_children = {
+        "jobs": list(instance.jobs.values_list("id", flat=True)),
+        "data": list(DataLink.objects.filter(
+            Q(collection=instance) | Q(effective_collection=instance)
+        ).values_list("data", flat=True)),
+    }
+
+
+@receiver(signals.pre_delete, sender=Sample)
+def sample_deleting(sender, instance, **kwargs):
+    instance._permission_children = {
+        "jobs": list(instance.jobs.values_list("id", flat=True)),
+        "data": list(instance.data_links.values_list("data", flat=True)),
+    }
+
+
+@receiver(signals.pre_delete, sender=Job)
+def job_deleting(sender, instance, **kwargs):
+    instance._permission_children = {"data": list(Data.objects.filter(
+        upstream_process_execution__execution__job=instance
+    ).values_list("id", flat=True))}
+
+
+@receiver(signals.post_delete, sender=Collection)
+@receiver(signals.post_delete, sender=Sample)
+@receiver(signals.post_delete, sender=Job)
+@receiver(signals.post_delete, sender=Data)
+def object_deleted(sender, instance, **kwargs):
+    """When an object is deleted its own rows are removed, and any objects
+    which have had their link to it set to null are recalculated."""
+
+    children = getattr(instance, "_permission_children", {})
+    if children.get("data"):
+        update_data_link_ancestry(DataLink.objects.filter(data__in=children["data"]))
+    remove_effective_permissions(OBJECT_TYPES[sender], instance.id)
+    refresh_effective_permissions(**children)
+
+
+@receiver(signals.post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    EffectivePermission.objects.filter(user=instance.id).delete()
+    collections_changed()
+
+
+PRIVATE_USER_FIELDS = ["email", "password", "last_login", "password_reset_token",
+    "password_reset_token_expiry"]
+
+def get_public_user_fields(user):
+    """Gets the values of the user fields public queries can read, without
+    triggering a query for any which were deferred."""
+
+    return [user.__dict__.get(field.attname) for field in User._meta.concrete_fields
+        if field.name not in PRIVATE_USER_FIELDS]
+
+
+signals.post_init.connect(
+    lambda sender, instance, **kwargs: setattr(
+        instance, "_public_fields", get_public_user_fields(instance)
+    ), sender=User, weak=False
+)
+
+
+def public_data_changed(sender, **kwargs):
+    """Cached responses are thrown away when anything public queries can read
+    is written to. Tables derived from others aren't watched, as they only
+    change when what they are derived from does - and watching a model's
+    deletes would stop Django deleting its rows in bulk."""
+
+    responses_changed()
+
+
+def user_saved(sender, instance, created, **kwargs):
+    """Saving a user only throws cached responses away if a field public
+    queries can read has changed, so that logging in (which sets last_login)
+    doesn't."""
+
+    fields = get_public_user_fields(instance)
+    if created or fields != instance._public_fields: responses_changed()
+    instance._public_fields = fields
+
+
+for model in RESPONSE_MODELS:
+    signals.post_save.connect(user_saved if model is User else public_data_changed, sender=model)
+    signals.post_delete.connect(public_data_changed, sender=model)
+    for field in model._meta.many_to_many:
+        signals.m2m_changed.connect(public_data_changed, sender=field.remote_field.through)
+
+
+for model in SEARCH_KINDS:
+    signals.post_init.connect(
+        lambda sender, instance, **kwargs: setattr(
+            instance, "_search_source", get_search_source(SEARCH_KINDS[sender], instance)
+        ), sender=model, weak=False
+    )
+    signals.post_delete.connect(
+        lambda sender, instance, **kwargs: remove_objects(
+            SEARCH_KINDS[sender], [instance.id]
+        ), sender=model, weak=False
+    )
+
+
+@receiver(signals.post_save, sender=Collection)
+@receiver(signals.post_save, sender=Sample)
+@receiver(signals.post_save, sender=Job)
+@receiver(signals.post_save, sender=Data)
+@receiver(signals.post_save, sender=Group)
+@receiver(signals.post_save, sender=User)
+def searchable_object_saved(sender, instance, created, **kwargs):
+    """Objects are only reindexed if the columns their text comes from have
+    changed since they were loaded."""
+
+    source = get_search_source(SEARCH_KINDS[sender], instance)
+    if created or source != instance._search_source:
+        index_instance(SEARCH_KINDS[sender], instance)
+        if sender is Data: filenames_changed([instance.id])
+    instance._search_source = source
+
+
+@receiver(signals.post_delete, sender=Data)
+def data_deleted(sender, instance, **kwargs):
+    filenames_changed([instance.id])
+
+
+@receiver(signals.post_save, sender=Species)
+def species_saved(sender, instance, **kwargs):
+    index_objects("sample", Sample.objects.filter(species=instance))
+
+
+@receiver(signals.post_save, sender=Pipeline)
+def pipeline_saved(sender, instance, created, **kwargs):
+    if not created:
+        index_objects("execution", Job.objects.filter(execution__pipeline=instance))
@@ -0,0 +1,78 @@
+import json
+from mixer.backend.django import mixer
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from core.models import User
+from analysis.models import Collection, CollectionUserLink
+
+class BatchedOperationTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        for _ in range(3):
+            collection = mixer.blend(Collection, private=True)
+            CollectionUserLink.objects.create(collection=collection, user=self.user, permission=4)
+    
+
+    def post(self, body):
+        return self.client.post(
+            "/graphql", json.dumps(body), content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {self.user.make_jwt(900)}"
+        )
+    
+
+    def test_single_operations_are_not_batched(self):
+        response = self.post({"query": "{ me { username } }"})
+        self.assertEqual(response.json()["data"], {"me": {"username": self.user.username}})
+    
+
+    def test_batches_return_a_result_per_operation(self):
+        response = self.post([
+            {"query": "{ me { username } }"},
+            {"query": "query($n: Int) { userCollections { name } searchData(first: $n) { count } }", "variables": {"n": 2}},
+            {"query": "{ nothing }"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]["data"], {"me": {"username": self.user.username}})
+        self.assertEqual(len(results[1]["data"]["userCollections"]), 3)
+        self.assertEqual(results[1]["extensions"]["cost"]["depth"], 1)
+        self.assertEqual(results[2]["status"], 400)
+        self.assertIn("nothing", results[2]["errors"][0]["message"])
+    
+
+    def test_operations_share_request_caches(self):
+        query = {"query": "{ userCollections { isOwner sampleCount } }"}
+        self.post(query)
+        with CaptureQueriesContext(connection) as single:
+            self.post(query)
+        with CaptureQueriesContext(connection) as batched:
+            results = self.post([query, query]).json()
+        self.assertEqual(results[0]["data"], results[1]["data"])
+        self.assertLess(len(batched), 2 * len(single))
+    
+
+    def test_batch_size_is_limited(self):
+        with self.settings(QUERY_BATCH_SIZE=2):
+            response = self.post([{"query": "{ me { username } }"}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("at most 2", response.json()["errors"][0]["message"])
+    
+
+    def test_operations_must_be_objects(self):
+        response = self.post([1])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("JSON objects", response.json()["errors"][0]["message"])
+        self.assertEqual(self.post([{"query": "{ me { username } }"}, "{ me { name } }"]).status_code, 400)
+    
+
+    def test_operations_share_a_cost_budget(self):
+        query = {"query": "query($n: Int) { searchData(first: $n) { edges { node { filename } } } }", "variables": {"n": 30}}
+        cost = self.post(query).json()["extensions"]["cost"]["cost"]
+        with self.settings(QUERY_COST_BUDGETS={"anonymous": cost, "user": cost * 2, "admin": cost}):
+            results = self.post([query, query, query]).json()
+        self.assertIn("data", results[0])
+        self.assertIn("data", results[1])
+        self.assertIn("exceeds the budget", results[2]["errors"][0]["message"])
@@ -0,0 +1,67 @@
+from django.test import TestCase
+from core.benchmark import *
+from core.models import EffectivePermission
+
+class BenchmarkDataTests(TestCase):
+
+    def test_can_seed_data(self):
+        timings = seed_benchmark_data(**SCALES["tiny"])
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(Collection.objects.count(), 10)
+        self.assertEqual(Sample.objects.count(), 40)
+        self.assertEqual(Data.objects.count(), 200)
+        self.assertEqual(Job.objects.count(), 36)
+        self.assertEqual(DataLink.objects.count(), 200)
+        self.assertTrue(EffectivePermission.objects.exists())
+        self.assertEqual(permissions.find_effective_permission_errors(), [])
+        self.assertEqual(set(timings), {
+            "users", "collections", "samples", "jobs", "data", "effective_permissions",
+            "search_index"
+        })
+    
+
+    def test_seeded_ancestry_matches_signals(self):
+        seed_benchmark_data(**SCALES["tiny"])
+        expected = list(DataLink.objects.order_by("id").values_list(
+            "job", "sample", "effective_collection"
+        ))
+        from analysis.models import update_data_link_ancestry
+        update_data_link_ancestry(DataLink.objects.all())
+        self.assertEqual(list(DataLink.objects.order_by("id").values_list(
+            "job", "sample", "effective_collection"
+        )), expected)
+
+
+
+class BenchmarkRunTests(TestCase):
+
+    def test_every_permission_function_is_benchmarked(self):
+        seed_benchmark_data(**SCALES["tiny"])
+        results = run_benchmarks(repeat=1)
+        names = {r["name"] for r in results if r["group"] == "permissions"}
+        public = {name for name in dir(permissions) if callable(getattr(permissions, name))
+            and getattr(getattr(permissions, name), "__module__", "") == "core.permissions"
+            and name not in ["chunks", "raise_level", "inherit_levels", "remove_effective_permissions",
+            "collections_changed"]}
+        self.assertEqual(public - names, set())
+        self.assertEqual({r["name"] for r in results if r["group"] == "resolvers"}, set(RESOLVER_QUERIES))
+        for result in results:
+            self.assertGreaterEqual(result["max_ms"], result["min_ms"])
+    
+
+    def test_can_compare_reports(self):
+        baseline = {"results": [
+            {"group": "permissions", "name": "a", "queries": 1, "median_ms": 10},
+            {"group": "permissions", "name": "b", "queries": 2, "median_ms": 10},
+            {"group": "permissions", "name": "c", "queries": 2, "median_ms": 10},
+        ]}
+        report = {"results": [
+            {"group": "permissions", "name": "a", "queries": 1, "median_ms": 12},
+            {"group": "permissions", "name": "b", "queries": 3, "median_ms": 10},
+            {"group": "permissions", "name": "c", "queries": 2, "median_ms": 20},
+            {"group": "permissions", "name": "d", "queries": 9, "median_ms": 99},
+        ]}
+        self.assertEqual(compare_reports(report, baseline), [
+            "permissions.b: 2 -> 3 queries", "permissions.c: 10 -> 20 ms"
+        ])
@@ -0,0 +1,90 @@
+import json
+from graphql import parse
+from mixer.backend.django import mixer
+from django.test import TestCase, override_settings
+from core.cost import *
+from core.models import User
+from core.schema import schema
+
+class QueryCostTests(TestCase):
+
+    def cost(self, query, variables=None, operation_name=None):
+        return get_query_cost(schema, parse(query), variables, operation_name)
+    
+
+    def test_scalars_are_free(self):
+        self.assertEqual(self.cost("{ accessToken }"), (0, 0))
+        self.assertEqual(self.cost("{ me { name email } }"), (1, 1))
+    
+
+    def test_lists_are_multiplied(self):
+        self.assertEqual(self.cost("{ users { name } }"), (DEFAULT_LIST_SIZE, 1))
+        self.assertEqual(self.cost("{ users { groups { name } } }"), (
+            DEFAULT_LIST_SIZE * (1 + DEFAULT_LIST_SIZE), 2
+        ))
+    
+
+    def test_connections_use_page_size(self):
+        query = "query($n: Int) { searchData(first: $n) { count edges { node { filename } } } }"
+        self.assertEqual(self.cost(query, {"n": 10}), (1 + 10 * 2, 3))
+        self.assertEqual(self.cost(query, {}), (1 + DEFAULT_LIST_SIZE * 2, 3))
+    
+
+    def test_fragments_and_operations(self):
+        query = """query A { me { ...F } } query B { users { ...F } }
+        fragment F on UserType { groups { name } }"""
+        self.assertEqual(self.cost(query, operation_name="A"), (1 + DEFAULT_LIST_SIZE, 2))
+        self.assertEqual(self.cost(query, operation_name="B")[1], 2)
+    
+
+    def test_introspection_is_free(self):
+        self.assertEqual(self.cost("{ __schema { types { name fields { name } } } }"), (0, 0))
+    
+
+    def test_expensive_fields_cost_more(self):
+        self.assertEqual(self.cost('{ execution(id: 1) { log } }'), (11, 1))
+
+
+
+class QueryBudgetTests(TestCase):
+
+    def post(self, query, user=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {user.make_jwt(900)}"} if user else {}
+        response = self.client.post(
+            "/graphql", json.dumps({"query": query}),
+            content_type="application/json", **headers
+        )
+        return response.status_code, response.json()
+    
+
+    def test_cost_is_reported(self):
+        status, result = self.post("{ users { name } }")
+        self.assertEqual(status, 200)
+        self.assertEqual(result["extensions"]["cost"], {
+            "cost": DEFAULT_LIST_SIZE, "depth": 1, "budget": 5000
+        })
+    
+
+    def test_expensive_queries_are_rejected(self):
+        status, result = self.post("""{ searchData { edges { node { downstreamExecutions {
+            upstreamData { users { collections { allData { id } } } }
+        } } } } }""")
+        self.assertEqual(status, 400)
+        self.assertNotIn("data", result)
+        self.assertIn("exceeds the budget", json.loads(result["errors"][0]["message"])["query"][0])
+    
+
+    @override_settings(QUERY_MAX_DEPTH=2)
+    def test_deep_queries_are_rejected(self):
+        status, result = self.post("{ users { groups { users { name } } } }")
+        self.assertEqual(status, 400)
+        self.assertIn("depth", result["errors"][0]["message"])
+    
+
+    def test_budgets_depend_on_user(self):
+        query = "{ users { groups { name } } }"
+        self.assertEqual(self.post(query)[0], 200)
+        with self.settings(QUERY_COST_BUDGETS={"anonymous": 10, "user": 10000, "admin": 0}):
+            self.assertEqual(self.post(query)[0], 400)
+            self.assertEqual(self.post(query, mixer.blend(User, is_admin=False))[0], 200)
+            self.assertEqual(self.post(query, mixer.blend(User, is_admin=True))[0], 400)
@@ -0,0 +1,103 @@
+import json
+import tempfile
+from unittest.mock import patch
+from django.test import TestCase, override_settings
+from core.documents import *
+from core.schema import schema
+
+class DocumentCacheTests(TestCase):
+
+    def setUp(self):
+        DOCUMENTS.clear()
+        get_registered_queries.cache_clear()
+    
+
+    def test_documents_are_parsed_once(self):
+        with patch("core.documents.parse", wraps=parse) as mock_parse:
+            document = get_document(schema, "{ users { name } }")
+            self.assertIs(get_document(schema, "{ users { name } }"), document)
+        self.assertEqual(mock_parse.call_count, 1)
+        self.assertEqual(document.execute().errors, None)
+    
+
+    def test_invalid_documents_keep_their_errors(self):
+        document = get_document(schema, "{ nothing }")
+        result = document.execute()
+        self.assertTrue(result.invalid)
+        self.assertIn("nothing", result.errors[0].message)
+    
+
+    @override_settings(QUERY_CACHE_SIZE=2)
+    def test_least_recently_used_documents_are_dropped(self):
+        queries = ["{ users { name } }", "{ groups { name } }", "{ me { name } }"]
+        get_document(schema, queries[0])
+        get_document(schema, queries[1])
+        get_document(schema, queries[0])
+        get_document(schema, queries[2])
+        self.assertEqual(
+            list(DOCUMENTS), [get_query_hash(queries[0]), get_query_hash(queries[2])]
+        )
+
+
+
+class PersistedQueryTests(TestCase):
+
+    def setUp(self):
+        DOCUMENTS.clear()
+        get_registered_queries.cache_clear()
+        self.query = "{ users { name } }"
+        self.hash = get_query_hash(self.query)
+        self.file = tempfile.NamedTemporaryFile("w", suffix=".json")
+        json.dump({self.hash: self.query, "0" * 64: "{ me { name } }"}, self.file)
+        self.file.flush()
+    
+
+    def tearDown(self):
+        self.file.close()
+        get_registered_queries.cache_clear()
+    
+
+    def post(self, body):
+        response = self.client.post(
+            "/graphql", json.dumps(body), content_type="application/json"
+        )
+        return response.status_code, response.json()
+    
+
+    def persisted(self, query_hash):
+        return {"persistedQuery": {"version": 1, "sha256Hash": query_hash}}
+    
+
+    def test_unknown_hashes_are_reported(self):
+        status, result = self.post({"extensions": self.persisted(self.hash)})
+        self.assertEqual(status, 200)
+        self.assertEqual(result["errors"][0]["message"], "PersistedQueryNotFound")
+    
+
+    def test_hash_can_be_used_once_query_is_seen(self):
+        status, result = self.post({"query": self.query, "extensions": self.persisted(self.hash)})
+        self.assertEqual(result, {"data": {"users": []}, "extensions": result["extensions"]})
+        status, result = self.post({"extensions": self.persisted(self.hash)})
+        self.assertEqual(status, 200)
+        self.assertEqual(result["data"], {"users": []})
+    
+
+    def test_mismatched_hash_is_rejected(self):
+        status, result = self.post({"query": self.query, "extensions": self.persisted("0" * 64)})
+        self.assertEqual(result["errors"][0]["message"], "provided sha does not match query")
+    
+
+    def test_registered_queries_can_be_used_by_hash(self):
+        with self.settings(PERSISTED_QUERIES_FILE=self.file.name):
+            self.assertEqual(get_registered_queries(), {self.hash: self.query})
+            status, result = self.post({"extensions": self.persisted(self.hash)})
+        self.assertEqual(result["data"], {"users": []})
+    
+
+    def test_allow_list_mode(self):
+        with self.settings(PERSISTED_QUERIES_FILE=self.file.name, PERSISTED_QUERIES_ONLY=True):
+            status, result = self.post({"query": "{ groups { name } }"})
+            self.assertEqual(status, 400)
+            self.assertIn("registered", result["errors"][0]["message"])
+            status, result = self.post({"query": self.query})
+            self.assertEqual(result["data"], {"users": []})
@@ -0,0 +1,97 @@
+import json
+from mixer.backend.django import mixer
+from django.db import connection
+from django.test import TestCase
+from django_nextflow.models import Data
+from core.filenames import *
+
+class NgramIndexTests(TestCase):
+
+    def test_ngrams(self):
+        self.assertEqual(get_ngrams("ABcd"), {"abc", "bcd"})
+        self.assertEqual(get_ngrams("ab"), set())
+    
+
+    def test_index_search(self):
+        index = NgramIndex([(1, "PTBP1_rep1.bam"), (2, "ptbp1_rep2.bam"), (3, "tdp43.bam"), (4, None)])
+        self.assertEqual(set(index.search("tbp1_")), {1, 2})
+        self.assertEqual(index.search("TBP1_", case_sensitive=True), [1])
+        self.assertEqual(index.search("rep1_rep2"), [])
+        self.assertEqual(index.search("xyz"), [])
+        self.assertIsNone(index.search("am"))
+    
+
+    def test_index_updates(self):
+        index = NgramIndex([(1, "PTBP1_rep1.bam"), (2, "tdp43.bam")])
+        index.add(1, "hnrnpc.bam")
+        index.add(3, "ptbp1.fq")
+        index.remove(2)
+        index.remove(4)
+        self.assertEqual(index.search("ptbp1"), [3])
+        self.assertEqual(index.search("rnpc"), [1])
+        self.assertEqual(index.search("tdp43"), [])
+        self.assertNotIn("tdp", index.postings)
+
+
+
+class FilenameFilterTests(TestCase):
+
+    def setUp(self):
+        FILENAME_INDEX["index"] = None
+        self.d1 = mixer.blend(Data, filename="PTBP1_rep1.bam")
+        self.d2 = mixer.blend(Data, filename="ptbp1_rep2.bam")
+        self.d3 = mixer.blend(Data, filename="tdp43.fq")
+    
+
+    def test_filtering(self):
+        self.assertEqual(set(filter_by_filename(Data.objects.all(), "tbp1")), {self.d1, self.d2})
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "TBP1", True)), [self.d1])
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "fq")), [self.d3])
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "PT", True)), [self.d1])
+        self.assertEqual(set(filter_by_filename(Data.objects.all(), "pt")), {self.d1, self.d2})
+    
+
+    def test_many_candidates_use_one_parameter(self):
+        Data.objects.bulk_create([Data(filename=f"tbp{n}.bam", filetype="bam", size=1) for n in range(1200)])
+        filenames_changed()
+        data = filter_by_filename(Data.objects.all(), "tbp")
+        self.assertEqual(data.count(), 1202)
+        self.assertEqual(len(data.query.sql_with_params()[1]), 1)
+    
+
+    def test_index_follows_filenames(self):
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "tdp43")), [self.d3])
+        self.d3.filename = "hnrnpc.fq"
+        self.d3.save()
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "tdp43")), [])
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "rnpc")), [self.d3])
+        self.d3.delete()
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "rnpc")), [])
+    
+
+    def test_unchanged_filenames_keep_index(self):
+        index = get_filename_index()
+        Data.objects.get(id=self.d1.id).save()
+        self.assertIs(get_filename_index(), index)
+    
+
+    def test_index_is_updated_in_place(self):
+        index = get_filename_index()
+        d4 = mixer.blend(Data, filename="hnrnpc.fq")
+        self.assertIs(get_filename_index(), index)
+        self.assertEqual(list(filter_by_filename(Data.objects.all(), "rnpc")), [d4])
+    
+
+    def test_files_from_other_processes_are_checked_for(self):
+        get_filename_index()
+        Data.objects.bulk_create([Data(filename="hnrnpc.fq", filetype="fq", size=1)])
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Data._meta.db_table} WHERE id = %s", [self.d3.id])
+        with self.settings(FILENAME_INDEX_CHECK_INTERVAL=60):
+            self.assertEqual(list(filter_by_filename(Data.objects.all(), "rnpc")), [])
+        with self.settings(FILENAME_INDEX_CHECK_INTERVAL=0):
+            self.assertEqual(filter_by_filename(Data.objects.all(), "rnpc").count(), 1)
+            self.assertNotIn(self.d3.id, get_filename_index().names)
+        with self.settings(FILENAME_INDEX_MAX_AGE=0):
+            Data.objects.filter(id=self.d1.id).update(filename="tardbp.bam")
+            self.assertEqual(list(filter_by_filename(Data.objects.all(), "tardbp")), [self.d1])
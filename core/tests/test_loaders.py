@@ -0,0 +1,143 @@
+from unittest.mock import Mock
+from mixer.backend.django import mixer
+from django.test import TestCase
+from core.models import User
+from core.schema import schema
+from core.loaders import *
+from core.permissions import get_accessible_collection_ids
+from analysis.models import Collection, CollectionUserLink, Sample
+
+class PermissionLevelLoaderTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        self.collections = [mixer.blend(Collection) for _ in range(3)]
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collections[0], permission=4)
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collections[1], permission=2)
+    
+
+    def test_can_load_levels_in_one_query(self):
+        loader = PermissionLevelLoader(self.user, "collection")
+        with self.assertNumQueries(1):
+            levels = loader.batch_load_fn([c.id for c in self.collections]).get()
+        self.assertEqual(levels, [4, 2, 0])
+    
+
+    def test_no_user_has_no_levels(self):
+        loader = PermissionLevelLoader(None, "collection")
+        with self.assertNumQueries(0):
+            self.assertEqual(loader.load(self.collections[0].id).get(), 0)
+    
+
+    def test_loaders_are_per_request_and_user(self):
+        info = Mock(context=Mock(spec=["user"], user=self.user))
+        loader = get_permission_loader(info, "collection")
+        self.assertIs(get_permission_loader(info, "collection"), loader)
+        self.assertIsNot(get_permission_loader(info, "sample"), loader)
+        info.context.user = None
+        self.assertIsNot(get_permission_loader(info, "collection"), loader)
+    
+
+    def test_page_permissions_use_constant_queries(self):
+        for _ in range(10):
+            collection = mixer.blend(Collection, private=False)
+            mixer.blend(CollectionUserLink, user=self.user, collection=collection, permission=3)
+        context = Mock(spec=["user"], user=self.user)
+        get_accessible_collection_ids(self.user)
+        with self.assertNumQueries(2):
+            result = schema.execute("""{ searchCollections {
+                edges { node { isOwner canShare canEdit } }
+            } }""", context_value=context)
+        self.assertIsNone(result.errors)
+        nodes = [edge["node"] for edge in result.data["searchCollections"]["edges"]]
+        self.assertEqual(len(nodes), 12)
+        self.assertEqual(sum(node["canShare"] for node in nodes), 11)
+        self.assertEqual(sum(node["isOwner"] for node in nodes), 1)
+
+
+
+class PermissionCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        self.collection = mixer.blend(Collection, private=True)
+        self.sample = Sample.objects.create(name="sample", collection=self.collection)
+        self.link = mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=3)
+        self.info = Mock(context=Mock(spec=["user"], user=self.user))
+    
+
+    def test_levels_are_looked_up_once(self):
+        with self.assertNumQueries(1):
+            for _ in range(5):
+                self.assertEqual(get_cached_permission_level(self.info, self.sample), 3)
+        with self.assertNumQueries(0):
+            self.assertTrue(has_cached_permission(self.info, self.sample, 3))
+            self.assertFalse(has_cached_permission(self.info, self.sample, 4))
+        self.info.context.user = None
+        self.assertEqual(get_cached_permission_level(self.info, self.sample), 0)
+    
+
+    def test_user_permission_fields_give_effective_levels(self):
+        other = mixer.blend(User)
+        mixer.blend(CollectionUserLink, user=other, collection=self.collection, permission=2)
+        context = Mock(spec=["user"], user=self.user)
+        result = schema.execute("""{ user(username: "%s") {
+            collectionPermission(id: "%s") samplePermission(id: "%s")
+        } }""" % (other.username, self.collection.id, self.sample.id), context_value=context)
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["user"], {"collectionPermission": 2, "samplePermission": 2})
+    
+
+    def test_invalidating_forgets_object_and_descendants(self):
+        other = mixer.blend(Collection, private=True)
+        for obj in [self.collection, self.sample, other]:
+            get_cached_permission_level(self.info, obj)
+        loader = get_permission_loader(self.info, "sample")
+        self.link.permission = 4
+        self.link.save()
+        get_permission_cache(self.info).invalidate(self.collection)
+        with self.assertNumQueries(2):
+            self.assertEqual(get_cached_permission_level(self.info, self.collection), 4)
+            self.assertEqual(get_cached_permission_level(self.info, self.sample), 4)
+            self.assertEqual(get_cached_permission_level(self.info, other), 0)
+        self.assertIsNot(get_permission_loader(self.info, "sample"), loader)
+    
+
+    def test_invalidating_leaves_ancestors(self):
+        get_cached_permission_level(self.info, self.collection)
+        loader = get_permission_loader(self.info, "collection")
+        get_permission_cache(self.info).invalidate(self.sample)
+        with self.assertNumQueries(0):
+            get_cached_permission_level(self.info, self.collection)
+        self.assertIs(get_permission_loader(self.info, "collection"), loader)
+    
+
+    def test_collection_form_invalidates(self):
+        from analysis.forms import CollectionForm
+        self.assertEqual(get_cached_permission_level(self.info, self.sample), 3)
+        self.link.delete()
+        form = CollectionForm(
+            {"name": "new", "private": False}, instance=self.collection,
+            permission_cache=get_permission_cache(self.info)
+        )
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(get_cached_permission_level(self.info, self.sample), 1)
+    
+
+    def test_access_mutation_invalidates(self):
+        self.link.permission = 4
+        self.link.save()
+        other = mixer.blend(User)
+        context = Mock(spec=["user"], user=self.user)
+        schema.execute("""{ me { samplePermission(id: "%s") } }""" % self.sample.id, context_value=context)
+        result = schema.execute("""mutation { updateCollectionAccess(
+            id: "%s", user: "%s", permission: 0
+        ) { collection { name } } }""" % (self.collection.id, self.user.id), context_value=context)
+        self.assertIn("at least one owner", result.errors[0].message)
+        mixer.blend(CollectionUserLink, user=other, collection=self.collection, permission=4)
+        result = schema.execute("""mutation { updateCollectionAccess(
+            id: "%s", user: "%s", permission: 0
+        ) { collection { name } } }""" % (self.collection.id, self.user.id), context_value=context)
+        self.assertIsNone(result.errors)
+        self.assertEqual(get_cached_permission_level(Mock(context=context), self.sample), 0)
@@ -0,0 +1,61 @@
+import json
+from mixer.backend.django import mixer
+from django.test import TestCase
+from core.metrics import *
+from core.models import User
+
+class HistogramTests(TestCase):
+
+    def test_histogram_is_cumulative(self):
+        histogram = Histogram([1, 5])
+        for value in [0, 3, 3, 8]: histogram.observe(value)
+        self.assertEqual(histogram.render("x", 'path="a"'), [
+            'x_bucket{path="a",le="1"} 1', 'x_bucket{path="a",le="5"} 3',
+            'x_bucket{path="a",le="+Inf"} 4', 'x_sum{path="a"} 14', 'x_count{path="a"} 4'
+        ])
+
+
+
+class ResolverMetricsTests(TestCase):
+
+    def setUp(self):
+        for _, _, histograms in METRICS.values(): histograms.clear()
+        self.admin = mixer.blend(User, is_admin=True)
+        mixer.cycle(3).blend(User)
+    
+
+    def post(self, query, user=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {user.make_jwt(900)}"} if user else {}
+        return self.client.post(
+            "/graphql", json.dumps({"query": query}),
+            content_type="application/json", **headers
+        )
+    
+
+    def test_resolvers_are_recorded_by_path(self):
+        self.post("{ users { name groups { name } } }")
+        histograms = METRICS["graphql_resolver_queries"][2]
+        self.assertEqual(histograms["users"].count, 1)
+        self.assertEqual(histograms["users"].sum, 2)
+        self.assertEqual(histograms["users.groups"].count, 4)
+        self.assertEqual(histograms["users.groups"].sum, 0)
+        self.assertNotIn("users.name", METRICS["graphql_resolver_seconds"][2])
+    
+
+    def test_metrics_endpoint(self):
+        self.post("{ users { name } }")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn("# TYPE graphql_resolver_seconds histogram", text)
+        self.assertIn('graphql_resolver_queries_count{path="users"} 1', text)
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 404)
+    
+
+    def test_server_timing_is_for_admins(self):
+        response = self.post("{ users { name } }", mixer.blend(User, is_admin=False))
+        self.assertNotIn("Server-Timing", response)
+        response = self.post("{ users { name } }", self.admin)
+        self.assertIn('users;dur=', response["Server-Timing"])
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
@@ -22,6 +22,13 @@ class AuthMiddlewareTests(TestCase):
         self.assertEqual(self.request.user, mock_from.return_value)
     
 
+    @patch("core.middleware.User.from_token")
+    def test_middleware_attaches_permission_cache(self, mock_from):
+        self.mw(self.request)
+        self.assertIsInstance(self.request.permission_cache, PermissionCache)
+        self.assertEqual(self.request.permission_cache.levels, {})
+    
+
     @patch("core.middleware.User.from_token")
     def test_middleware_does_nothing_if_no_imaps_refresh_token_flag(self, mock_from):
         self.mw(self.request)
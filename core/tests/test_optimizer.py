@@ -0,0 +1,81 @@
+from unittest.mock import Mock
+from mixer.backend.django import mixer
+from django.test import TestCase
+from django_nextflow.models import Execution, Pipeline, ProcessExecution
+from graphql import parse
+from core.optimizer import *
+from core.models import User
+from core.schema import schema
+from analysis.models import Collection, Job, Sample
+from genomes.models import Species
+
+class SelectionTests(TestCase):
+
+    def test_fragments_are_expanded(self):
+        document = parse("""{ searchSamples { edges { node { name ...S ... on SampleType { pi { name } } } } } }
+        fragment S on SampleType { scientist { name } species { name } }""")
+        fragments = {d.name.value: d for d in document.definitions[1:]}
+        edges = get_selections(document.definitions[:1], fragments)["search_samples"]
+        node = get_selections(get_selections(edges, fragments)["edges"], fragments)["node"]
+        self.assertEqual(
+            set(get_selections(node, fragments)),
+            {"name", "scientist", "species", "pi"}
+        )
+    
+
+    def test_lookups_are_followed_through_models(self):
+        self.assertEqual(follow_lookup(Sample, "scientist"), (User, False))
+        self.assertEqual(follow_lookup(Job, "execution__process_executions"), (ProcessExecution, True))
+        self.assertIsNone(follow_lookup(Sample, "name"))
+        self.assertIsNone(follow_lookup(Sample, "nothing"))
+
+
+
+class QueryPlanningTests(TestCase):
+
+    def setUp(self):
+        self.collection = Collection.objects.create(name="collection", private=False)
+        self.species = Species.objects.create(id="Hs", name="Human")
+        pipeline = mixer.blend(Pipeline)
+        for n in range(5):
+            Sample.objects.create(
+                name=f"sample{n}", private=False, collection=self.collection,
+                species=self.species, scientist=mixer.blend(User), pi=mixer.blend(User)
+            )
+            execution = mixer.blend(Execution, pipeline=pipeline)
+            mixer.cycle(2).blend(ProcessExecution, execution=execution)
+            Job.objects.create(private=False, execution=execution, pipeline=pipeline)
+        self.context = Mock(spec=["user"], user=None)
+    
+
+    def test_sample_relations_are_joined(self):
+        with self.assertNumQueries(2):
+            result = schema.execute("""{ searchSamples(first: 5) { count edges { node {
+                name scientist { name } pi { name } species { name }
+                collection { name }
+            } } } }""", context_value=self.context)
+        self.assertIsNone(result.errors)
+        nodes = [edge["node"] for edge in result.data["searchSamples"]["edges"]]
+        self.assertEqual({node["species"]["name"] for node in nodes}, {"Human"})
+        self.assertEqual({node["collection"]["name"] for node in nodes}, {"collection"})
+    
+
+    def test_execution_hints_are_used(self):
+        with self.assertNumQueries(2):
+            result = schema.execute("""{ searchExecutions(first: 5) { edges { node {
+                status pipeline { name } processExecutions { name }
+            } } } }""", context_value=self.context)
+        self.assertIsNone(result.errors)
+        nodes = [edge["node"] for edge in result.data["searchExecutions"]["edges"]]
+        self.assertEqual(len(nodes), 5)
+        self.assertTrue(all(len(node["processExecutions"]) == 2 for node in nodes))
+    
+
+    def test_unselected_relations_are_not_joined(self):
+        with self.assertNumQueries(1) as context:
+            result = schema.execute(
+                "{ searchSamples(first: 5) { edges { node { name } } } }",
+                context_value=self.context
+            )
+        self.assertIsNone(result.errors)
+        self.assertNotIn("JOIN", context.captured_queries[0]["sql"])
@@ -0,0 +1,128 @@
+from unittest.mock import Mock
+from django.test import TestCase
+from core.pagination import *
+from core.schema import schema
+from django_nextflow.models import Data
+from analysis.models import Collection, Job, Sample
+from genomes.models import Species
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.collections = [Collection.objects.create(
+            name=f"collection{n}", private=False, created=1000 + n // 2
+        ) for n in range(7)]
+        self.newest_first = sorted(
+            self.collections, key=lambda c: (c.created, c.id), reverse=True
+        )
+    
+
+    def query(self, args):
+        result = schema.execute("""{ publicCollections%s {
+            count edges { cursor node { name } }
+            pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+        } }""" % args, context_value=Mock(spec=["user"], user=None))
+        self.assertIsNone(result.errors)
+        return result.data["publicCollections"]
+    
+
+    def test_cursors_are_opaque_keys(self):
+        cursor = to_cursor(self.collections[3])
+        self.assertNotIn("1001", cursor)
+        self.assertEqual(from_cursor(cursor), (1001, self.collections[3].id))
+        with self.assertRaises(GraphQLError):
+            from_cursor("YXJyYXljb25uZWN0aW9uOjA=")
+    
+
+    def test_can_page_forwards(self):
+        names, after = [], ""
+        while True:
+            page = self.query(f"(first: 3{after})")
+            self.assertEqual(page["count"], 7)
+            names += [edge["node"]["name"] for edge in page["edges"]]
+            if not page["pageInfo"]["hasNextPage"]: break
+            after = ' after: "%s"' % page["pageInfo"]["endCursor"]
+        self.assertEqual(names, [c.name for c in self.newest_first])
+    
+
+    def test_can_page_backwards(self):
+        before = to_cursor(self.newest_first[5])
+        page = self.query(f'(last: 2 before: "{before}")')
+        self.assertEqual(
+            [edge["node"]["name"] for edge in page["edges"]],
+            [c.name for c in self.newest_first[3:5]]
+        )
+        self.assertTrue(page["pageInfo"]["hasPreviousPage"])
+        self.assertTrue(page["pageInfo"]["hasNextPage"])
+    
+
+    def test_deep_pages_do_not_load_earlier_rows(self):
+        after = to_cursor(self.newest_first[4])
+        with self.assertNumQueries(1):
+            page, has_previous, has_next = page_queryset(
+                Collection.objects.all(), first=1, after=after
+            )
+        self.assertEqual(page, [self.newest_first[5]])
+        self.assertTrue(has_previous)
+        self.assertTrue(has_next)
+    
+
+    def test_ascending_models_page_oldest_first(self):
+        jobs = [Job.objects.create(created=n) for n in range(3)]
+        page, _, has_next = page_queryset(Job.objects.all(), first=2)
+        self.assertEqual(page, jobs[:2])
+        self.assertTrue(has_next)
+    
+
+    def test_count_uses_sql(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(count_rows(Collection.objects.filter(created=1000)), 2)
+        self.assertEqual(count_rows(Collection.objects.all(), approximate=True), 7)
+
+
+
+class FacetTests(TestCase):
+
+    def setUp(self):
+        self.human = Species.objects.create(id="Hs", name="Human", latin_name="Homo sapiens")
+        self.mouse = Species.objects.create(id="Mm", name="Mouse", latin_name="Mus musculus")
+        for species, method, qc_pass, private in [
+            (self.human, "iCLIP", True, False), (self.human, "iCLIP", False, False),
+            (self.mouse, "eCLIP", True, False), (None, "iCLIP", True, False),
+            (self.mouse, "eCLIP", True, True),
+        ]:
+            Sample.objects.create(
+                name="sample", species=species, method=method, qc_pass=qc_pass, private=private
+            )
+    
+
+    def test_facets_are_counted(self):
+        facets = count_facets(Sample.objects.filter(private=False), {
+            "species": "species__name", "method": "method"
+        })
+        self.assertEqual(facets, {
+            "species": [
+                {"value": "Human", "count": 2}, {"value": "Mouse", "count": 1},
+                {"value": None, "count": 1}
+            ],
+            "method": [{"value": "iCLIP", "count": 3}, {"value": "eCLIP", "count": 1}]
+        })
+    
+
+    def test_all_facets_take_one_query_besides_the_page(self):
+        with self.assertNumQueries(2):
+            result = schema.execute("""{ searchSamples(first: 2) { facets {
+                species { value count } method { value count } qcPass { value count }
+            } } }""", context_value=Mock(spec=["user"], user=None))
+        self.assertIsNone(result.errors)
+        facets = result.data["searchSamples"]["facets"]
+        self.assertEqual(facets["qcPass"], [{"value": True, "count": 3}, {"value": False, "count": 1}])
+        self.assertEqual(facets["method"][0], {"value": "iCLIP", "count": 3})
+    
+
+    def test_data_facets(self):
+        Data.objects.create(filename="a.bam", filetype="bam", size=1)
+        result = schema.execute("""{ searchData { facets { filetype { value count } } } }""",
+            context_value=Mock(spec=["user"], user=None))
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["searchData"]["facets"], {"filetype": []})
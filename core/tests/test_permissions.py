@@ -4,7 +4,7 @@ from django.test import TestCase
 from django_nextflow.models import Execution, ProcessExecution
 from mixer.backend.django import mixer
 from core.permissions import *
-from core.models import User, UserGroupLink
+from core.models import User, UserGroupLink, EffectivePermission
 from analysis.models import Collection
 
 class GroupsByUserTests(TestCase):
@@ -290,18 +290,55 @@ class UsersByDataTest(TestCase):
 
 
 
-class UserPermissionsOnCollectionTests(TestCase):
+class PermissionLevelTests(TestCase):
 
     def setUp(self):
         self.user = mixer.blend(User)
         self.collection = mixer.blend(Collection)
-        self.patch1 = patch("core.permissions.get_groups_by_user")
-        self.mock_groups = self.patch1.start()
-        self.mock_groups.return_value = []
+        self.sample = Sample.objects.create(name="sample", collection=self.collection)
+        self.job = Job.objects.create(sample=self.sample)
+        self.data = mixer.blend(Data, upstream_process_execution=None)
+        mixer.blend(DataLink, data=self.data, collection=self.collection)
+    
 
+    def test_no_access(self):
+        for obj in [self.collection, self.sample, self.job, self.data]:
+            self.assertEqual(get_permission_level(self.user, obj), 0)
+            self.assertEqual(get_permission_level(None, obj), 0)
+    
+
+    def test_public_objects_are_level_one(self):
+        self.collection.private = False
+        self.collection.save()
+        for obj in [self.collection, self.sample, self.job, self.data]:
+            self.assertEqual(get_permission_level(self.user, obj), 1)
+            self.assertEqual(get_permission_level(None, obj), 1)
+    
+
+    def test_highest_level_is_returned(self):
+        group = mixer.blend(Group)
+        mixer.blend(UserGroupLink, user=self.user, group=group, permission=2)
+        mixer.blend(CollectionGroupLink, group=group, collection=self.collection, permission=3)
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=2)
+        mixer.blend(JobUserLink, user=self.user, job=self.job, permission=4)
+        self.assertEqual(get_permission_level(self.user, self.collection), 3)
+        self.assertEqual(get_permission_level(self.user, self.sample), 3)
+        self.assertEqual(get_permission_level(self.user, self.job), 4)
+        self.assertEqual(get_permission_level(self.user, self.data), 3)
+    
 
-    def tearDown(self):
-        self.patch1.stop()
+    def test_level_takes_one_query(self):
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=4)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_permission_level(self.user, self.data), 4)
+
+
+
+class UserPermissionsOnCollectionTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        self.collection = mixer.blend(Collection)
 
 
     def test_no_link(self):
@@ -338,14 +375,28 @@ class UserPermissionsOnCollectionTests(TestCase):
         group1 = mixer.blend(Group)
         group2 = mixer.blend(Group)
         group3 = mixer.blend(Group)
-        self.mock_groups.return_value = [group1, group2, group3]
+        mixer.blend(UserGroupLink, user=self.user, group=group1, permission=2)
+        mixer.blend(UserGroupLink, user=self.user, group=group2, permission=3)
+        mixer.blend(UserGroupLink, user=self.user, group=group3, permission=2)
         mixer.blend(CollectionGroupLink, group=group1, collection=self.collection, permission=1)
         mixer.blend(CollectionGroupLink, group=group2, collection=self.collection, permission=2)
         self.assertTrue(does_user_have_permission_on_collection(self.user, self.collection, 1))
         self.assertTrue(does_user_have_permission_on_collection(self.user, self.collection, 2))
         self.assertFalse(does_user_have_permission_on_collection(self.user, self.collection, 3))
         self.assertFalse(does_user_have_permission_on_collection(self.user, self.collection, 4))
-        self.mock_groups.assert_called_with(self.user, permission=2, exact=False)
+    
+
+    def test_group_invitations_give_no_access(self):
+        group = mixer.blend(Group)
+        mixer.blend(UserGroupLink, user=self.user, group=group, permission=1)
+        mixer.blend(CollectionGroupLink, group=group, collection=self.collection, permission=3)
+        self.assertFalse(does_user_have_permission_on_collection(self.user, self.collection, 1))
+
+
+    def test_no_user(self):
+        self.assertFalse(does_user_have_permission_on_collection(None, self.collection, 1))
+        self.collection.private = False
+        self.assertTrue(does_user_have_permission_on_collection(None, self.collection, 1))
 
 
 
@@ -353,14 +404,7 @@ class UserPermissionsOnSampleTests(TestCase):
 
     def setUp(self):
         self.user = mixer.blend(User)
-        self.sample = mixer.blend(Sample, collection=None)
-        self.patch1 = patch("core.permissions.does_user_have_permission_on_collection")
-        self.mock_perm = self.patch1.start()
-        self.mock_perm.return_value = False
-
-
-    def tearDown(self):
-        self.patch1.stop()
+        self.sample = Sample.objects.create(name="sample")
     
 
     def test_no_link(self):
@@ -395,11 +439,19 @@ class UserPermissionsOnSampleTests(TestCase):
 
     def test_can_get_permission_via_collection(self):
         self.sample.collection = mixer.blend(Collection)
-        self.assertIs(
-            does_user_have_permission_on_sample(self.user, self.sample, 2),
-            self.mock_perm.return_value
-        )
-        self.mock_perm.assert_called_with(self.user, self.sample.collection, 2)
+        self.sample.save()
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.sample.collection, permission=4)
+        self.assertTrue(does_user_have_permission_on_sample(self.user, self.sample, 4))
+        self.sample.collection = None
+        self.sample.save()
+        self.assertFalse(does_user_have_permission_on_sample(self.user, self.sample, 1))
+    
+
+    def test_public_collection_makes_sample_readable(self):
+        self.sample.collection = mixer.blend(Collection, private=False)
+        self.sample.save()
+        self.assertTrue(does_user_have_permission_on_sample(self.user, self.sample, 1))
+        self.assertFalse(does_user_have_permission_on_sample(self.user, self.sample, 2))
 
 
 
@@ -407,18 +459,7 @@ class UserPermissionsOnJobTests(TestCase):
 
     def setUp(self):
         self.user = mixer.blend(User)
-        self.job = mixer.blend(Job, collection=None, sample=None)
-        self.patch1 = patch("core.permissions.does_user_have_permission_on_collection")
-        self.mock_cperm = self.patch1.start()
-        self.mock_cperm.return_value = False
-        self.patch2 = patch("core.permissions.does_user_have_permission_on_sample")
-        self.mock_sperm = self.patch2.start()
-        self.mock_sperm.return_value = False
-
-
-    def tearDown(self):
-        self.patch1.stop()
-        self.patch2.stop()
+        self.job = Job.objects.create()
     
 
     def test_no_link(self):
@@ -454,21 +495,21 @@ class UserPermissionsOnJobTests(TestCase):
     def test_can_get_permission_via_collection(self):
         self.job.collection = mixer.blend(Collection)
         self.job.save()
-        self.assertIs(
-            does_user_have_permission_on_job(self.user, self.job, 2),
-            self.mock_cperm.return_value
-        )
-        self.mock_cperm.assert_called_with(self.user, self.job.collection, 2)
+        group = mixer.blend(Group)
+        mixer.blend(UserGroupLink, user=self.user, group=group, permission=2)
+        mixer.blend(CollectionGroupLink, group=group, collection=self.job.collection, permission=2)
+        self.assertTrue(does_user_have_permission_on_job(self.user, self.job, 2))
+        self.assertFalse(does_user_have_permission_on_job(self.user, self.job, 3))
     
 
     def test_can_get_permission_via_sample(self):
-        self.job.sample = mixer.blend(Sample)
+        self.job.sample = Sample.objects.create(name="sample", collection=mixer.blend(Collection))
         self.job.save()
-        self.assertIs(
-            does_user_have_permission_on_job(self.user, self.job, 2),
-            self.mock_sperm.return_value
-        )
-        self.mock_sperm.assert_called_with(self.user, self.job.sample, 2)
+        mixer.blend(SampleUserLink, user=self.user, sample=self.job.sample, permission=2)
+        self.assertTrue(does_user_have_permission_on_job(self.user, self.job, 2))
+        self.assertFalse(does_user_have_permission_on_job(self.user, self.job, 3))
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.job.sample.collection, permission=3)
+        self.assertTrue(does_user_have_permission_on_job(self.user, self.job, 3))
 
 
 
@@ -478,21 +519,6 @@ class UserPermissionsOnDataTests(TestCase):
         self.user = mixer.blend(User)
         self.data = mixer.blend(Data, upstream_process_execution=None)
         self.link = mixer.blend(DataLink, data=self.data, collection=None)
-        self.patch1 = patch("core.permissions.does_user_have_permission_on_collection")
-        self.mock_cperm = self.patch1.start()
-        self.mock_cperm.return_value = False
-        self.patch2 = patch("core.permissions.does_user_have_permission_on_sample")
-        self.mock_sperm = self.patch2.start()
-        self.mock_sperm.return_value = False
-        self.patch3 = patch("core.permissions.does_user_have_permission_on_job")
-        self.mock_jperm = self.patch3.start()
-        self.mock_jperm.return_value = False
-
-
-    def tearDown(self):
-        self.patch1.stop()
-        self.patch2.stop()
-        self.patch3.stop()
     
 
     def test_no_link(self):
@@ -528,24 +554,113 @@ class UserPermissionsOnDataTests(TestCase):
     def test_can_get_permission_via_collection(self):
         self.link.collection = mixer.blend(Collection)
         self.link.save()
-        self.assertIs(
-            does_user_have_permission_on_data(self.user, self.data, 2),
-            self.mock_cperm.return_value
-        )
-        self.mock_cperm.assert_called_with(self.user, self.link.collection, 2)
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.link.collection, permission=2)
+        self.assertTrue(does_user_have_permission_on_data(self.user, self.data, 2))
+        self.assertFalse(does_user_have_permission_on_data(self.user, self.data, 3))
     
 
     def test_can_get_permission_via_job(self):
-        job = mixer.blend(Job)
-        execution = mixer.blend(Execution, job=job)
+        execution = mixer.blend(Execution)
+        job = Job.objects.create(execution=execution)
         process_execution = mixer.blend(ProcessExecution, execution=execution)
         self.data.upstream_process_execution = process_execution
         self.data.save()
-        self.assertIs(
-            does_user_have_permission_on_data(self.user, self.data, 2),
-            self.mock_jperm.return_value
-        )
-        self.mock_jperm.assert_called_with(self.user, job, 2)
+        mixer.blend(JobUserLink, user=self.user, job=job, permission=3)
+        self.assertTrue(does_user_have_permission_on_data(self.user, self.data, 3))
+        self.assertFalse(does_user_have_permission_on_data(self.user, self.data, 4))
+
+
+
+class EffectivePermissionTableTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        self.collection = mixer.blend(Collection)
+        self.sample = Sample.objects.create(name="sample", collection=self.collection)
+        self.execution = mixer.blend(Execution)
+        self.job = Job.objects.create(sample=self.sample, execution=self.execution)
+        self.data = mixer.blend(Data, upstream_process_execution=mixer.blend(
+            ProcessExecution, execution=self.execution
+        ))
+        mixer.blend(DataLink, data=self.data, collection=None)
+    
+
+    def levels(self):
+        return {(row.object_type, row.object_id): row.level for row in
+            EffectivePermission.objects.filter(user=self.user)}
+
+
+    def test_collection_links_propagate_to_descendants(self):
+        link = mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=2)
+        self.assertEqual(self.levels(), {
+            ("collection", self.collection.id): 2, ("sample", self.sample.id): 2,
+            ("job", self.job.id): 2, ("data", self.data.id): 2
+        })
+        link.delete()
+        self.assertEqual(self.levels(), {})
+    
+
+    def test_group_membership_changes_propagate(self):
+        group = mixer.blend(Group)
+        mixer.blend(CollectionGroupLink, group=group, collection=self.collection, permission=3)
+        self.assertEqual(self.levels(), {})
+        membership = mixer.blend(UserGroupLink, user=self.user, group=group, permission=2)
+        self.assertEqual(self.levels()[("data", self.data.id)], 3)
+        membership.permission = 1
+        membership.save()
+        self.assertEqual(self.levels(), {})
+    
+
+    def test_highest_level_wins(self):
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=1)
+        mixer.blend(SampleUserLink, user=self.user, sample=self.sample, permission=3)
+        self.assertEqual(self.levels()[("collection", self.collection.id)], 1)
+        self.assertEqual(self.levels()[("sample", self.sample.id)], 3)
+        self.assertEqual(self.levels()[("job", self.job.id)], 3)
+    
+
+    def test_moving_sample_recalculates(self):
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=4)
+        self.sample.collection = mixer.blend(Collection)
+        self.sample.save()
+        self.assertEqual(self.levels(), {("collection", self.collection.id): 4})
+    
+
+    def test_deleting_collection_recalculates(self):
+        self.job.sample = None
+        self.job.collection = self.collection
+        self.job.save()
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=4)
+        self.assertIn(("job", self.job.id), self.levels())
+        self.collection.delete()
+        self.assertEqual(self.levels(), {})
+    
+
+    def test_rebuild_and_verify(self):
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collection, permission=4)
+        expected = self.levels()
+        EffectivePermission.objects.filter(object_type="sample").delete()
+        EffectivePermission.objects.create(user=self.user, object_type="job", object_id=self.job.id + 1, level=1)
+        self.assertEqual(len(find_effective_permission_errors()), 2)
+        rebuild_effective_permissions()
+        self.assertEqual(self.levels(), expected)
+        self.assertEqual(find_effective_permission_errors(), [])
+    
+
+    def test_migration_fills_table(self):
+        from django.apps import apps
+        from importlib import import_module
+        migration = import_module("core.migrations.0005_fill_effective_permissions")
+        group = mixer.blend(Group)
+        mixer.blend(UserGroupLink, user=self.user, group=group, permission=2)
+        mixer.blend(CollectionGroupLink, group=group, collection=self.collection, permission=2)
+        mixer.blend(JobUserLink, user=self.user, job=self.job, permission=3)
+        expected = self.levels()
+        EffectivePermission.objects.all().delete()
+        migration.fill_effective_permissions(apps, None)
+        self.assertEqual(self.levels(), expected)
+        self.assertEqual(expected[("data", self.data.id)], 3)
+        self.assertEqual(find_effective_permission_errors(), [])
 
 
 
@@ -565,7 +680,7 @@ class ReadableCollectionsTests(TestCase):
         mixer.blend(CollectionUserLink, user=user, collection=c2)
         c3 = mixer.blend(Collection) # group has link
         group = mixer.blend(Group)
-        mixer.blend(UserGroupLink, user=user, group=group)
+        mixer.blend(UserGroupLink, user=user, group=group, permission=2)
         mixer.blend(CollectionGroupLink, collection=c3, group=group)
         c4 = mixer.blend(Collection) # link to other user
         mixer.blend(CollectionUserLink, collection=c4)
@@ -595,7 +710,7 @@ class ReadableSamplesTests(TestCase):
         mixer.blend(CollectionUserLink, user=user, collection=s3.collection)
         s4 = mixer.blend(Sample) # group has link to collection
         group = mixer.blend(Group)
-        mixer.blend(UserGroupLink, user=user, group=group)
+        mixer.blend(UserGroupLink, user=user, group=group, permission=2)
         mixer.blend(CollectionGroupLink, collection=s4.collection, group=group)
         s5 = mixer.blend(Sample) # link to other user
         mixer.blend(SampleUserLink, sample=s5)
@@ -627,11 +742,11 @@ class ReadableJobsTests(TestCase):
         mixer.blend(CollectionUserLink, user=user, collection=j5.sample.collection)
         j6 = mixer.blend(Job) # group has link to collection
         group = mixer.blend(Group)
-        mixer.blend(UserGroupLink, user=user, group=group)
+        mixer.blend(UserGroupLink, user=user, group=group, permission=2)
         mixer.blend(CollectionGroupLink, collection=j6.collection, group=group)
         j7 = mixer.blend(Job, sample=mixer.blend(Sample, collection=mixer.blend(Collection))) # group has link to sample collection
         group = mixer.blend(Group)
-        mixer.blend(UserGroupLink, user=user, group=group)
+        mixer.blend(UserGroupLink, user=user, group=group, permission=2)
         mixer.blend(CollectionGroupLink, collection=j7.sample.collection, group=group)
         j8 = mixer.blend(Job) # link to other user
         mixer.blend(JobUserLink, job=j8)
@@ -710,7 +825,7 @@ class ReadableDataTests(TestCase):
         d8 = mixer.blend(Data, filename="d8") 
         mixer.blend(DataLink, data=d8)
         group = mixer.blend(Group)
-        mixer.blend(UserGroupLink, user=user, group=group)
+        mixer.blend(UserGroupLink, user=user, group=group, permission=2)
         mixer.blend(CollectionGroupLink, group=group, collection=d8.link.collection)
         
         # group has link to job's collection
@@ -722,7 +837,7 @@ class ReadableDataTests(TestCase):
             )
         )
         group = mixer.blend(Group)
-        mixer.blend(UserGroupLink, user=user, group=group)
+        mixer.blend(UserGroupLink, user=user, group=group, permission=2)
         mixer.blend(CollectionGroupLink, group=group, collection=job.collection)
         
         # group has link to job's sample's collection
@@ -734,7 +849,7 @@ class ReadableDataTests(TestCase):
             )
         )
         group = mixer.blend(Group)
-        mixer.blend(UserGroupLink, user=user, group=group)
+        mixer.blend(UserGroupLink, user=user, group=group, permission=2)
         mixer.blend(CollectionGroupLink, group=group, collection=job.sample.collection)
         
         d11 = mixer.blend(Data, filename="d11") # link to other user
@@ -742,4 +857,293 @@ class ReadableDataTests(TestCase):
         
         self.assertEqual(
             set(readable_data(Data.objects.all(), user)), {d1, d2, d3, d4, d5, d6, d7, d8, d9, d10}
-        )
\ No newline at end of file
+        )
+
+
+class ReadableQueryPlanTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        group = mixer.blend(Group)
+        mixer.blend(UserGroupLink, user=self.user, group=group, permission=2)
+        for n in range(6):
+            collection = Collection.objects.create(name=f"c{n}", private=n % 3 != 0)
+            if n % 3 == 1:
+                mixer.blend(CollectionUserLink, user=self.user, collection=collection, permission=2)
+            if n % 2:
+                mixer.blend(CollectionGroupLink, group=group, collection=collection, permission=3)
+            for m in range(3):
+                sample = Sample.objects.create(
+                    name=f"s{n}{m}", collection=collection, private=m != 0
+                )
+                execution = mixer.blend(Execution)
+                job = Job.objects.create(sample=sample, execution=execution)
+                data = mixer.blend(Data, upstream_process_execution=mixer.blend(
+                    ProcessExecution, execution=execution
+                ))
+                mixer.blend(DataLink, data=data, collection=collection, private=True)
+                if m == 2:
+                    mixer.blend(JobUserLink, user=self.user, job=job, permission=1)
+        self.querysets = [
+            [readable_collections, Collection.objects.all()],
+            [readable_samples, Sample.objects.all()],
+            [readable_jobs, Job.objects.all()],
+            [readable_data, Data.objects.all()],
+        ]
+
+
+    def test_no_distinct_in_query(self):
+        for func, queryset in self.querysets:
+            for user in [None, self.user]:
+                query = str(func(queryset, user).query)
+                self.assertNotIn("DISTINCT", query)
+                self.assertNotIn("JOIN", query)
+    
+
+    def test_plan_uses_effective_permission_index(self):
+        for func, queryset in self.querysets:
+            plan = func(queryset, self.user).explain()
+            self.assertNotIn("DISTINCT", plan)
+            if queryset.model in [Job, Data]:
+                self.assertIn("effective_permissions", plan)
+            else:
+                self.assertNotIn("effective_permissions", plan)
+    
+
+    def test_results_match_permission_levels(self):
+        for func, queryset in self.querysets:
+            for user in [None, self.user]:
+                results = list(func(queryset, user))
+                self.assertEqual(len(results), len(set(results)))
+                self.assertEqual(set(results), {
+                    obj for obj in queryset if get_permission_level(user, obj)
+                })
+
+
+
+class OwnerFilterTests(TestCase):
+
+    def setUp(self):
+        self.collection = Collection.objects.create(name="c", private=False)
+        for name in ["John Smith", "Johnny Jones"]:
+            mixer.blend(CollectionUserLink, collection=self.collection, permission=4,
+                user=mixer.blend(User, name=name))
+        sample = Sample.objects.create(name="s", collection=self.collection, private=False)
+        execution = mixer.blend(Execution)
+        Job.objects.create(sample=sample, execution=execution, private=False)
+        data = mixer.blend(Data, upstream_process_execution=mixer.blend(
+            ProcessExecution, execution=execution
+        ))
+        mixer.blend(DataLink, data=data, collection=self.collection, private=False)
+    
+
+    def test_objects_with_several_matching_owners_appear_once(self):
+        from core.schema import schema
+        for field in ["searchCollections", "searchSamples", "searchExecutions", "searchData"]:
+            result = schema.execute(
+                '{ %s(owner: "john") { count edges { node { id } } } }' % field,
+                context_value=mock.Mock(spec=["user"], user=None)
+            )
+            self.assertIsNone(result.errors)
+            self.assertEqual(result.data[field]["count"], 1, field)
+            self.assertEqual(len(result.data[field]["edges"]), 1, field)
+        result = schema.execute('{ searchCollections(owner: "jane") { count } }',
+            context_value=mock.Mock(spec=["user"], user=None))
+        self.assertEqual(result.data["searchCollections"]["count"], 0)
+
+
+
+class DataLinkAncestryTests(TestCase):
+
+    def setUp(self):
+        self.collection = mixer.blend(Collection)
+        self.sample = Sample.objects.create(name="sample", collection=self.collection)
+        self.execution = mixer.blend(Execution)
+        self.job = Job.objects.create(sample=self.sample, execution=self.execution)
+        self.data = mixer.blend(Data, upstream_process_execution=mixer.blend(
+            ProcessExecution, execution=self.execution
+        ))
+        self.link = mixer.blend(DataLink, data=self.data, collection=None)
+    
+
+    def ancestry(self):
+        self.link.refresh_from_db()
+        return [self.link.job, self.link.sample, self.link.effective_collection]
+
+
+    def test_new_links_get_ancestry(self):
+        self.assertEqual(self.ancestry(), [self.job, self.sample, self.collection])
+        self.assertEqual(list(self.collection.all_data), [self.data])
+        self.assertEqual(list(self.sample.all_data), [self.data])
+    
+
+    def test_create_data_links_fills_ancestry(self):
+        from analysis.celery import create_data_links
+        self.link.delete()
+        with self.assertNumQueries(3):
+            create_data_links(self.execution, self.job)
+        self.link = DataLink.objects.get(data=self.data)
+        self.assertEqual(self.ancestry(), [self.job, self.sample, self.collection])
+    
+
+    def test_moving_sample_updates_links(self):
+        self.sample.collection = mixer.blend(Collection)
+        self.sample.save()
+        self.assertEqual(self.ancestry(), [self.job, self.sample, self.sample.collection])
+        self.assertFalse(self.collection.all_data.exists())
+    
+
+    def test_moving_job_updates_links(self):
+        self.job.sample = None
+        self.job.collection = self.collection
+        self.job.save()
+        self.assertEqual(self.ancestry(), [self.job, None, self.collection])
+        self.job.execution = None
+        self.job.save()
+        self.assertEqual(self.ancestry(), [None, None, None])
+        self.link.collection = self.collection
+        self.link.save()
+        self.assertEqual(self.ancestry(), [None, None, self.collection])
+    
+
+    def test_deleting_sample_updates_links(self):
+        self.job.collection = mixer.blend(Collection)
+        self.job.save()
+        self.sample.delete()
+        self.assertEqual(self.ancestry(), [self.job, None, self.job.collection])
+
+
+
+class PermissionLevelsTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        self.collections = [mixer.blend(Collection, private=True) for _ in range(3)]
+        self.collections[1].private = False
+        self.collections[1].save()
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collections[0], permission=3)
+        self.samples = [
+            Sample.objects.create(name=str(n), collection=self.collections[n % 3])
+            for n in range(30)
+        ]
+        self.job = Job.objects.create(sample=self.samples[0])
+    
+
+    def test_can_get_levels_of_mixed_objects(self):
+        objects = [["collection", c.id] for c in self.collections] + [
+            ["sample", s.id] for s in self.samples
+        ] + [["job", self.job.id], ["data", 1000]]
+        with self.assertNumQueries(7):
+            levels = get_permission_levels(self.user, objects)
+        self.assertEqual(levels[("collection", self.collections[0].id)], 3)
+        self.assertEqual(levels[("collection", self.collections[1].id)], 1)
+        self.assertEqual(levels[("collection", self.collections[2].id)], 0)
+        self.assertEqual([levels[("sample", s.id)] for s in self.samples], [3, 1, 0] * 10)
+        self.assertEqual(levels[("job", self.job.id)], 3)
+        self.assertEqual(levels[("data", 1000)], 0)
+    
+
+    def test_no_user_gets_public_levels(self):
+        objects = [["sample", s.id] for s in self.samples]
+        with self.assertNumQueries(1):
+            levels = get_permission_levels(None, objects)
+        self.assertEqual([levels[("sample", s.id)] for s in self.samples], [0, 1, 0] * 10)
+    
+
+    def test_permissions_query(self):
+        from core.schema import schema
+        result = schema.execute("""{ permissions(objects: [
+            {type: "collection", id: "%s"}, {type: "execution", id: "%s"},
+            {type: "sample", id: "%s"}
+        ]) { type id level } }""" % (
+            self.collections[0].id, self.job.id, self.samples[2].id
+        ), context_value=mock.Mock(spec=["user"], user=self.user))
+        self.assertEqual(result.data["permissions"], [
+            {"type": "collection", "id": str(self.collections[0].id), "level": 3},
+            {"type": "execution", "id": str(self.job.id), "level": 3},
+            {"type": "sample", "id": str(self.samples[2].id), "level": 0},
+        ])
+    
+
+    def test_permissions_query_validation(self):
+        from core.schema import schema
+        result = schema.execute(
+            """{ permissions(objects: [{type: "group", id: "1"}]) { level } }""",
+            context_value=mock.Mock(spec=["user"], user=self.user)
+        )
+        self.assertIn("Unknown object type", result.errors[0].message)
+        result = schema.execute("""{ permissions(objects: [%s]) { level } }""" % ", ".join(
+            ['{type: "sample", id: "1"}'] * (MAX_PERMISSION_OBJECTS + 1)
+        ), context_value=mock.Mock(spec=["user"], user=self.user))
+        self.assertIn("No more than", result.errors[0].message)
+        result = schema.execute(
+            """{ permissions(objects: [{type: "collection", id: "abc"}]) { level } }""",
+            context_value=mock.Mock(spec=["user"], user=self.user)
+        )
+        self.assertIn("collection ID abc is not valid", result.errors[0].message)
+
+
+
+class AccessibleCollectionCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = mixer.blend(User)
+        self.collections = [mixer.blend(Collection, private=True) for _ in range(3)]
+        mixer.blend(CollectionUserLink, user=self.user, collection=self.collections[0], permission=1)
+        self.group = mixer.blend(Group)
+        mixer.blend(UserGroupLink, user=self.user, group=self.group, permission=2)
+    
+
+    def test_ids_are_cached_until_collections_change(self):
+        with self.assertNumQueries(1):
+            ids = get_accessible_collection_ids(self.user)
+            self.assertIs(get_accessible_collection_ids(self.user), ids)
+        self.assertEqual(list(ids), [self.collections[0].id])
+        mixer.blend(CollectionGroupLink, group=self.group, collection=self.collections[2], permission=1)
+        self.assertEqual(
+            list(get_accessible_collection_ids(self.user)),
+            sorted([self.collections[0].id, self.collections[2].id])
+        )
+    
+
+    def test_changes_from_other_processes_are_checked_for(self):
+        ids = get_accessible_collection_ids(self.user)
+        EffectivePermission.objects.create(
+            user=self.user, object_type="collection", object_id=self.collections[1].id, level=1
+        )
+        with self.settings(ACCESSIBLE_COLLECTIONS_CHECK_INTERVAL=60):
+            with self.assertNumQueries(0):
+                self.assertIs(get_accessible_collection_ids(self.user), ids)
+        with self.settings(ACCESSIBLE_COLLECTIONS_CHECK_INTERVAL=0):
+            self.assertEqual(list(get_accessible_collection_ids(self.user)), sorted([
+                self.collections[0].id, self.collections[1].id
+            ]))
+            ids = get_accessible_collection_ids(self.user)
+            with self.assertNumQueries(1):
+                self.assertIs(get_accessible_collection_ids(self.user), ids)
+    
+
+    def test_group_membership_invalidates(self):
+        mixer.blend(CollectionGroupLink, group=self.group, collection=self.collections[1], permission=1)
+        self.assertIn(self.collections[1].id, get_accessible_collection_ids(self.user))
+        UserGroupLink.objects.filter(user=self.user).delete()
+        self.assertNotIn(self.collections[1].id, get_accessible_collection_ids(self.user))
+    
+
+    def test_privacy_change_bumps_version(self):
+        version = get_version("collections")
+        self.collections[1].name = "new name"
+        self.collections[1].save()
+        self.assertEqual(get_version("collections"), version)
+        self.collections[1].private = False
+        self.collections[1].save()
+        self.assertNotEqual(get_version("collections"), version)
+    
+
+    def test_readable_filters_use_cached_ids(self):
+        sample = Sample.objects.create(name="s", collection=self.collections[0])
+        get_accessible_collection_ids(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(list(readable_collections(Collection.objects.all(), self.user)), [self.collections[0]])
+        with self.assertNumQueries(1):
+            self.assertEqual(list(readable_samples(Sample.objects.all(), self.user)), [sample])
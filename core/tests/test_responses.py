@@ -0,0 +1,140 @@
+import json
+from unittest.mock import patch
+from mixer.backend.django import mixer
+from graphql import parse
+from django.core.cache import caches
+from django.test import TestCase
+from core.responses import *
+from django.db.models import signals
+from core.models import User, Group, UserGroupLink, EffectivePermission
+from analysis.models import Collection, CollectionGroupLink, CollectionStats
+
+class CacheabilityTests(TestCase):
+
+    def test_public_queries_are_cacheable(self):
+        self.assertTrue(is_cacheable(parse("{ allSpecies { name } }"), None))
+        self.assertTrue(is_cacheable(parse(
+            "query A { me { name } } query B { pipelines { name } }"
+        ), "B"))
+    
+
+    def test_other_queries_are_not_cacheable(self):
+        self.assertFalse(is_cacheable(parse("{ allSpecies { name } me { name } }"), None))
+        self.assertFalse(is_cacheable(parse("{ ...F } fragment F on Query { pipelines { name } }"), None))
+        self.assertFalse(is_cacheable(parse("mutation { logout { success } }"), None))
+        self.assertFalse(is_cacheable(parse("query A { pipelines { name } } query B { me { name } }"), None))
+    
+
+    def test_keys_ignore_formatting_but_not_variables(self):
+        key = get_response_key(parse("{ collection(id: 1) { name } }"), {}, None)
+        self.assertEqual(key, get_response_key(parse("{\n  collection(id: 1) {\n name }}"), None, None))
+        self.assertNotEqual(key, get_response_key(parse("{ collection(id: 1) { name } }"), {"a": 1}, None))
+    
+
+    def test_writes_change_keys(self):
+        key = get_response_key(parse("{ pipelines { name } }"), {}, None)
+        mixer.blend(Collection)
+        self.assertNotEqual(key, get_response_key(parse("{ pipelines { name } }"), {}, None))
+    
+
+    def test_version_is_shared_with_responses(self):
+        key = get_response_key(parse("{ pipelines { name } }"), {}, None)
+        caches["responses"].incr("version:responses")
+        self.assertNotEqual(key, get_response_key(parse("{ pipelines { name } }"), {}, None))
+
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        caches["responses"].clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collection = mixer.blend(Collection, private=False, name="C1")
+        self.query = "{ publicCollections { edges { node { name } } } }"
+    
+
+    def post(self, query, user=None):
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {user.make_jwt(900)}"} if user else {}
+        return self.client.post(
+            "/graphql", json.dumps({"query": query}),
+            content_type="application/json", **headers
+        )
+    
+
+    def names(self, response):
+        return [e["node"]["name"] for e in response.json()["data"]["publicCollections"]["edges"]]
+    
+
+    def test_anonymous_responses_are_cached(self):
+        self.assertEqual(self.names(self.post(self.query)), ["C1"])
+        with patch("core.urls.FileUploadGraphQLView.execute_graphql_request") as mock_execute:
+            self.assertEqual(self.names(self.post(self.query)), ["C1"])
+        self.assertFalse(mock_execute.called)
+    
+
+    def test_writes_invalidate_responses(self):
+        self.post(self.query)
+        self.collection.name = "C2"
+        self.collection.save()
+        self.assertEqual(self.names(self.post(self.query)), ["C2"])
+    
+
+    def test_users_are_not_served_from_cache(self):
+        self.post(self.query)
+        user = mixer.blend(User)
+        with patch("core.urls.get_cached_response") as mock_get:
+            self.assertEqual(self.names(self.post(self.query, user)), ["C1"])
+        self.assertFalse(mock_get.called)
+    
+
+    def test_errors_are_not_cached(self):
+        private = mixer.blend(Collection, private=True)
+        query = "{ collection(id: %s) { name } }" % private.id
+        self.assertIn("errors", self.post(query).json())
+        self.assertFalse([key for key in caches["responses"]._cache if ":response:" in key])
+    
+
+    def test_etags(self):
+        response = self.client.get("/graphql", {"query": self.query})
+        etag = response["ETag"]
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/graphql", {"query": self.query}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.collection.name = "C2"
+        self.collection.save()
+        response = self.client.get("/graphql", {"query": self.query}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", self.client.get("/graphql", {"query": "{ me { name } }"}))
+    
+
+    def test_writes_bump_version_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            group = mixer.blend(Group)
+            for _ in range(5):
+                mixer.blend(UserGroupLink, group=group, user=mixer.blend(User), permission=1)
+        with patch("core.responses.bump_version") as mock_bump:
+            mixer.blend(CollectionGroupLink, collection=self.collection, group=group, permission=2)
+            self.collection.delete()
+        self.assertEqual(mock_bump.call_count, 1)
+    
+
+    def test_private_user_fields_are_not_watched(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = mixer.blend(User)
+        user = User.objects.get(id=user.id)
+        with patch("core.signals.responses_changed") as responses_changed:
+            user.last_login = 1000
+            user.save()
+            self.assertFalse(responses_changed.called)
+            user.name = "New Name"
+            user.save()
+            self.assertEqual(responses_changed.call_count, 1)
+            user.save()
+            self.assertEqual(responses_changed.call_count, 1)
+    
+
+    def test_derived_tables_are_not_watched(self):
+        for model in [EffectivePermission, CollectionStats]:
+            self.assertFalse(signals.post_delete.has_listeners(model))
+            self.assertFalse(signals.post_save.has_listeners(model))
@@ -0,0 +1,179 @@
+import json
+import time
+import threading
+from unittest.mock import patch
+from mixer.backend.django import mixer
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django_nextflow.models import Data
+from core.search import *
+from core.permissions import readable_collections, readable_samples
+from core.models import User, Group, SearchEntry
+from analysis.models import Collection, Sample
+from genomes.models import Species
+
+class SearchEntryTests(TestCase):
+
+    def entry(self, kind, obj):
+        return SearchEntry.objects.get(kind=kind, object_id=obj.id).document
+    
+
+    def test_words(self):
+        self.assertEqual(get_words("CLIP_rep1.fastq.gz - Hénon"), ["clip", "rep1", "fastq", "gz", "hénon"])
+        self.assertEqual(get_words(None), [])
+    
+
+    def test_migration_matches_index(self):
+        from importlib import import_module
+        migration = import_module("core.migrations.0003_search_entries")
+        self.assertEqual(migration.SEARCH_FIELDS, SEARCH_FIELDS)
+        values = ["CLIP_rep1.fastq.gz - Hénon", None, "PTBP1"]
+        self.assertEqual(migration.get_document(values), get_document(values))
+    
+
+    def test_entries_follow_objects(self):
+        collection = mixer.blend(Collection, name="HNRNPC iCLIP", description="In HeLa cells")
+        self.assertEqual(self.entry("collection", collection), "hnrnpc iclip in hela cells")
+        collection.name = "TDP-43 iCLIP"
+        collection.save()
+        self.assertEqual(self.entry("collection", collection), "tdp 43 iclip in hela cells")
+        collection.delete()
+        self.assertFalse(SearchEntry.objects.filter(kind="collection").exists())
+    
+
+    def test_unchanged_objects_are_not_reindexed(self):
+        group = mixer.blend(Group, name="Ule lab")
+        group = Group.objects.get(id=group.id)
+        with self.assertNumQueries(1):
+            group.save()
+    
+
+    def test_related_text_is_indexed(self):
+        species = Species.objects.create(id="Hs", name="Human", latin_name="Homo sapiens")
+        sample = Sample.objects.create(name="Sample 1", species=species)
+        self.assertEqual(self.entry("sample", sample), "sample 1 human homo sapiens")
+        species.name = "Person"
+        species.save()
+        self.assertEqual(self.entry("sample", sample), "sample 1 person homo sapiens")
+    
+
+    def test_rebuilding(self):
+        user = mixer.blend(User, name="Rosalind Franklin")
+        SearchEntry.objects.all().delete()
+        rebuild_search_index()
+        self.assertEqual(self.entry("user", user), "rosalind franklin")
+
+
+
+class SearchQueryTests(TestCase):
+
+    def setUp(self):
+        self.c1 = mixer.blend(Collection, name="PTBP1 iCLIP", description="", private=False)
+        self.c2 = mixer.blend(Collection, name="PTBP1 knockdown", description="iCLIP of PTBP1 in PTBP1 cells", private=False)
+        self.c3 = mixer.blend(Collection, name="HNRNPC", description="", private=False)
+        self.c4 = mixer.blend(Collection, name="PTBP1 private", description="", private=True)
+    
+
+    def test_words_are_matched_as_prefixes(self):
+        ids = Collection.objects.filter(id__in=search_filter("collection", "ptb icl"))
+        self.assertEqual(set(ids), {self.c1, self.c2})
+        self.assertEqual(list(Collection.objects.filter(id__in=search_filter("collection", "..."))), [])
+    
+
+    def test_results_are_ranked(self):
+        ranked = rank_ids(Collection.objects.all(), "collection", "ptbp1", 25)
+        self.assertEqual(ranked[0], self.c2.id)
+        self.assertEqual(set(ranked), {self.c1.id, self.c2.id, self.c4.id})
+        self.assertEqual(rank_ids(Collection.objects.all(), "collection", "-", 25), [])
+    
+
+    def test_hidden_matches_do_not_crowd_out_visible_ones(self):
+        for n in range(5):
+            mixer.blend(Collection, name=f"PTBP1 PTBP1 hidden {n}", description="PTBP1", private=True)
+        public = Collection.objects.filter(private=False)
+        self.assertEqual(rank_ids(public, "collection", "ptbp1", 1), [self.c2.id])
+    
+
+    def test_ranking_querysets(self):
+        public = Collection.objects.filter(private=False)
+        self.assertEqual(rank_queryset(public, "collection", "ptbp1", 25), [self.c2, self.c1])
+        self.assertEqual(rank_queryset(public, "collection", "ptbp1", 1), [self.c2])
+    
+
+    def test_quick_search_uses_index(self):
+        mixer.blend(Data, filename="ptbp1_rep1.bam")
+        response = self.client.post("/graphql", json.dumps({"query": """{ quickSearch(query: "PTBP1") {
+            collections { name } data { filename } groups { name }
+        } }"""}), content_type="application/json")
+        result = response.json()["data"]["quickSearch"]
+        self.assertEqual(result["collections"], [{"name": "PTBP1 knockdown"}, {"name": "PTBP1 iCLIP"}])
+        self.assertEqual(result["groups"], [])
+
+
+
+class ConcurrentLookupTests(TransactionTestCase):
+
+    def test_lookups_run_at_once(self):
+        collection = mixer.blend(Collection, name="PTBP1 iCLIP", private=False)
+        start = time.monotonic()
+        results = run_lookups({
+            "slow": lambda: time.sleep(0.3) or 1,
+            "slower": lambda: time.sleep(0.3) or 2,
+            "collections": lambda: rank_ids(Collection.objects.all(), "collection", "ptbp1", 25),
+        }, 2)
+        self.assertLess(time.monotonic() - start, 0.55)
+        self.assertEqual(results, {"slow": 1, "slower": 2, "collections": [collection.id]})
+    
+
+    def test_workers_keep_their_connections(self):
+        def lookup():
+            Collection.objects.count()
+            return threading.current_thread().name, id(connection.connection)
+        seen = {}
+        for _ in range(5):
+            for name, raw in run_lookups({"a": lookup, "b": lookup}, 2).values():
+                self.assertEqual(seen.setdefault(name, raw), raw)
+    
+
+    def test_slow_lookups_are_left_out(self):
+        results = run_lookups({"fast": lambda: 1, "slow": lambda: time.sleep(0.5) or 2}, 0.2)
+        self.assertEqual(results, {"fast": 1, "slow": None})
+
+
+
+class ConcurrentQuickSearchTests(TransactionTestCase):
+
+    def setUp(self):
+        self.public = mixer.blend(Collection, name="PTBP1 iCLIP", private=False)
+        self.private = mixer.blend(Collection, name="PTBP1 hidden", private=True)
+        Sample.objects.create(name="PTBP1 sample", private=False)
+    
+
+    def quick_search(self):
+        response = self.client.post("/graphql", json.dumps({"query": """{ quickSearch(query: "PTBP1") {
+            collections { name } samples { name }
+        } }"""}), content_type="application/json")
+        return response.json()["data"]["quickSearch"]
+    
+
+    def test_quick_search_runs_on_workers(self):
+        threads = []
+        def readable(*args):
+            threads.append(threading.current_thread().name)
+            return readable_collections(*args)
+        with patch("core.schema.readable_collections", side_effect=readable):
+            result = self.quick_search()
+        self.assertTrue(threads[0].startswith("search"))
+        self.assertEqual(result, {
+            "collections": [{"name": "PTBP1 iCLIP"}], "samples": [{"name": "PTBP1 sample"}]
+        })
+    
+
+    def test_slow_kinds_come_back_empty(self):
+        def slow(*args):
+            time.sleep(0.6)
+            return readable_samples(*args)
+        with self.settings(QUICK_SEARCH_TIMEOUT=0.3):
+            with patch("core.schema.readable_samples", side_effect=slow):
+                result = self.quick_search()
+        self.assertEqual(result, {"collections": [{"name": "PTBP1 iCLIP"}], "samples": []})
@@ -1,15 +1,30 @@
 import json
+import hashlib
 from graphql.error import GraphQLLocatedError, GraphQLError
+from graphql.execution import ExecutionResult
 from graphene_file_upload.django import FileUploadGraphQLView
-from graphene_django.views import GraphQLView
+from graphene_django.views import GraphQLView, HttpError
 import django.conf
+from django.http import HttpResponseBadRequest, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 from django.urls import path, include
 from django.conf.urls.static import static
+from core.cost import get_query_cost
+from core.documents import CachedGraphQLBackend, get_document, get_persisted_query, get_query_hash, get_registered_queries
 from core.data import return_data
+from core.metrics import metrics
+from core.responses import is_cacheable, get_response_key, get_cached_response, cache_response
+
+BACKEND = CachedGraphQLBackend()
 
 class ReadableErrorGraphQLView(FileUploadGraphQLView):
     """A custom GraphQLView which stops Python error messages being sent to
-    the user unless they were explicitly raised."""
+    the user unless they were explicitly raised, which rejects queries that
+    are too deep or too expensive before running them, which supports
+    persisted queries sent as sha256 hashes, which caches the responses to
+    anonymous queries of public data, and which runs batches of operations
+    sent as a JSON array in one request."""
 
     @staticmethod
     def format_error(error):
@@ -19,11 +34,142 @@ class ReadableErrorGraphQLView(FileUploadGraphQLView):
             except: 
                 return GraphQLView.format_error(GraphQLError("Resolver error"))
         return GraphQLView.format_error(error)
+    
+
+    @staticmethod
+    def get_cost_budget(user):
+        budgets = django.conf.settings.QUERY_COST_BUDGETS
+        if not user: return budgets["anonymous"]
+        return budgets["admin"] if user.is_admin else budgets["user"]
+    
+
+    def get_backend(self, request):
+        return BACKEND
+    
+
+    def parse_body(self, request):
+        """Switches to batch mode if the body is a JSON array of operations,
+        which are then run one after another with the same request - and so
+        the same user, permission cache, loaders and cost budget."""
+
+        if self.get_content_type(request) == "application/json":
+            self.batch = request.body.lstrip()[:1] == b"["
+        data = super().parse_body(request)
+        if self.batch and len(data) > django.conf.settings.QUERY_BATCH_SIZE:
+            raise HttpError(HttpResponseBadRequest(
+                f"Batches can have at most {django.conf.settings.QUERY_BATCH_SIZE} operations."
+            ))
+        if self.batch and not all(isinstance(operation, dict) for operation in data):
+            raise HttpError(HttpResponseBadRequest("Batched operations must be JSON objects."))
+        return data
+    
+
+    def dispatch(self, request, *args, **kwargs):
+        """Gives cacheable responses an ETag, and answers GET requests whose
+        If-None-Match header has it with 304 Not Modified."""
+
+        request.response_cache_key, request.query_cost_spent = None, 0
+        response = super().dispatch(request, *args, **kwargs)
+        patch_vary_headers(response, ["Authorization"])
+        if request.response_cache_key and not self.batch and response.status_code == 200:
+            etag = quote_etag(hashlib.sha256(response.content).hexdigest())
+            response["ETag"] = etag
+            if request.method == "GET" and etag in parse_etags(
+                request.META.get("HTTP_IF_NONE_MATCH", "")
+            ):
+                not_modified = HttpResponseNotModified()
+                not_modified["ETag"] = etag
+                patch_vary_headers(not_modified, ["Authorization"])
+                return not_modified
+        return response
+    
+
+    @staticmethod
+    def get_graphql_params(request, data):
+        """Gets the query from its sha256 hash if it was sent as a persisted
+        query, checking that the hash matches the query if both were sent. Any
+        problem is recorded on the request, to be reported when executing."""
+
+        query, variables, operation_name, id = FileUploadGraphQLView.get_graphql_params(request, data)
+        extensions = request.GET.get("extensions") or data.get("extensions") or {}
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError: extensions = {}
+        persisted = extensions.get("persistedQuery") or {}
+        request.query_hash = persisted.get("sha256Hash") or (get_query_hash(query) if query else None)
+        request.query_error = None
+        if persisted and not query:
+            query = get_persisted_query(request.query_hash)
+            if not query: request.query_error = "PersistedQueryNotFound"
+        elif persisted and get_query_hash(query) != request.query_hash:
+            request.query_error = "provided sha does not match query"
+        return query, variables, operation_name, id
+    
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, *args, **kwargs):
+        """Works out the cost of the query before it is executed, and rejects it
+        if it is deeper than allowed or costs more than what is left of the
+        user's budget - the operations of a batch share one budget.
+        Unparseable queries are left for the normal execution to report. In
+        allow-list mode, queries which haven't been registered are rejected.
+        Anonymous queries of public data are answered from the response cache
+        where possible."""
+
+        request.query_cost, request.response_cache_key = None, None
+        if getattr(request, "query_error", None):
+            return ExecutionResult(errors=[GraphQLError(request.query_error)])
+        if query and django.conf.settings.PERSISTED_QUERIES_ONLY and\
+         request.query_hash not in get_registered_queries():
+            return ExecutionResult(errors=[GraphQLError(json.dumps({"query": [
+                "Only registered queries can be run"
+            ]}))], invalid=True)
+        try:
+            document = get_document(self.schema, query, request.query_hash) if query else None
+        except Exception: document = None
+        if document:
+            cost, depth = get_query_cost(self.schema, document.document_ast, variables, operation_name)
+            budget = self.get_cost_budget(getattr(request, "user", None))\
+                - getattr(request, "query_cost_spent", 0)
+            request.query_cost = {"cost": cost, "depth": depth, "budget": budget}
+            if depth > django.conf.settings.QUERY_MAX_DEPTH:
+                return ExecutionResult(errors=[GraphQLError(json.dumps({"query": [
+                    f"Query depth {depth} exceeds the maximum of {django.conf.settings.QUERY_MAX_DEPTH}"
+                ]}))], invalid=True)
+            if cost > budget:
+                return ExecutionResult(errors=[GraphQLError(json.dumps({"query": [
+                    f"Query cost {cost} exceeds the budget of {budget}"
+                ]}))], invalid=True)
+            request.query_cost_spent = getattr(request, "query_cost_spent", 0) + cost
+            if not getattr(request, "user", None) and\
+             is_cacheable(document.document_ast, operation_name):
+                request.response_cache_key = get_response_key(
+                    document.document_ast, variables, operation_name
+                )
+                cached = get_cached_response(request.response_cache_key)
+                if cached is not None: return ExecutionResult(data=cached)
+        result = super().execute_graphql_request(
+            request, data, query, variables, operation_name, *args, **kwargs
+        )
+        if request.response_cache_key:
+            if result and not result.errors and not result.invalid:
+                cache_response(request.response_cache_key, result.data)
+            else: request.response_cache_key = None
+        return result
+    
+
+    def json_encode(self, request, d, *args, **kwargs):
+        """Reports the query's cost in the response's extensions."""
+
+        if getattr(request, "query_cost", None) and isinstance(d, dict):
+            d = {**d, "extensions": {**d.get("extensions", {}), "cost": request.query_cost}}
+        return super().json_encode(request, d, *args, **kwargs)
 
 urlpatterns = [
     path("graphql", ReadableErrorGraphQLView.as_view()),
     path("peka/", include("peka.urls")),
-    path("data/<int:id>/<str:name>", return_data)
+    path("data/<int:id>/<str:name>", return_data),
+    path("metrics", metrics),
 ]
 
 if django.conf.settings.SERVE_FILES:
@@ -0,0 +1,34 @@
+"""Version stamps for data which processes cache in memory. A stamp is a
+counter kept in Django's cache, so every process sharing that cache sees it
+change - anything cached alongside an older stamp is out of date. A stamp can
+be kept in a cache other than the default one, so that it is shared by
+exactly the processes which share what it versions.
+
+If the stamp is ever evicted from the cache it is recreated with a new value
+rather than starting from the beginning again, so that it can never go back to
+a value an old entry was cached with."""
+
+import time
+from django.core.cache import caches
+
+def get_version(name, alias="default"):
+    """Gets the current value of a version stamp."""
+
+    cache = caches[alias]
+    key = f"version:{name}"
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name, alias="default"):
+    """Changes a version stamp, invalidating everything cached against it."""
+
+    cache = caches[alias]
+    key = f"version:{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
@@ -0,0 +1,81 @@
+"""Gene name autocomplete. Each species has tens of thousands of genes, and
+the sample editor looks them up by prefix as the user types, so every process
+keeps the names of every species' genes in memory as a sorted array, and
+finds those starting with a prefix by binary search without touching the
+database.
+
+The arrays are built the first time they are needed, and built again once
+the genes table has changed - when the getgenes command adds or removes
+genes, from whichever process it runs in. That is noticed from the number of
+genes and the highest gene ID, which are read at most once every
+GENE_INDEX_CHECK_INTERVAL seconds, so almost every lookup is answered without
+a query."""
+
+import time
+import threading
+from bisect import bisect_left
+from django.conf import settings
+from django.db.models import Count, Max
+from genomes.models import Gene
+
+class GeneIndex:
+    """The genes of every species, each species' sorted by lower case name."""
+
+    def __init__(self, genes):
+        self.species = {}
+        for id, name, species_id in sorted(genes, key=lambda g: (g[1].lower(), g[1], g[0])):
+            keys, rows = self.species.setdefault(species_id, ([], []))
+            keys.append(name.lower())
+            rows.append((id, name))
+
+
+    def search(self, species_id, prefix, first):
+        """Gets up to first (ID, name) pairs of a species' genes whose names
+        start with a prefix, ignoring case, in alphabetical order."""
+
+        if species_id not in self.species: return []
+        keys, rows = self.species[species_id]
+        prefix = prefix.lower()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and end - start < first and keys[end].startswith(prefix):
+            end += 1
+        return rows[start:end]
+
+
+
+GENE_INDEX = {"version": None, "index": None, "checked": None}
+GENE_INDEX_LOCK = threading.Lock()
+
+def get_genes_version():
+    """Gets a stamp of the genes table's contents, which changes whenever genes
+    are added or removed."""
+
+    stamp = Gene.objects.aggregate(count=Count("id"), last=Max("id"))
+    return (stamp["count"], stamp["last"])
+
+
+def get_gene_index():
+    """Gets the in-memory gene index, building it again if the genes have
+    changed since it was last built. Whether they have is only checked if it
+    hasn't been for GENE_INDEX_CHECK_INTERVAL seconds."""
+
+    with GENE_INDEX_LOCK:
+        now = time.monotonic()
+        checked = GENE_INDEX["checked"]
+        if checked is None or now - checked >= settings.GENE_INDEX_CHECK_INTERVAL:
+            version = get_genes_version()
+            if GENE_INDEX["version"] != version:
+                GENE_INDEX["index"] = GeneIndex(Gene.objects.values_list("id", "name", "species_id"))
+                GENE_INDEX["version"] = version
+            GENE_INDEX["checked"] = now
+        return GENE_INDEX["index"]
+
+
+def search_genes(species_id, prefix, first):
+    """Gets up to first of a species' genes whose names start with a prefix, as
+    unsaved Gene objects made from the index rather than read from the
+    database."""
+
+    return [Gene(id=id, name=name, species_id=species_id)
+        for id, name in get_gene_index().search(species_id, prefix, first)]
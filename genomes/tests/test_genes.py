@@ -0,0 +1,66 @@
+from unittest.mock import Mock
+from django.test import TestCase, override_settings
+from core.schema import schema
+from genomes.genes import *
+from genomes.models import Gene, Species
+
+class GeneIndexTests(TestCase):
+
+    def test_prefix_search(self):
+        index = GeneIndex([(1, "PTBP1", "Hs"), (2, "PTBP2", "Hs"), (3, "Ptbp1", "Mm"), (4, "PTEN", "Hs")])
+        self.assertEqual(index.search("Hs", "ptb", 10), [(1, "PTBP1"), (2, "PTBP2")])
+        self.assertEqual(index.search("Hs", "PT", 2), [(1, "PTBP1"), (2, "PTBP2")])
+        self.assertEqual(index.search("Mm", "PT", 10), [(3, "Ptbp1")])
+        self.assertEqual(index.search("Hs", "ptbp3", 10), [])
+        self.assertEqual(index.search("Dr", "ptb", 10), [])
+        self.assertEqual(index.search("Hs", "", 1), [(1, "PTBP1")])
+
+
+
+class GeneQueryTests(TestCase):
+
+    def setUp(self):
+        self.species = Species.objects.create(id="Hs", name="Human", latin_name="Homo sapiens")
+        self.genes = [Gene.objects.create(name=name, species=self.species)
+            for name in ["TDP1", "PTBP1", "PTBP2", "PTEN"]]
+        GENE_INDEX["checked"] = None
+    
+
+    def query(self, args):
+        result = schema.execute("{ genes(%s) { id name } }" % args,
+            context_value=Mock(spec=["user"], user=None))
+        return result
+    
+
+    def test_genes_query(self):
+        result = self.query('species: "Hs", prefix: "pt", first: 2')
+        self.assertIsNone(result.errors)
+        self.assertEqual(result.data["genes"], [
+            {"id": str(self.genes[1].id), "name": "PTBP1"},
+            {"id": str(self.genes[2].id), "name": "PTBP2"},
+        ])
+        self.assertIn("positive", str(self.query('species: "Hs", prefix: "pt", first: -1').errors[0]))
+        self.assertIn("positive", str(self.query('species: "Hs", prefix: "pt", first: 0').errors[0]))
+    
+
+    def test_hot_path_does_not_use_database(self):
+        search_genes("Hs", "pt", 10)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.query('species: "Hs", prefix: "P"').data["genes"]), 3)
+    
+
+    def test_index_is_rebuilt_when_genes_change(self):
+        self.assertEqual(len(search_genes("Hs", "pt", 10)), 3)
+        gene = Gene.objects.create(name="PTK2", species=self.species)
+        self.assertEqual(len(search_genes("Hs", "pt", 10)), 3)
+        with override_settings(GENE_INDEX_CHECK_INTERVAL=0):
+            self.assertEqual(len(search_genes("Hs", "pt", 10)), 4)
+            Gene.objects.filter(id__in=[gene.id, self.genes[1].id]).delete()
+            self.assertEqual([g.name for g in search_genes("Hs", "pt", 10)], ["PTBP2", "PTEN"])
+    
+
+    def test_unchanged_genes_keep_index(self):
+        index = get_gene_index()
+        with override_settings(GENE_INDEX_CHECK_INTERVAL=0):
+            with self.assertNumQueries(1):
+                self.assertIs(get_gene_index(), index)